@@ -1,6 +1,6 @@
 # agent.py
 import os
-from typing import Annotated, Sequence, TypedDict, List
+from typing import Annotated, Sequence, TypedDict, List, Dict, Any
 from dotenv import load_dotenv
 
 from langchain_core.messages import (
@@ -12,21 +12,28 @@ from langchain_core.messages import (
 )
 from langgraph.graph.message import add_messages
 from langgraph.graph import StateGraph, START, END
-from tools import analyze_image, explain_result, general_chat
-from langchain.memory import ConversationBufferMemory
+from tools import analyze_image, explain_result, general_chat, embeddings, retrieve_context, answer_from_documents
+from router import QueryRouter, CANNED_REPLIES, ROUTE_IMAGE, ROUTE_CLINICAL, ROUTE_CHAT
+from conversation_memory import ConversationMemory, memory_messages
 
 load_dotenv()
 
 
-class AgentState(TypedDict):
+class AgentState(TypedDict, total=False):
     messages: Annotated[Sequence[BaseMessage], add_messages]
-    
-    
-memory = ConversationBufferMemory(
-    memory_key="chat_history", 
-    return_messages=True
-)
+    route: Dict[str, Any]
+    documents: List[Any]
+    retrieval: Dict[str, Any]
+    session_id: str
+    memory: List[Dict[str, Any]]
+    memory_stats: Dict[str, Any]
+
+
+router = QueryRouter(embeddings)
 
+# Long-term memory: past turns embedded per session, only the relevant ones are recalled
+memory = ConversationMemory(embeddings)
+DEFAULT_SESSION = "default"
 
 
 SYSTEM_PROMPT = SystemMessage(content=(
@@ -42,60 +49,140 @@ SYSTEM_PROMPT = SystemMessage(content=(
 ))
 
 
-def process_node(state: AgentState) -> AgentState:
+def _last_human(messages: List[BaseMessage]):
+    for m in reversed(messages):
+        if isinstance(m, HumanMessage):
+            return m
+    return None
+
+
+def route_node(state: AgentState) -> AgentState:
     """
-    Process the incoming state messages. If the latest human message starts with ANALYZE_IMAGE: <path>,
-    run the analyze_image tool, then explain_result, and append ToolMessage + AIMessage to state.
-    Otherwise, call general_chat for free-text replies.
+    Classify the latest human message with the MiniLM router before any
+    retrieval or LLM call is made.
     """
+    last_human = _last_human(list(state["messages"]))
+    return {"route": router.route(last_human.content if last_human else "")}
+
+
+def select_route(state: AgentState) -> str:
+    route = state.get("route", {}).get("route", ROUTE_CHAT)
+    if route in CANNED_REPLIES:
+        return "canned"
+    return "image" if route == ROUTE_IMAGE else "recall"
+
 
+def recall_node(state: AgentState) -> AgentState:
+    """
+    Index any turns not embedded yet, then recall the latest turn plus the
+    earlier turns most relevant to the new message.
+    """
+    messages = list(state["messages"])
+    last_human = _last_human(messages)
+    session_id = state.get("session_id") or DEFAULT_SESSION
+    try:
+        memory.sync(session_id, messages)
+        turns, stats = memory.recall(session_id, last_human.content if last_human else "")
+    except Exception as e:
+        print(f"⚠️ Memory recall failed: {e}")
+        turns, stats = [], {"error": str(e)}
+    return {"memory": turns, "memory_stats": stats}
+
+
+def select_answer(state: AgentState) -> str:
+    return "retrieve" if state.get("route", {}).get("route") == ROUTE_CLINICAL else "chat"
+
+
+def image_node(state: AgentState) -> AgentState:
+    """
+    The latest human message starts with ANALYZE_IMAGE: <path>: run the
+    analyze_image tool, then explain_result, and append ToolMessage + AIMessage to state.
+    """
     messages: List[BaseMessage] = list(state["messages"])
+    last_human = _last_human(messages)
+    try:
+        # parse path
+        _, path = last_human.content.split(":", 1)
+        image_path = path.strip()
 
-    # Find last human message
-    last_human = None
-    for m in reversed(messages):
-        if isinstance(m, HumanMessage):
-            last_human = m
-            break
+        # ✅ Run vision tool with invoke()
+        analysis = analyze_image.invoke(image_path)
 
-    # If there is a special ANALYZE_IMAGE command
-    if last_human and last_human.content.strip().upper().startswith("ANALYZE_IMAGE:"):
-        try:
-            # parse path
-            _, path = last_human.content.split(":", 1)
-            image_path = path.strip()
+        # Append ToolMessage
+        tool_msg = ToolMessage(content=str(analysis), tool_call_id="analyze_image")
+        messages.append(tool_msg)
+
+        # Run explanation tool (DeepSeek) — now expects {"result": analysis}
+        explanation = explain_result.invoke({"result": analysis})
+        messages.append(AIMessage(content=explanation["result"], response_metadata=explanation.get("stats", {})))
+    except Exception as e:
+        messages.append(AIMessage(content=f"Error during image analysis: {e}"))
+    return {"messages": messages}
 
-            # ✅ Run vision tool with invoke()
-            analysis = analyze_image.invoke(image_path)
 
-            # Append ToolMessage
-            tool_msg = ToolMessage(content=str(analysis), tool_call_id="analyze_image")
-            messages.append(tool_msg)
+def canned_node(state: AgentState) -> AgentState:
+    """Greetings and out-of-scope questions get an instant templated reply."""
+    messages: List[BaseMessage] = list(state["messages"])
+    route = state["route"]
+    messages.append(AIMessage(content=CANNED_REPLIES[route["route"]], response_metadata={"route": route}))
+    return {"messages": messages}
 
-            # Run explanation tool (DeepSeek) — now expects {"result": analysis}
-            explanation = explain_result.invoke({"result": analysis})
-            messages.append(AIMessage(content=explanation["result"]))
-            return {"messages": messages}
 
-        except Exception as e:
-            err = f"Error during image analysis: {e}"
-            messages.append(AIMessage(content=err))
-            return {"messages": messages}
+def retrieve_node(state: AgentState) -> AgentState:
+    """Fetch (cached) PDF chunks for a clinical question, compressed to the relevant sentences."""
+    last_human = _last_human(list(state["messages"]))
+    try:
+        docs, stats = retrieve_context(last_human.content)
+    except Exception as e:
+        print(f"⚠️ Retrieval failed: {e}")
+        docs, stats = [], {"error": str(e)}
+    return {"documents": docs, "retrieval": stats}
 
 
-    # ✅ Default fallback: use general_chat for free-text replies
+def rag_node(state: AgentState) -> AgentState:
+    """Clinical questions are answered from the PDF knowledge base with citations."""
+    messages: List[BaseMessage] = list(state["messages"])
+    last_human = _last_human(messages)
     try:
-        reply = general_chat.invoke({"user_text": last_human.content if last_human else ""})
-        messages.append(AIMessage(content=reply["result"]))
+        history = memory_messages(state.get("memory", []))
+        reply = answer_from_documents(last_human.content, state.get("documents", []), history=history)
+        meta = dict(reply.get("stats", {}), route=state["route"], retrieval=state.get("retrieval", {}),
+                    memory=state.get("memory_stats", {}))
+        messages.append(AIMessage(content=reply["result"], response_metadata=meta))
     except Exception as e:
         messages.append(AIMessage(content=f"Error generating reply: {e}"))
+    return {"messages": messages}
+
 
+def chat_node(state: AgentState) -> AgentState:
+    """✅ Default fallback: use general_chat for free-text replies."""
+    messages: List[BaseMessage] = list(state["messages"])
+    last_human = _last_human(messages)
+    try:
+        reply = general_chat.invoke({
+            "user_text": last_human.content if last_human else "",
+            "history": memory_messages(state.get("memory", [])),
+        })
+        meta = dict(reply.get("stats", {}), route=state.get("route", {}), memory=state.get("memory_stats", {}))
+        messages.append(AIMessage(content=reply["result"], response_metadata=meta))
+    except Exception as e:
+        messages.append(AIMessage(content=f"Error generating reply: {e}"))
     return {"messages": messages}
 
 
 # Build and compile the graph
 graph = StateGraph(AgentState)
-graph.add_node("process", process_node)
-graph.add_edge(START, "process")
-graph.add_edge("process", END)
+graph.add_node("route", route_node)
+graph.add_node("image", image_node)
+graph.add_node("canned", canned_node)
+graph.add_node("recall", recall_node)
+graph.add_node("retrieve", retrieve_node)
+graph.add_node("rag", rag_node)
+graph.add_node("chat", chat_node)
+graph.add_edge(START, "route")
+graph.add_conditional_edges("route", select_route, ["image", "canned", "recall"])
+graph.add_conditional_edges("recall", select_answer, ["retrieve", "chat"])
+graph.add_edge("retrieve", "rag")
+for node in ["image", "canned", "rag", "chat"]:
+    graph.add_edge(node, END)
 agent = graph.compile()
@@ -3,15 +3,22 @@ import re
 import base64
 import traceback
 import json
-from datetime import datetime
+import hashlib
+import tempfile
+from datetime import datetime, timezone
 from typing import List, Tuple
-from flask import Flask, request, jsonify
+from flask import Flask, Response, request, jsonify
 from flask_cors import CORS
 from langchain_core.messages import HumanMessage, AIMessage, ToolMessage
 # from langchain_community.embeddings import HuggingFaceEmbeddings
 from supabase import create_client, Client
-from agent import agent
-from tools import analyze_image, explain_result
+from agent import agent, memory
+from tools import analyze_image, explain_result, embeddings, _vectordb, model_registry, explain_cache
+from reasoning import strip_reasoning
+from jobs import JobStore, JobWorkerPool, validate_webhook_url
+from prefork import memory_report, preload_enabled
+from history import ConversationHistory, HistoryUnavailable, DEFAULT_SESSION, HISTORY_PAGE_SIZE, supported_encodings
+from vector_search import get_backend, search_batch, search_params
 # from pypdf import PdfReader
 
 # -----------------------------
@@ -30,56 +37,109 @@ if not SUPABASE_URL or not SUPABASE_KEY:
     raise ValueError("❌ Missing Supabase credentials. Set SUPABASE_URL and SUPABASE_KEY.")
 
 supabase: Client = create_client(SUPABASE_URL, SUPABASE_KEY)
-embedder = HuggingFaceEmbeddings(model_name="sentence-transformers/all-MiniLM-L6-v2")
+# Reuse the MiniLM embedder already loaded by tools.py
+embedder = embeddings
+search_backend = get_backend(supabase, _vectordb)
 
 # -----------------------------
 # 🔹 Conversation Persistence
 # -----------------------------
-def load_conversation():
+# PostgREST: unknown column in a filter (42703) or an insert (PGRST204).
+_MISSING_COLUMN_CODES = {"42703", "PGRST204"}
+
+def _history_error(action: str, e: Exception) -> HistoryUnavailable:
+    hint = " Apply sql/002_conversations_sessions.sql." if getattr(e, "code", None) in _MISSING_COLUMN_CODES else ""
+    return HistoryUnavailable(f"Failed to {action} conversation: {e}.{hint}")
+
+def _now() -> str:
+    return datetime.now(timezone.utc).isoformat()
+
+def _fetch_history_head(session_id: str):
     try:
-        res = supabase.table("conversations").select("messages").order("created_at", desc=True).limit(1).execute()
-        if res.data:
-            raw = res.data[0]["messages"]
-            messages = []
-            for m in raw:
-                t = m.get("type", "")
-                if t == "human":
-                    messages.append(HumanMessage(content=m["content"]))
-                elif t == "ai":
-                    messages.append(AIMessage(content=m["content"]))
-                elif t == "tool":
-                    messages.append(ToolMessage(content=m["content"], tool_call_id=m.get("tool_call_id", "")))
-            return messages
+        res = (supabase.table("conversations").select("created_at")
+               .eq("session_id", session_id).order("created_at", desc=True).limit(1).execute())
     except Exception as e:
-        print(f"⚠️ Failed to load conversation: {e}")
-    return []
+        raise _history_error("load", e) from e
+    return res.data[0]["created_at"] if res.data else None
 
-def save_conversation(messages):
+def _fetch_history_snapshot(session_id: str):
     try:
-        serializable = []
-        for m in messages:
-            if isinstance(m, HumanMessage):
-                serializable.append({"type": "human", "content": m.content})
-            elif isinstance(m, AIMessage):
-                serializable.append({"type": "ai", "content": m.content})
-            elif isinstance(m, ToolMessage):
-                serializable.append({"type": "tool", "content": m.content})
-        supabase.table("conversations").insert({"messages": serializable}).execute()
+        res = (supabase.table("conversations").select("created_at, messages")
+               .eq("session_id", session_id).order("created_at", desc=True).limit(1).execute())
     except Exception as e:
-        print(f"⚠️ Failed to save conversation: {e}")
+        raise _history_error("load", e) from e
+    if not res.data:
+        return None, None, []
+    row = res.data[0]
+    return row["created_at"], row["created_at"], row.get("messages") or []
+
+def _format_history_message(index: int, m: dict, snapshot) -> dict:
+    t = m.get("type", "")
+    content = m.get("content", "")
+    return {
+        "id": index + 1,
+        "type": t,
+        "message": extract_final_response(content) if t == "ai" else content,
+        "isUser": t == "human",
+        # Snapshots saved before per-message timestamps only know when they were written.
+        "timestamp": m.get("timestamp") or snapshot.created_at,
+    }
+
+# Newest snapshot per session + encoded history pages, shared by chat and the history API
+history = ConversationHistory(_fetch_history_head, _fetch_history_snapshot, _format_history_message)
+
+def load_conversation(session_id: str = DEFAULT_SESSION):
+    """
+    Messages of the newest snapshot, for a turn that will save on top of it:
+    the head row is always re-checked, since a snapshot cached here may miss
+    turns saved by another worker. Raises HistoryUnavailable rather than
+    returning [], which the next save would persist as a wiped conversation.
+    """
+    raw = history.snapshot(session_id, fresh=True).messages
+    messages = []
+    for m in raw:
+        t = m.get("type", "")
+        # Each message keeps the time it was first saved across snapshots.
+        kwargs = {"timestamp": m["timestamp"]} if m.get("timestamp") else {}
+        if t == "human":
+            messages.append(HumanMessage(content=m["content"], additional_kwargs=kwargs))
+        elif t == "ai":
+            messages.append(AIMessage(content=m["content"], additional_kwargs=kwargs))
+        elif t == "tool":
+            messages.append(ToolMessage(content=m["content"], tool_call_id=m.get("tool_call_id", ""),
+                                        additional_kwargs=kwargs))
+    return messages
+
+def save_conversation(messages, session_id: str = DEFAULT_SESSION):
+    """Insert a new snapshot; raises HistoryUnavailable if it could not be stored."""
+    now = _now()
+    serializable = []
+    for m in messages:
+        if isinstance(m, HumanMessage):
+            kind = "human"
+        elif isinstance(m, AIMessage):
+            kind = "ai"
+        elif isinstance(m, ToolMessage):
+            kind = "tool"
+        else:
+            continue
+        serializable.append({"type": kind, "content": m.content,
+                             "timestamp": m.additional_kwargs.get("timestamp") or now})
+    try:
+        res = supabase.table("conversations").insert({"session_id": session_id, "messages": serializable}).execute()
+    except Exception as e:
+        raise _history_error("save", e) from e
+    created_at = res.data[0].get("created_at") if res.data else None
+    history.record(session_id, created_at, created_at, serializable)
 
 # -----------------------------
 # 🔹 Clean AI Output
 # -----------------------------
 def extract_final_response(content: str) -> str:
+    """Drop <think> reasoning sections structurally (older saved turns still contain them)."""
     if not content:
         return ""
-    lines = content.splitlines()
-    filtered = [
-        line.strip() for line in lines
-        if not any(x in line.lower() for x in ["thought", "reasoning", "step", "hmm"])
-    ]
-    return "\n".join(filtered).strip() or content.strip()
+    return strip_reasoning(content)
 
 # -----------------------------
 # 🔹 Chat Route
@@ -92,61 +152,183 @@ def chat():
         if not user_message:
             return jsonify({"success": False, "error": "Message cannot be empty."}), 400
 
-        conversation = load_conversation()
-        conversation.append(HumanMessage(content=user_message))
+        session_id = data.get("session_id") or DEFAULT_SESSION
+        conversation = load_conversation(session_id)
+        conversation.append(HumanMessage(content=user_message, additional_kwargs={"timestamp": _now()}))
 
-        result = agent.invoke({"messages": conversation})
+        result = agent.invoke({"messages": conversation, "session_id": session_id})
         conversation = result["messages"]
-        save_conversation(conversation)
 
-        ai_reply = next(
-            (extract_final_response(m.content) for m in reversed(conversation) if isinstance(m, AIMessage)),
-            "⚠️ No response generated."
+        last_ai = next((m for m in reversed(conversation) if isinstance(m, AIMessage)), None)
+        ai_reply = extract_final_response(last_ai.content) if last_ai else "⚠️ No response generated."
+        usage = dict(last_ai.response_metadata) if last_ai else {}
+        reply = {"response": ai_reply, "usage": usage, "timestamp": datetime.now().isoformat()}
+        try:
+            save_conversation(conversation, session_id)
+        except HistoryUnavailable as e:
+            # The answer is still returned, flagged as not saved.
+            print(f"⚠️ {e}")
+            return jsonify(dict(reply, success=False, saved=False, error=str(e))), 503
+        return jsonify(dict(reply, success=True, saved=True))
+    except HistoryUnavailable as e:
+        return jsonify({"success": False, "error": str(e)}), 503
+    except Exception as e:
+        traceback.print_exc()
+        return jsonify({"success": False, "error": str(e)}), 500
+
+# -----------------------------
+# 🔹 Conversation History
+# -----------------------------
+@app.route("/api/conversations/<session_id>/messages", methods=["GET"])
+def conversation_history(session_id):
+    """
+    Query: limit (default HISTORY_PAGE_SIZE), and before=<prev_cursor> to page
+    back or after=<latest_cursor> for turns added since. Responses carry an
+    ETag (If-None-Match -> 304) and are brotli/gzip compressed when accepted.
+    """
+    try:
+        page = history.page(
+            session_id,
+            before=request.args.get("before"),
+            after=request.args.get("after"),
+            limit=int(request.args.get("limit", HISTORY_PAGE_SIZE)),
         )
-        return jsonify({"success": True, "response": ai_reply, "timestamp": datetime.now().isoformat()})
+    except ValueError as e:
+        return jsonify({"success": False, "error": str(e)}), 400
+    except HistoryUnavailable as e:
+        return jsonify({"success": False, "error": str(e)}), 503
     except Exception as e:
         traceback.print_exc()
         return jsonify({"success": False, "error": str(e)}), 500
 
+    encoding = request.accept_encodings.best_match(supported_encodings())
+    body, content_encoding, etag = page.variant(encoding)
+    headers = {"Cache-Control": "private, no-cache", "Vary": "Accept-Encoding"}
+    if request.if_none_match.contains(etag):
+        resp = Response(status=304, headers=headers)
+    else:
+        resp = Response(body, mimetype="application/json", headers=headers)
+        if content_encoding:
+            resp.headers["Content-Encoding"] = content_encoding
+    resp.set_etag(etag)
+    return resp
+
 # -----------------------------
 # 🔹 Image Analysis
 # -----------------------------
+def _decode_image_data(data: dict):
+    image_data = data.get("image")
+    if not image_data or "," not in image_data:
+        return None
+    return base64.b64decode(image_data.split(",")[1])
+
+
+def process_uploaded_image(image_bytes: bytes) -> dict:
+    """Upload, run CLIP + explanation, and record the turn in the conversation."""
+    digest = hashlib.sha256(image_bytes).hexdigest()
+    filename = f"mammogram_{datetime.now().strftime('%Y%m%d_%H%M%S')}_{digest[:8]}.png"
+    remote_path = f"uploads/{filename}"
+
+    supabase.storage.from_("uploads").upload(remote_path, image_bytes)
+    image_url = f"{SUPABASE_URL}/storage/v1/object/public/uploads/{filename}"
+
+    # CLIP reads the decoded bytes locally instead of fetching the upload back
+    with tempfile.NamedTemporaryFile(suffix=".png", delete=False) as tmp:
+        tmp.write(image_bytes)
+    try:
+        analysis = analyze_image.invoke(tmp.name)
+    finally:
+        os.remove(tmp.name)
+    explanation = explain_result.invoke({"result": analysis})
+    ai_response = explanation.get("result", "⚠️ No explanation generated.")
+
+    conversation = load_conversation()
+    conversation.append(HumanMessage(content=f"User uploaded image: {image_url}", additional_kwargs={"timestamp": _now()}))
+    conversation.append(ToolMessage(content=str(analysis), tool_call_id="analyze_image"))
+    conversation.append(AIMessage(content=ai_response))
+    save_conversation(conversation)
+
+    return {
+        "response": extract_final_response(ai_response),
+        "analysis": analysis,
+        "usage": explanation.get("stats", {}),
+        "timestamp": datetime.now().isoformat(),
+        "image_url": image_url
+    }
+
+
 @app.route("/api/analyze-image", methods=["POST"])
 def analyze_image_route():
     try:
-        data = request.json or {}
-        image_data = data.get("image")
-        if not image_data or "," not in image_data:
+        image_bytes = _decode_image_data(request.json or {})
+        if image_bytes is None:
             return jsonify({"success": False, "error": "Invalid image data"}), 400
+        return jsonify(dict(success=True, **process_uploaded_image(image_bytes)))
+    except HistoryUnavailable as e:
+        return jsonify({"success": False, "error": str(e)}), 503
+    except Exception as e:
+        traceback.print_exc()
+        return jsonify({"success": False, "error": f"Image analysis failed: {e}"}), 500
 
-        image_bytes = base64.b64decode(image_data.split(",")[1])
-        filename = f"mammogram_{datetime.now().strftime('%Y%m%d_%H%M%S')}.png"
-        remote_path = f"uploads/{filename}"
+# -----------------------------
+# 🔹 Async Image Analysis Jobs
+# -----------------------------
+job_store = JobStore()
+job_pool = JobWorkerPool(job_store, {
+    "analyze-image": lambda payload, params: process_uploaded_image(payload),
+})
 
-        supabase.storage.from_("uploads").upload(remote_path, image_bytes)
-        image_url = f"{SUPABASE_URL}/storage/v1/object/public/uploads/{filename}"
 
-        command = f"ANALYZE_IMAGE: {image_url}"
-        analysis = analyze_image.invoke(command)
-        explanation = explain_result.invoke({"result": analysis})
-        ai_response = explanation.get("result", "⚠️ No explanation generated.")
+def start_background_workers():
+    job_pool.start()
 
-        conversation = load_conversation()
-        conversation.append(HumanMessage(content=f"User uploaded image: {image_url}"))
-        conversation.append(ToolMessage(content=str(analysis), tool_call_id="analyze_image"))
-        conversation.append(AIMessage(content=ai_response))
-        save_conversation(conversation)
 
-        return jsonify({
-            "success": True,
-            "response": extract_final_response(ai_response),
-            "analysis": analysis,
-            "timestamp": datetime.now().isoformat(),
-            "image_url": image_url
-        })
+# In pre-fork mode the master only loads; each forked worker starts its own pool.
+if not preload_enabled():
+    start_background_workers()
+
+
+@app.route("/api/jobs/analyze-image", methods=["POST"])
+def submit_analyze_image_job():
+    """
+    Queue an image for analysis and return 202 with a job id right away.
+    Retries with the same Idempotency-Key header (default: SHA-256 of the
+    image) return the original job; a failed one is requeued. Optional
+    "webhook_url" (public HTTPS, see jobs.validate_webhook_url) is POSTed the
+    final job when it completes.
+    """
+    try:
+        data = request.json or {}
+        image_bytes = _decode_image_data(data)
+        if image_bytes is None:
+            return jsonify({"success": False, "error": "Invalid image data"}), 400
+
+        webhook_url = data.get("webhook_url")
+        if webhook_url:
+            try:
+                validate_webhook_url(webhook_url)
+            except ValueError as e:
+                return jsonify({"success": False, "error": str(e)}), 400
+
+        key = request.headers.get("Idempotency-Key") or data.get("idempotency_key") \
+            or hashlib.sha256(image_bytes).hexdigest()
+        job = job_store.submit(
+            "analyze-image", image_bytes,
+            idempotency_key=key, webhook_url=webhook_url,
+        )
+        status = 200 if job.get("deduplicated") else 202
+        return jsonify(dict(success=True, poll_url=f"/api/jobs/{job['job_id']}", **job)), status
     except Exception as e:
         traceback.print_exc()
-        return jsonify({"success": False, "error": f"Image analysis failed: {e}"}), 500
+        return jsonify({"success": False, "error": str(e)}), 500
+
+
+@app.route("/api/jobs/<job_id>", methods=["GET"])
+def get_job(job_id):
+    job = job_store.get(job_id)
+    if job is None:
+        return jsonify({"success": False, "error": "Job not found or expired."}), 404
+    return jsonify(dict(success=True, **job))
 
 # -----------------------------
 # 🔹 Embeddings API (Hugging Face + Supabase)
@@ -174,28 +356,77 @@ def embed_text():
 # -----------------------------
 @app.route("/api/search", methods=["POST"])
 def semantic_search():
+    """
+    Body: {"query": str} or {"queries": [str, ...]}, plus optional
+    "filter" (metadata containment, e.g. {"source": "8577.00.pdf"}),
+    "threshold", "limit", "offset" and "ef_search".
+    """
     try:
-        query = request.json.get("query", "")
-        if not query:
+        data = request.json or {}
+        queries = data.get("queries") or ([data["query"]] if data.get("query") else [])
+        queries = [q.strip() for q in queries if isinstance(q, str) and q.strip()]
+        if not queries:
             return jsonify({"success": False, "error": "Query cannot be empty."}), 400
 
-        query_embedding = embedder.embed_query(query)
+        metadata_filter = data.get("filter") or {}
+        if not isinstance(metadata_filter, dict):
+            return jsonify({"success": False, "error": "Filter must be an object."}), 400
+        # Malformed numbers raise ValueError -> 400 before anything is embedded.
+        params = search_params(data)
 
-        res = supabase.rpc("match_embeddings", {
-            "query_embedding": query_embedding,
-            "match_threshold": 0.7,
-            "match_count": 5
-        }).execute()
+        batch = search_batch(search_backend, embedder, queries, metadata_filter=metadata_filter, **params)
 
-        return jsonify({"success": True, "results": res.data})
+        if "queries" in data:
+            return jsonify({"success": True, "backend": search_backend.name, "batch": batch})
+        first = batch[0]
+        return jsonify({
+            "success": True,
+            "backend": search_backend.name,
+            "results": first["results"],
+            "next_offset": first["next_offset"],
+            "timing_ms": first["timing_ms"],
+        })
+    except ValueError as e:
+        return jsonify({"success": False, "error": str(e)}), 400
     except Exception as e:
         traceback.print_exc()
         return jsonify({"success": False, "error": str(e)}), 500
 
+# -----------------------------
+# 🔹 Worker Memory
+# -----------------------------
+@app.route("/api/metrics/memory", methods=["GET"])
+def worker_memory():
+    """RSS / PSS / private (USS) / shared MB of the worker that serves this request."""
+    return jsonify({"success": True, "pid": os.getpid(), "preloaded": preload_enabled(), **memory_report()})
+
+@app.route("/api/metrics/models", methods=["GET"])
+def model_residency():
+    """Which models this worker holds, their size, idle time, load counts and reload latency."""
+    return jsonify({"success": True, "pid": os.getpid(), **model_registry.stats()})
+
+@app.route("/api/metrics/explain-cache", methods=["GET"])
+def explain_cache_stats():
+    """Bucket coverage and hit rate of the explanation cache in this worker."""
+    if explain_cache is None:
+        return jsonify({"success": True, "enabled": False})
+    return jsonify({"success": True, "enabled": True, **explain_cache.stats()})
+
+@app.route("/api/metrics/history", methods=["GET"])
+def history_cache_stats():
+    """Hot-cache occupancy and hit counts of the conversation history API in this worker."""
+    return jsonify({"success": True, "pid": os.getpid(), **history.stats()})
+
+@app.route("/api/metrics/conversation-memory", methods=["GET"])
+def conversation_memory_stats():
+    """Long-term memory index growth (sessions, turns, MB) and recall latency."""
+    return jsonify({"success": True, "pid": os.getpid(), **memory.stats()})
+
 # -----------------------------
 # 🔹 Server Start
 # -----------------------------
 if __name__ == "__main__":
     port = int(os.environ.get("PORT", 7860))
     print(f"🚀 Server running on http://0.0.0.0:{port}")
+    start_background_workers()
     app.run(host="0.0.0.0", port=port)
@@ -1,9 +1,12 @@
 import os
+import io
 import json
-import tempfile
+import time
+import hashlib
+from concurrent.futures import ThreadPoolExecutor
 import streamlit as st
+from PIL import Image
 from langchain_core.messages import HumanMessage, ToolMessage, AIMessage
-from agent import agent
 
 # ---------------------------
 # Config
@@ -12,6 +15,48 @@ st.set_page_config(page_title="INVADUCTAR GPT", layout="centered")
 st.title("🩺 INVADUCTAR GPT")
 
 DATA_FILE = "conversation.json"
+MEMORY_SESSION = "streamlit"  # long-term memory session of conversation.json
+HISTORY_WINDOW = 20  # messages rendered by default; older ones on demand
+ANALYSIS_CACHE_SIZE = int(os.getenv("ANALYSIS_CACHE_SIZE", "256"))  # CLIP results kept per process
+
+STEP_LABELS = {
+    "route": "🧭 Routing question",
+    "recall": "🧠 Recalling relevant earlier turns",
+    "canned": "⚡ Instant reply",
+    "retrieve": "📚 Searching knowledge base",
+    "rag": "✍️ Writing cited answer",
+    "chat": "💬 Generating reply",
+    "image": "🖼️ Analyzing image",
+    "analyze": "🖼️ Running CLIP analysis",
+    "analyze_cached": "🖼️ Reusing analysis of identical image",
+    "explain": "✍️ Writing explanation",
+}
+
+# ---------------------------
+# Cached resources (loaded once per process, shared by all sessions)
+# ---------------------------
+@st.cache_resource(show_spinner="Loading models…")
+def get_agent():
+    from agent import agent
+    return agent
+
+
+@st.cache_resource(show_spinner="Loading models…")
+def get_tools():
+    import tools
+    return tools
+
+
+@st.cache_resource
+def get_executor():
+    return ThreadPoolExecutor(max_workers=2, thread_name_prefix="agent")
+
+
+@st.cache_resource
+def get_analysis_cache():
+    """CLIP results keyed by upload SHA-256 (least recently used evicted first)."""
+    from retrieval import LRUCache
+    return LRUCache(maxsize=ANALYSIS_CACHE_SIZE, ttl=0)
 
 # ---------------------------
 # Helpers
@@ -36,25 +81,132 @@ def load_conversation():
             st.warning(f"Could not load saved conversation: {e}")
     return []
 
+def _serialize(m):
+    if isinstance(m, HumanMessage):
+        return {"type": "human", "content": m.content}
+    elif isinstance(m, AIMessage):
+        return {"type": "ai", "content": m.content}
+    elif isinstance(m, ToolMessage):
+        return {"type": "tool", "content": m.content, "tool_call_id": getattr(m, "tool_call_id", "")}
+    return {"type": "unknown", "content": str(m)}
+
 def save_conversation(messages):
-    serializable = []
-    for m in messages:
-        if isinstance(m, HumanMessage):
-            serializable.append({"type": "human", "content": m.content})
-        elif isinstance(m, AIMessage):
-            serializable.append({"type": "ai", "content": m.content})
-        elif isinstance(m, ToolMessage):
-            serializable.append({"type": "tool", "content": m.content, "tool_call_id": getattr(m, "tool_call_id", "")})
-        else:
-            serializable.append({"type": "unknown", "content": str(m)})
     with open(DATA_FILE, "w", encoding="utf-8") as f:
-        json.dump(serializable, f, indent=2)
+        json.dump([_serialize(m) for m in messages], f, indent=2)
+
+def append_messages(messages):
+    """
+    Persist only new messages: splice them in before the closing bracket of
+    the JSON array instead of rewriting the whole file.
+    """
+    if not messages:
+        return
+    if not os.path.exists(DATA_FILE) or os.path.getsize(DATA_FILE) == 0:
+        save_conversation(messages)
+        return
+    body = ",\n".join(
+        "  " + json.dumps(_serialize(m), indent=2).replace("\n", "\n  ") for m in messages
+    )
+    with open(DATA_FILE, "r+b") as f:
+        f.seek(0, os.SEEK_END)
+        size = f.tell()
+        f.seek(max(0, size - 64))
+        tail = f.read()
+        close = tail.rstrip().rfind(b"]")
+        if close == -1:
+            f.close()
+            save_conversation(load_conversation() + list(messages))
+            return
+        before = tail[:close].rstrip()
+        sep = "\n" if before.endswith(b"[") else ",\n"
+        f.seek(size - len(tail) + close)
+        f.truncate()
+        f.write(f"{sep}{body}\n]".encode("utf-8"))
 
 def clear_conversation():
     st.session_state["conversation"] = []
+    st.session_state.pop("job", None)
     if os.path.exists(DATA_FILE):
         os.remove(DATA_FILE)
 
+def render_message(m):
+    if isinstance(m, HumanMessage):
+        st.chat_message("user").write(m.content)
+    elif isinstance(m, ToolMessage):
+        st.chat_message("assistant").write(f"🔧 Tool [{m.tool_call_id}]: {m.content}")
+    elif isinstance(m, AIMessage):
+        st.chat_message("assistant").write(m.content)
+    else:
+        st.chat_message("assistant").write(str(m))
+
+# ---------------------------
+# Background work
+# ---------------------------
+def run_agent_job(job, agent, messages):
+    """Stream the graph node by node so the UI can show progress."""
+    final = list(messages)
+    for update in agent.stream({"messages": messages, "session_id": MEMORY_SESSION}, stream_mode="updates"):
+        for node, values in update.items():
+            job["steps"].append(node)
+            if values and values.get("messages"):
+                final = list(values["messages"])
+    return final[len(messages):]
+
+def run_image_job(job, tools, cache, image_bytes, digest):
+    """Analyze an upload from memory; identical images reuse the cached CLIP result."""
+    analysis = cache.get(digest)
+    if analysis is not None:
+        job["steps"].append("analyze_cached")
+    else:
+        job["steps"].append("analyze")
+        analysis = tools.analyze_pil_image(Image.open(io.BytesIO(image_bytes)).convert("RGB"))
+        cache.put(digest, analysis)
+    job["steps"].append("explain")
+    explanation = tools.explain_result.invoke({"result": analysis})
+    return [
+        ToolMessage(content=str(analysis), tool_call_id="analyze_image"),
+        AIMessage(content=explanation["result"]),
+    ]
+
+def start_job(human: HumanMessage, fn, *args):
+    """Record the user turn, then run fn in the background (fast mode) or inline."""
+    st.session_state["conversation"].append(human)
+    append_messages([human])
+    job = {"steps": [], "start": time.time()}
+    if st.session_state.get("fast_mode", True):
+        job["future"] = get_executor().submit(fn, job, *args)
+        st.session_state["job"] = job
+    else:
+        with st.spinner("Thinking…"):
+            try:
+                finish_messages(fn(job, *args))
+            except Exception as e:
+                st.session_state["job_error"] = f"⚠️ Agent error: {e}"
+    st.rerun()
+
+def finish_messages(new_messages):
+    st.session_state["conversation"].extend(new_messages)
+    append_messages(new_messages)
+
+def poll_job():
+    job = st.session_state.get("job")
+    if not job:
+        return
+    if job["future"].done():
+        st.session_state.pop("job", None)
+        try:
+            finish_messages(job["future"].result())
+        except Exception as e:
+            st.session_state["job_error"] = f"⚠️ Agent error: {e}"
+        st.rerun()
+    with st.status(f"Working… {time.time() - job['start']:.0f}s", expanded=True):
+        for step in job["steps"]:
+            st.write(STEP_LABELS.get(step, step))
+
+# Poll inside a fragment so only the status box reruns while the job is pending.
+if hasattr(st, "fragment"):
+    poll_job = st.fragment(run_every=0.5)(poll_job)
+
 # ---------------------------
 # State initialization
 # ---------------------------
@@ -69,7 +221,10 @@ st.markdown(
     "and a human-friendly explanation."
 )
 
+st.sidebar.toggle("⚡ Fast mode (background analysis)", value=True, key="fast_mode")
+
 uploaded = st.file_uploader("Upload a medical image (jpg, png)", type=["jpg", "jpeg", "png"])
+busy = "job" in st.session_state
 
 col1, col2 = st.columns([1, 3])
 
@@ -81,7 +236,7 @@ with col1:
         st.warning("Please upload a demo image file (not provided).")
 
     # --- Clear Conversation Button ---
-    if st.button("Clear Conversation"):
+    if st.button("Clear Conversation", disabled=busy):
         clear_conversation()
         st.success("✅ Conversation cleared successfully!")  # Toast message
         st.rerun()
@@ -89,49 +244,39 @@ with col1:
 
 with col2:
     st.subheader("Conversation")
-    for m in st.session_state["conversation"]:
-        if isinstance(m, HumanMessage):
-            st.chat_message("user").write(m.content)
-        elif isinstance(m, ToolMessage):
-            st.chat_message("assistant").write(f"🔧 Tool [{m.tool_call_id}]: {m.content}")
-        elif isinstance(m, AIMessage):
-            st.chat_message("assistant").write(m.content)
-        else:
-            st.chat_message("assistant").write(str(m))
+    conversation = st.session_state["conversation"]
+    older, recent = conversation[:-HISTORY_WINDOW], conversation[-HISTORY_WINDOW:]
+    if older and st.toggle(f"Show {len(older)} earlier messages", key="show_older"):
+        for m in older:
+            render_message(m)
+    for m in recent:
+        render_message(m)
+    if "job_error" in st.session_state:
+        st.error(st.session_state.pop("job_error"))
+    poll_job()
 
 # ---------------------------
 # Handle Image Analysis
 # ---------------------------
 if uploaded:
-    with tempfile.NamedTemporaryFile(delete=False, suffix=".png") as tmp:
-        tmp.write(uploaded.getvalue())
-        tmp_path = tmp.name
-
-    if st.button("Analyze Image"):
-        cmd = f"ANALYZE_IMAGE: {tmp_path}"
-        st.session_state["conversation"].append(HumanMessage(content=cmd))
-        try:
-            result = agent.invoke({"messages": st.session_state["conversation"]})
-            st.session_state["conversation"] = result["messages"]
-            # --- Save conversation persistently ---
-            save_conversation(st.session_state["conversation"])
-            st.success("✅ Conversation saved!")  # Toast message
-            st.rerun()
-        except Exception as e:
-            st.error(f"⚠️ Agent error: {e}")
+    if st.button("Analyze Image", disabled=busy):
+        image_bytes = uploaded.getvalue()
+        digest = hashlib.sha256(image_bytes).hexdigest()
+        cmd = f"ANALYZE_IMAGE: {uploaded.name} (sha256:{digest[:12]})"
+        start_job(HumanMessage(content=cmd), run_image_job, get_tools(), get_analysis_cache(), image_bytes, digest)
 
 # ---------------------------
 # General Chat
 # ---------------------------
-if user_text := st.chat_input("Ask a question (general):"):
-    st.session_state["conversation"].append(HumanMessage(content=user_text.strip()))
-    try:
-        result = agent.invoke({"messages": st.session_state["conversation"]})
-        st.session_state["conversation"] = result["messages"]
-        save_conversation(st.session_state["conversation"])
-        st.rerun()
-    except Exception as e:
-        st.error(f"⚠️ Agent error: {e}")
+if user_text := st.chat_input("Ask a question (general):", disabled=busy):
+    conversation = st.session_state["conversation"]
+    human = HumanMessage(content=user_text.strip())
+    start_job(human, run_agent_job, get_agent(), conversation + [human])
+
+# Without fragments, fall back to a slow full-page poll.
+if busy and not hasattr(st, "fragment"):
+    time.sleep(0.5)
+    st.rerun()
 
 # ---------------------------
 # Footer
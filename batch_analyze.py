@@ -0,0 +1,404 @@
+#!/usr/bin/env python3
+"""
+Offline bulk image analysis.
+
+    python batch_analyze.py scans/ -o results.csv --processes 4 --batch-size 32
+    python batch_analyze.py manifest.txt -o results.parquet --explain
+
+Input is a directory (walked recursively) or a manifest: a .txt file with one
+path per line or a .csv file with a `path` column. Results are streamed to
+CSV or Parquet as batches finish. Completed paths are kept in
+<output>.checkpoint, so an interrupted run picks up where it stopped.
+
+A path is checkpointed only once its row is durable in the output (CSV rows
+are fsynced, Parquet parts are renamed into place when closed). On resume
+the paths already present in the output are treated as done as well, so a
+crash between the two writes neither loses nor repeats a row.
+"""
+import os
+import sys
+import io
+import csv
+import time
+import argparse
+import glob
+import multiprocessing
+from concurrent.futures import Future, ProcessPoolExecutor, ThreadPoolExecutor, FIRST_COMPLETED, wait
+from typing import Any, Dict, Iterator, List, Optional, Set, Tuple
+
+import numpy as np
+
+from vision import IMAGE_LABELS
+
+IMAGE_EXTENSIONS = {".jpg", ".jpeg", ".png", ".tiff", ".tif", ".bmp"}
+COLUMNS = ["path", "prediction", "confidence"] + [f"score_{label}" for label in IMAGE_LABELS] + ["error", "explanation"]
+
+
+# -----------------------------
+# 🔹 Inputs / Checkpoint
+# -----------------------------
+def iter_inputs(source: str) -> Iterator[str]:
+    """Yield image paths from a directory or a .txt/.csv manifest."""
+    if os.path.isdir(source):
+        for root, _, files in os.walk(source):
+            for name in sorted(files):
+                if os.path.splitext(name)[1].lower() in IMAGE_EXTENSIONS:
+                    yield os.path.join(root, name)
+    elif source.lower().endswith(".csv"):
+        with open(source, newline="", encoding="utf-8") as f:
+            for row in csv.DictReader(f):
+                if row.get("path"):
+                    yield row["path"].strip()
+    else:
+        with open(source, encoding="utf-8") as f:
+            for line in f:
+                if line.strip() and not line.startswith("#"):
+                    yield line.strip()
+
+
+def load_checkpoint(path: str) -> Set[str]:
+    if not os.path.exists(path):
+        return set()
+    with open(path, encoding="utf-8") as f:
+        return {line.rstrip("\n") for line in f if line.strip()}
+
+
+def append_checkpoint(f, paths: List[str]):
+    """Record paths whose rows are already durable in the output."""
+    if not paths:
+        return
+    f.write("".join(p + "\n" for p in paths))
+    f.flush()
+    os.fsync(f.fileno())
+
+
+# -----------------------------
+# 🔹 Worker Process
+# -----------------------------
+_classifier = None
+_processor = None
+_decoder: Optional[ThreadPoolExecutor] = None
+# (paths, decode futures) of the batch this process expects next.
+_prefetched: Optional[Tuple[List[str], List[Future]]] = None
+
+
+def _init_worker(torch_threads: int, prefetch: int):
+    """Runs once per process: load CLIP and start the decode threads."""
+    global _classifier, _processor, _decoder
+    from topology import configure_process, configure_torch
+    configure_process(threads=torch_threads, override=True)
+    import torch
+    from vision import load_clip, ClipClassifier
+
+    configure_torch(torch, torch_threads)
+    model, processor, device = load_clip()
+    _classifier = ClipClassifier(model, processor, device)
+    _processor = processor
+    _decoder = ThreadPoolExecutor(max_workers=prefetch)
+
+
+def _decode(path: str):
+    from vision import preprocess_image
+    try:
+        return preprocess_image(_processor, path), None
+    except Exception as e:
+        return None, f"Unable to open image: {e}"
+
+
+def _submit_decode(paths: List[str]) -> List[Future]:
+    return [_decoder.submit(_decode, p) for p in paths]
+
+
+def _run_batch(paths: List[str], upcoming: Optional[List[str]] = None) -> List[Dict[str, Any]]:
+    """
+    Classify a batch in one forward pass. The decode threads start on
+    `upcoming` before the forward pass, so the next batch is ready when
+    this one returns.
+    """
+    global _prefetched
+    if _prefetched is not None and _prefetched[0] == paths:
+        futures = _prefetched[1]
+    else:
+        # The prefetched batch went to another process: drop it, decode this one now.
+        if _prefetched is not None:
+            for f in _prefetched[1]:
+                f.cancel()
+        futures = _submit_decode(paths)
+    decoded = [f.result() for f in futures]
+    _prefetched = (upcoming, _submit_decode(upcoming)) if upcoming else None
+    ok = [i for i, (pixels, _) in enumerate(decoded) if pixels is not None]
+    results: List[Dict[str, Any]] = [{"path": p} for p in paths]
+    if ok:
+        analyses = _classifier.classify(np.stack([decoded[i][0] for i in ok]))
+        for i, analysis in zip(ok, analyses):
+            results[i]["analysis"] = analysis
+    for i, (_, error) in enumerate(decoded):
+        if error:
+            results[i]["analysis"] = {"error": error}
+    return results
+
+
+# -----------------------------
+# 🔹 Output
+# -----------------------------
+def to_row(result: Dict[str, Any]) -> Dict[str, Any]:
+    analysis = result.get("analysis", {})
+    row = {c: "" for c in COLUMNS}
+    row["path"] = result["path"]
+    row["error"] = analysis.get("error") or result.get("explanation_error", "")
+    row["explanation"] = result.get("explanation", "")
+    if "prediction" in analysis:
+        row["prediction"] = analysis["prediction"]
+        row["confidence"] = round(analysis["confidence"], 6)
+        for label, score in analysis["scores"].items():
+            row[f"score_{label}"] = round(score, 6)
+    return row
+
+
+class CsvSink:
+    """
+    write() and close() return the paths whose rows are now durable, which
+    for CSV is every row as soon as it is written.
+    """
+
+    def __init__(self, path: str, append: bool = True):
+        if append:
+            self._trim_partial_row(path)
+        new = not append or not os.path.exists(path) or os.path.getsize(path) == 0
+        self.f = open(path, "a" if append else "w", newline="", encoding="utf-8")
+        self.writer = csv.DictWriter(self.f, fieldnames=COLUMNS)
+        if new:
+            self.writer.writeheader()
+
+    @staticmethod
+    def _trim_partial_row(path: str):
+        """Cut a row left half-written by a crash, so appended rows start on a fresh line."""
+        if not os.path.exists(path) or os.path.getsize(path) == 0:
+            return
+        with open(path, "rb+") as f:
+            data = f.read()
+            if not data.endswith(b"\n"):
+                f.truncate(data.rfind(b"\n") + 1)
+
+    @staticmethod
+    def committed_paths(path: str) -> Set[str]:
+        """Paths of the complete rows already in the file."""
+        if not os.path.exists(path):
+            return set()
+        with open(path, "rb") as f:
+            data = f.read()
+        text = data[:data.rfind(b"\n") + 1].decode("utf-8")
+        return {row["path"] for row in csv.DictReader(io.StringIO(text, newline="")) if row.get("path")}
+
+    def write(self, rows: List[Dict[str, Any]]) -> List[str]:
+        self.writer.writerows(rows)
+        self.f.flush()
+        os.fsync(self.f.fileno())
+        return [r["path"] for r in rows]
+
+    def close(self) -> List[str]:
+        self.f.close()
+        return []
+
+
+class ParquetSink:
+    """
+    Part files in the output directory, one row group per batch. A part is
+    written as .tmp and renamed into place once closed (Parquet is unreadable
+    until its footer is written), so its paths are committed only then. A new
+    part starts every `part_rows` rows.
+    """
+
+    def __init__(self, path: str, part_rows: int = 10000):
+        try:
+            import pyarrow as pa
+            import pyarrow.parquet as pq
+        except ImportError as e:
+            raise RuntimeError("❌ Parquet output needs pyarrow: pip install pyarrow") from e
+        self.pa, self.pq = pa, pq
+        self.dir = path
+        self.part_rows = part_rows
+        os.makedirs(path, exist_ok=True)
+        # Parts a crashed run never closed: their paths were not checkpointed.
+        for stale in glob.glob(os.path.join(path, "part-*.parquet.tmp")):
+            os.remove(stale)
+        self.schema = pa.schema(
+            [("path", pa.string()), ("prediction", pa.string()), ("confidence", pa.float64())]
+            + [(f"score_{label}", pa.float64()) for label in IMAGE_LABELS]
+            + [("error", pa.string()), ("explanation", pa.string())]
+        )
+        self.run_id = time.strftime("%Y%m%d_%H%M%S")
+        self.parts = 0
+        self.writer = None
+        self.part = ""
+        self.pending: List[str] = []
+
+    @staticmethod
+    def committed_paths(path: str) -> Set[str]:
+        done: Set[str] = set()
+        if not os.path.isdir(path):
+            return done
+        import pyarrow.parquet as pq
+        for part in glob.glob(os.path.join(path, "part-*.parquet")):
+            done.update(p for p in pq.read_table(part, columns=["path"]).column("path").to_pylist() if p)
+        return done
+
+    @staticmethod
+    def reset(path: str):
+        """--no-resume: old parts would otherwise be read back together with the new ones."""
+        for old in glob.glob(os.path.join(path, "part-*.parquet*")):
+            os.remove(old)
+
+    def _roll(self) -> List[str]:
+        if self.writer is None:
+            return []
+        self.writer.close()
+        os.replace(self.part + ".tmp", self.part)
+        self.writer = None
+        committed, self.pending = self.pending, []
+        return committed
+
+    def write(self, rows: List[Dict[str, Any]]) -> List[str]:
+        if self.writer is None:
+            self.parts += 1
+            self.part = os.path.join(self.dir, f"part-{self.run_id}-{self.parts:04d}.parquet")
+            self.writer = self.pq.ParquetWriter(self.part + ".tmp", self.schema)
+        columns = {
+            name: [(r[name] if r[name] != "" else None) for r in rows]
+            for name in self.schema.names
+        }
+        self.writer.write_table(self.pa.table(columns, schema=self.schema))
+        self.pending.extend(r["path"] for r in rows)
+        return self._roll() if len(self.pending) >= self.part_rows else []
+
+    def close(self) -> List[str]:
+        return self._roll()
+
+
+# -----------------------------
+# 🔹 Driver
+# -----------------------------
+def explain_results(explain, explainer: ThreadPoolExecutor, results: List[Dict[str, Any]]):
+    """
+    Add an LLM explanation to each classified result. A failed call is
+    recorded on its own row (error column) instead of aborting the run.
+    """
+    def one(result: Dict[str, Any]):
+        try:
+            result["explanation"] = explain.invoke({"result": result["analysis"]})["result"]
+        except Exception as e:
+            result["explanation_error"] = f"Explanation failed: {e}"
+
+    list(explainer.map(one, [r for r in results if "prediction" in r["analysis"]]))
+
+
+def completed_paths(output: str, checkpoint_path: str) -> Set[str]:
+    """Paths a previous run finished: checkpointed, or already durable in the output."""
+    sink_cls = ParquetSink if output.lower().endswith(".parquet") else CsvSink
+    return load_checkpoint(checkpoint_path) | sink_cls.committed_paths(output)
+
+
+def run(args) -> Dict[str, float]:
+    from tqdm import tqdm
+
+    checkpoint_path = args.output.rstrip("/\\") + ".checkpoint"
+    parquet = args.output.lower().endswith(".parquet")
+    if args.resume:
+        done = completed_paths(args.output, checkpoint_path)
+    else:
+        done = set()
+        if parquet:
+            ParquetSink.reset(args.output)
+    paths = [p for p in iter_inputs(args.input) if p not in done]
+    if not paths:
+        print("✅ Nothing to do (all inputs already processed).")
+        return {"images": 0, "seconds": 0.0, "images_per_sec": 0.0}
+
+    explain = None
+    explainer: Optional[ThreadPoolExecutor] = None
+    if args.explain:
+        # Loads the full tool stack (LLM client) in the driver process only.
+        from tools import explain_result
+        explain = explain_result
+        explainer = ThreadPoolExecutor(max_workers=args.explain_concurrency)
+
+    sink = ParquetSink(args.output, args.part_rows) if parquet else CsvSink(args.output, args.resume)
+    checkpoint = open(checkpoint_path, "a" if args.resume else "w", encoding="utf-8")
+    torch_threads = args.threads or max(1, (os.cpu_count() or 1) // args.processes)
+    batches = [paths[i:i + args.batch_size] for i in range(0, len(paths), args.batch_size)]
+    # One lane of batches per process: each task names the lane's next batch,
+    # so the process that runs it decodes that batch during its forward pass.
+    lanes = [batches[j::args.processes] for j in range(args.processes)]
+
+    print(f"🔍 {len(paths)} images ({len(done)} already done), {len(batches)} batches, "
+          f"{args.processes} processes × {torch_threads} torch threads, {args.prefetch} decode threads each")
+
+    start = time.perf_counter()
+    processed = 0
+    progress = tqdm(total=len(paths), unit="img")
+    try:
+        with ProcessPoolExecutor(
+            max_workers=args.processes,
+            # spawn: workers must not inherit CUDA/torch state from the driver
+            mp_context=multiprocessing.get_context("spawn"),
+            initializer=_init_worker,
+            initargs=(torch_threads, args.prefetch),
+        ) as pool:
+            # One task in flight per process: the next task of a lane goes to the
+            # process that just finished its previous one, which has prefetched it.
+            lane_of: Dict[Future, Tuple[int, int]] = {}
+
+            def submit(lane: int, k: int):
+                if k < len(lanes[lane]):
+                    upcoming = lanes[lane][k + 1] if k + 1 < len(lanes[lane]) else None
+                    lane_of[pool.submit(_run_batch, lanes[lane][k], upcoming)] = (lane, k)
+
+            for lane in range(len(lanes)):
+                submit(lane, 0)
+            while lane_of:
+                finished, _ = wait(lane_of, return_when=FIRST_COMPLETED)
+                for fut in finished:
+                    lane, k = lane_of.pop(fut)
+                    results = fut.result()
+                    submit(lane, k + 1)
+                    if explain:
+                        explain_results(explain, explainer, results)
+                    append_checkpoint(checkpoint, sink.write([to_row(r) for r in results]))
+                    processed += len(results)
+                    progress.update(len(results))
+                    progress.set_postfix(img_s=f"{processed / (time.perf_counter() - start):.1f}")
+    finally:
+        progress.close()
+        append_checkpoint(checkpoint, sink.close())
+        checkpoint.close()
+        if explainer:
+            explainer.shutdown()
+
+    elapsed = time.perf_counter() - start
+    rate = processed / elapsed if elapsed else 0.0
+    print(f"🎉 Analyzed {processed} images in {elapsed:.1f}s — {rate:.2f} images/sec → {args.output}")
+    return {"images": processed, "seconds": elapsed, "images_per_sec": rate}
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="Bulk CLIP analysis of image folders or manifests.")
+    parser.add_argument("input", help="Directory of images, or a .txt/.csv manifest")
+    parser.add_argument("-o", "--output", default="results.csv", help="Output .csv file or .parquet directory")
+    parser.add_argument("--processes", type=int, default=1, help="Inference processes (each loads CLIP once)")
+    parser.add_argument("--threads", type=int, default=0, help="Torch threads per process (default: cores / processes)")
+    parser.add_argument("--prefetch", type=int, default=4, help="Decode/preprocess threads per process")
+    parser.add_argument("--batch-size", type=int, default=32)
+    parser.add_argument("--part-rows", type=int, default=10000, help="Rows per Parquet part file")
+    parser.add_argument("--explain", action="store_true", help="Also generate an LLM explanation per image")
+    parser.add_argument("--explain-concurrency", type=int, default=4)
+    parser.add_argument("--no-resume", dest="resume", action="store_false", help="Start over instead of resuming from the checkpoint")
+    args = parser.parse_args(argv)
+
+    if not os.path.exists(args.input):
+        print(f"Error: {args.input} not found.", file=sys.stderr)
+        sys.exit(1)
+    run(args)
+
+
+if __name__ == "__main__":
+    main()
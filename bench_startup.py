@@ -0,0 +1,149 @@
+#!/usr/bin/env python3
+"""
+Cold-start benchmark: time from container (or process) start to the first
+served request.
+
+    python bench_startup.py --image invaductar --env-file .env --runs 3
+    python bench_startup.py --cmd "python api_server.py" --port 7860
+
+Two milestones are recorded per run:
+
+* ready  - the first response to GET --ready-path (the server is listening)
+* first  - the first 2xx from the probe request (--path / --json), which
+           defaults to a /api/search query: MiniLM embeds it and the
+           configured search backend (VECTOR_SEARCH_BACKEND, Supabase by
+           default) answers it, so a cold Supabase connection is included
+
+Each run starts from a fresh container (`docker run`) or process, so every
+run is a cold start.
+"""
+import sys
+import json
+import time
+import shlex
+import argparse
+import statistics
+import subprocess
+import urllib.error
+import urllib.request
+from typing import Dict, Optional
+
+DEFAULT_PROBE = {"query": "What are the symptoms of invasive ductal carcinoma?", "limit": 1}
+
+
+def _request(url: str, body: Optional[dict], timeout: float) -> int:
+    data = json.dumps(body).encode("utf-8") if body is not None else None
+    req = urllib.request.Request(url, data=data, headers={"Content-Type": "application/json"},
+                                 method="POST" if data is not None else "GET")
+    try:
+        with urllib.request.urlopen(req, timeout=timeout) as resp:
+            return resp.status
+    except urllib.error.HTTPError as e:
+        return e.code
+
+
+def wait_for(url: str, body: Optional[dict], deadline: float, ok_only: bool, interval: float = 0.1) -> Optional[float]:
+    """Poll until the server answers (any status, or 2xx with ok_only); returns the time or None."""
+    while time.perf_counter() < deadline:
+        try:
+            status = _request(url, body, timeout=max(1.0, deadline - time.perf_counter()))
+            if not ok_only or 200 <= status < 300:
+                return time.perf_counter()
+        except (urllib.error.URLError, ConnectionError, OSError):
+            pass
+        time.sleep(interval)
+    return None
+
+
+def start_target(args) -> subprocess.Popen:
+    if args.image:
+        cmd = ["docker", "run", "--rm", "-p", f"{args.port}:{args.container_port}", "--name", args.name]
+        if args.env_file:
+            cmd += ["--env-file", args.env_file]
+        for item in args.env or []:
+            cmd += ["-e", item]
+        cmd.append(args.image)
+    else:
+        cmd = shlex.split(args.cmd)
+    return subprocess.Popen(cmd, stdout=subprocess.DEVNULL if not args.verbose else None,
+                            stderr=subprocess.STDOUT if not args.verbose else None)
+
+
+def stop_target(args, proc: subprocess.Popen):
+    if args.image:
+        subprocess.run(["docker", "rm", "-f", args.name], stdout=subprocess.DEVNULL, stderr=subprocess.DEVNULL)
+    proc.terminate()
+    try:
+        proc.wait(timeout=15)
+    except subprocess.TimeoutExpired:
+        proc.kill()
+
+
+def run_once(args, body: Optional[dict]) -> Dict[str, Optional[float]]:
+    base = f"http://127.0.0.1:{args.port}"
+    start = time.perf_counter()
+    proc = start_target(args)
+    deadline = start + args.timeout
+    try:
+        ready = wait_for(base + args.ready_path, None, deadline, ok_only=False)
+        first = wait_for(base + args.path, body, deadline, ok_only=True) if ready else None
+    finally:
+        stop_target(args, proc)
+    return {
+        "ready_s": ready - start if ready else None,
+        "first_request_s": first - start if first else None,
+    }
+
+
+def _fmt(seconds: Optional[float]) -> str:
+    return f"{seconds:.2f}s" if seconds is not None else "timeout"
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="Measure container start -> first served request.")
+    target = parser.add_mutually_exclusive_group(required=True)
+    target.add_argument("--image", help="Docker image to start with `docker run`")
+    target.add_argument("--cmd", help="Local command to start instead of a container")
+    parser.add_argument("--port", type=int, default=7860, help="Host port to probe")
+    parser.add_argument("--container-port", type=int, default=7860)
+    parser.add_argument("--name", default="invaductar-startup-bench", help="Container name")
+    parser.add_argument("--env-file", help="Passed to docker run")
+    parser.add_argument("-e", "--env", action="append", help="KEY=VALUE passed to docker run")
+    parser.add_argument("--ready-path", default="/api/metrics/memory")
+    parser.add_argument("--path", default="/api/search", help="Probe request path")
+    parser.add_argument("--json", default=json.dumps(DEFAULT_PROBE), help="Probe POST body ('' for GET)")
+    parser.add_argument("--runs", type=int, default=3)
+    parser.add_argument("--timeout", type=float, default=600.0, help="Seconds before a run counts as failed")
+    parser.add_argument("--verbose", action="store_true", help="Show server output")
+    parser.add_argument("--output", help="Write per-run results as JSON")
+    args = parser.parse_args(argv)
+
+    body = json.loads(args.json) if args.json else None
+    print(f"🚀 {args.runs} cold start(s) of {args.image or args.cmd}, probe {args.path}")
+    runs = []
+    for i in range(args.runs):
+        result = run_once(args, body)
+        runs.append(result)
+        print(f"   run {i + 1}: ready {_fmt(result['ready_s'])}, first request {_fmt(result['first_request_s'])}")
+        sys.stdout.flush()
+
+    firsts = [r["first_request_s"] for r in runs if r["first_request_s"] is not None]
+    readies = [r["ready_s"] for r in runs if r["ready_s"] is not None]
+    summary = {
+        "runs": runs,
+        "median_ready_s": statistics.median(readies) if readies else None,
+        "median_first_request_s": statistics.median(firsts) if firsts else None,
+        "failed_runs": len(runs) - len(firsts),
+    }
+    if firsts:
+        print(f"\n⏱️  Start -> first served request: median {summary['median_first_request_s']:.2f}s "
+              f"(min {min(firsts):.2f}s, max {max(firsts):.2f}s); ready median {summary['median_ready_s']:.2f}s")
+    else:
+        print("⚠️ No run served a successful request before the timeout.")
+    if args.output:
+        with open(args.output, "w", encoding="utf-8") as f:
+            json.dump(summary, f, indent=2)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,140 @@
+#!/usr/bin/env python3
+"""
+Sweep worker processes x torch threads on this host and report throughput
+and latency for CLIP image inference and MiniLM query embedding.
+
+    python bench_topology.py --workers 1,2,4 --threads 1,2,4 --duration 15
+    python bench_topology.py --model minilm --pin
+
+Each configuration starts `workers` fresh processes (spawned, so thread
+settings apply before torch loads). They all start together and run single
+requests back to back for `duration` seconds, as gunicorn workers would.
+Configurations with workers x threads above the core count are skipped
+unless --oversubscribe is given.
+"""
+import sys
+import json
+import time
+import argparse
+import multiprocessing as mp
+from typing import Dict, List
+
+from topology import available_cpus
+
+MINILM_QUERY = "What are the treatment options for invasive ductal carcinoma?"
+
+
+def _worker(index: int, workers: int, threads: int, model: str, pin: bool,
+            duration: float, barrier, results):
+    from topology import configure_process, configure_torch
+    configure_process(threads=threads, worker_index=index, workers=workers, pin=pin, override=True)
+    import numpy as np
+    import torch
+    configure_torch(torch, threads)
+
+    if model == "clip":
+        from vision import load_clip
+        clip, _, device = load_clip("cpu")
+        pixels = torch.from_numpy(np.random.rand(1, 3, 224, 224).astype(np.float32))
+
+        def step():
+            with torch.inference_mode():
+                clip.get_image_features(pixel_values=pixels)
+    else:
+        from sentence_transformers import SentenceTransformer
+        from chunking import EMBED_MODEL_ID
+        st = SentenceTransformer(EMBED_MODEL_ID, device="cpu")
+
+        def step():
+            st.encode([MINILM_QUERY])
+
+    for _ in range(3):
+        step()  # warm-up
+    barrier.wait()
+
+    latencies = []
+    deadline = time.perf_counter() + duration
+    while time.perf_counter() < deadline:
+        t0 = time.perf_counter()
+        step()
+        latencies.append(time.perf_counter() - t0)
+    results.put(latencies)
+
+
+def run_config(workers: int, threads: int, model: str, pin: bool, duration: float) -> Dict[str, float]:
+    ctx = mp.get_context("spawn")
+    barrier = ctx.Barrier(workers)
+    results = ctx.Queue()
+    procs = [
+        ctx.Process(target=_worker, args=(i, workers, threads, model, pin, duration, barrier, results))
+        for i in range(workers)
+    ]
+    for p in procs:
+        p.start()
+    latencies: List[float] = []
+    for _ in procs:
+        latencies.extend(results.get())
+    for p in procs:
+        p.join()
+
+    latencies.sort()
+
+    def pct(q):
+        return latencies[min(len(latencies) - 1, int(q * len(latencies)))] * 1000 if latencies else float("nan")
+
+    return {
+        "workers": workers,
+        "threads": threads,
+        "requests": len(latencies),
+        "throughput": len(latencies) / duration,
+        "p50_ms": pct(0.50),
+        "p99_ms": pct(0.99),
+    }
+
+
+def main(argv=None):
+    cpus = len(available_cpus())
+    parser = argparse.ArgumentParser(description="Find the best workers x threads topology for this host.")
+    parser.add_argument("--workers", default="1,2,4", help="Comma-separated worker counts")
+    parser.add_argument("--threads", default=f"1,2,{max(1, cpus // 2)},{cpus}", help="Comma-separated torch threads per worker")
+    parser.add_argument("--model", choices=["clip", "minilm"], default="clip")
+    parser.add_argument("--duration", type=float, default=10.0, help="Seconds per configuration")
+    parser.add_argument("--pin", action="store_true", help="Pin each worker to its own core set")
+    parser.add_argument("--oversubscribe", action="store_true", help="Also run workers x threads > cores")
+    parser.add_argument("--json", help="Write all results to this file")
+    args = parser.parse_args(argv)
+
+    workers_list = sorted({int(x) for x in args.workers.split(",") if x.strip()})
+    threads_list = sorted({int(x) for x in args.threads.split(",") if x.strip()})
+
+    print(f"🖥️  {cpus} CPUs available — model={args.model}, {args.duration:.0f}s per config, pin={args.pin}")
+    print(f"{'workers':>7} {'threads':>7} {'req/s':>8} {'p50 ms':>8} {'p99 ms':>8}")
+    rows = []
+    for w in workers_list:
+        for t in threads_list:
+            if w * t > cpus and not args.oversubscribe:
+                continue
+            row = run_config(w, t, args.model, args.pin, args.duration)
+            rows.append(row)
+            print(f"{w:>7} {t:>7} {row['throughput']:>8.2f} {row['p50_ms']:>8.1f} {row['p99_ms']:>8.1f}")
+            sys.stdout.flush()
+
+    if not rows:
+        print("⚠️ No configuration fits the core count (use --oversubscribe).")
+        return
+
+    best_tput = max(rows, key=lambda r: r["throughput"])
+    best_p99 = min(rows, key=lambda r: r["p99_ms"])
+    print(f"\n🏆 Best throughput: WEB_CONCURRENCY={best_tput['workers']} TORCH_THREADS={best_tput['threads']} "
+          f"({best_tput['throughput']:.2f} req/s, p99 {best_tput['p99_ms']:.1f} ms)")
+    print(f"⏱️  Best p99 latency: WEB_CONCURRENCY={best_p99['workers']} TORCH_THREADS={best_p99['threads']} "
+          f"({best_p99['p99_ms']:.1f} ms, {best_p99['throughput']:.2f} req/s)")
+
+    if args.json:
+        with open(args.json, "w", encoding="utf-8") as f:
+            json.dump({"cpus": cpus, "model": args.model, "results": rows,
+                       "best_throughput": best_tput, "best_p99": best_p99}, f, indent=2)
+
+
+if __name__ == "__main__":
+    main()
@@ -4,6 +4,7 @@ import json
 import os
 from langchain_core.messages import HumanMessage, AIMessage
 from agent import agent
+from reasoning import strip_reasoning
 
 def load_conversation():
     """Load existing conversation from JSON file"""
@@ -38,8 +39,8 @@ def save_conversation(messages):
 
 def extract_final_response(ai_message_content):
     """Extract only the final response, hiding agent thoughts"""
-    # Split by common thought patterns and take the last meaningful part
-    content = str(ai_message_content)
+    # Drop <think> sections first, then the legacy thought-pattern filter
+    content = strip_reasoning(str(ai_message_content))
     
     # Remove thought patterns
     thought_markers = [
@@ -0,0 +1,292 @@
+# chunking.py
+import os
+import re
+from bisect import bisect_right
+from dataclasses import dataclass, field
+from typing import Dict, Any, List, Tuple
+
+# -----------------------------
+# 🔹 Config
+# -----------------------------
+EMBED_HUB_ID = "sentence-transformers/all-MiniLM-L6-v2"
+# A local directory baked by prepare_models.py overrides the Hub id.
+EMBED_MODEL_ID = os.getenv("EMBED_MODEL_ID", EMBED_HUB_ID)
+# "onnx" runs the ONNX export from prepare_models.py --onnx (sentence-transformers >= 3.2).
+EMBED_BACKEND = os.getenv("EMBED_BACKEND", "torch")
+# all-MiniLM-L6-v2 truncates input at 256 word pieces ([CLS] and [SEP] included).
+MAX_TOKENS = 256
+SPECIAL_TOKENS = 2
+OVERLAP_TOKENS = 32
+
+_SENTENCE_END_RE = re.compile(r"(?<=[.!?])[\"')\]]*\s+(?=[A-Z0-9\"'(\[•\-])")
+_NUMBERED_HEADING_RE = re.compile(r"^(\d+(\.\d+)*\.?|[IVX]+\.)\s+[A-Z]")
+_TABLE_GAP_RE = re.compile(r"\t|\S\s{3,}\S")
+_NUMBER_RE = re.compile(r"^[\d.,%±<>=()-]+$")
+_MINOR_WORDS = {"a", "an", "and", "of", "the", "in", "on", "for", "to", "with", "or", "vs", "by", "at"}
+
+
+@dataclass
+class Unit:
+    """A sentence, heading or table block with its position in the source PDF."""
+    text: str
+    kind: str
+    page_start: int
+    char_start: int
+    page_end: int
+    char_end: int
+    section: str = ""
+    tokens: int = 0
+
+
+@dataclass
+class Chunk:
+    text: str
+    metadata: Dict[str, Any] = field(default_factory=dict)
+
+
+def embed_model_kwargs() -> Dict[str, Any]:
+    """model_kwargs for HuggingFaceEmbeddings / SentenceTransformer."""
+    return {"backend": EMBED_BACKEND} if EMBED_BACKEND != "torch" else {}
+
+
+def load_tokenizer(model_id: str = EMBED_MODEL_ID):
+    from transformers import AutoTokenizer
+    return AutoTokenizer.from_pretrained(model_id)
+
+
+# -----------------------------
+# 🔹 Page -> Units
+# -----------------------------
+def _is_heading(line: str, prev_line: str) -> bool:
+    if not line or len(line) > 80 or line[-1] in ".,;:":
+        return False
+    words = line.split()
+    if len(words) > 10:
+        return False
+    if _NUMBERED_HEADING_RE.match(line):
+        return True
+    letters = [c for c in line if c.isalpha()]
+    if len(letters) >= 3 and all(c.isupper() for c in letters):
+        return True
+    # Title Case lines count only when the previous line closed a sentence,
+    # otherwise they are usually a wrapped sentence fragment.
+    title = all(w[0].isupper() or w.lower() in _MINOR_WORDS for w in words if w[0].isalpha())
+    return title and len(words) <= 8 and (not prev_line or prev_line[-1] in ".!?:")
+
+
+def _is_table_row(line: str) -> bool:
+    if _TABLE_GAP_RE.search(line):
+        return True
+    tokens = line.split()
+    numeric = sum(1 for t in tokens if _NUMBER_RE.match(t))
+    return len(tokens) >= 3 and numeric / len(tokens) >= 0.5
+
+
+def _split_paragraph(parts: List[Tuple[str, int, int]], section: str) -> List[Unit]:
+    """
+    parts: (line_text, page, offset_in_page) for consecutive lines of one
+    paragraph, possibly across a page break. Returns one Unit per sentence.
+    """
+    joined, starts = "", []
+    for text, _, _ in parts:
+        if joined:
+            joined += " "
+        starts.append(len(joined))
+        joined += text
+
+    def locate(pos: int) -> Tuple[int, int]:
+        i = bisect_right(starts, pos) - 1
+        _, page, offset = parts[i]
+        return page, offset + min(pos - starts[i], len(parts[i][0]))
+
+    units, begin = [], 0
+    bounds = [m.start() for m in _SENTENCE_END_RE.finditer(joined)] + [len(joined)]
+    for end in bounds:
+        sentence = joined[begin:end].strip()
+        if sentence:
+            lead = len(joined[begin:end]) - len(joined[begin:end].lstrip())
+            p0, c0 = locate(begin + lead)
+            p1, c1 = locate(begin + lead + len(sentence))
+            units.append(Unit(sentence, "sentence", p0, c0, p1, c1, section))
+        begin = end
+        while begin < len(joined) and joined[begin] in "\"')] ":
+            begin += 1
+    return units
+
+
+def extract_units(pages: List[Tuple[int, str]]) -> List[Unit]:
+    """
+    Turn (page_number, text) pairs into headings, table blocks and sentences.
+    Paragraphs that run over a page break stay one paragraph.
+    """
+    units: List[Unit] = []
+    section = ""
+    paragraph: List[Tuple[str, int, int]] = []
+    table: List[Tuple[str, int, int]] = []
+
+    def flush_paragraph():
+        nonlocal paragraph
+        if paragraph:
+            units.extend(_split_paragraph(paragraph, section))
+            paragraph = []
+
+    def flush_table():
+        nonlocal table
+        if table:
+            text = "\n".join(t for t, _, _ in table)
+            last = table[-1]
+            units.append(Unit(text, "table", table[0][1], table[0][2], last[1], last[2] + len(last[0]), section))
+            table = []
+
+    prev_line = ""
+    for page_no, text in pages:
+        offset = 0
+        # Trailing blank lines are page furniture, not a paragraph break: only
+        # the punctuation check below decides whether a paragraph ends here.
+        for raw in (text or "").rstrip().split("\n"):
+            line_start = offset + (len(raw) - len(raw.lstrip()))
+            offset += len(raw) + 1
+            line = raw.strip()
+            if not line:
+                flush_table()
+                flush_paragraph()
+                prev_line = ""
+                continue
+            if _is_table_row(line):
+                flush_paragraph()
+                table.append((line, page_no, line_start))
+            elif _is_heading(line, prev_line):
+                flush_table()
+                flush_paragraph()
+                section = line
+                units.append(Unit(line, "heading", page_no, line_start, page_no, line_start + len(line), section))
+            else:
+                flush_table()
+                paragraph.append((line, page_no, line_start))
+            prev_line = line
+        # A table never continues silently onto the next page; a paragraph
+        # does unless the page ended on a full stop.
+        flush_table()
+        if paragraph and paragraph[-1][0][-1:] in ".!?":
+            flush_paragraph()
+    flush_paragraph()
+    return units
+
+
+# -----------------------------
+# 🔹 Units -> Token-bounded Chunks
+# -----------------------------
+def _count_tokens(tokenizer, texts: List[str]) -> List[int]:
+    if not texts:
+        return []
+    encoded = tokenizer(texts, add_special_tokens=False)["input_ids"]
+    return [len(ids) for ids in encoded]
+
+
+def _split_oversized(unit: Unit, tokenizer, budget: int) -> List[Unit]:
+    """Hard-split a unit longer than the budget at token boundaries."""
+    enc = tokenizer(unit.text, add_special_tokens=False, return_offsets_mapping=True)
+    offsets = enc["offset_mapping"]
+    pieces = []
+    for i in range(0, len(offsets), budget):
+        window = offsets[i:i + budget]
+        a, b = window[0][0], window[-1][1]
+        same_page = unit.page_start == unit.page_end
+        pieces.append(Unit(
+            unit.text[a:b], unit.kind,
+            unit.page_start, unit.char_start + a if same_page else unit.char_start,
+            unit.page_end, unit.char_start + b if same_page else unit.char_end,
+            unit.section, len(window),
+        ))
+    return pieces
+
+
+def chunk_units(units: List[Unit], tokenizer, max_tokens: int = MAX_TOKENS,
+                overlap_tokens: int = OVERLAP_TOKENS) -> List[List[Unit]]:
+    """
+    Greedily pack units into chunks of at most max_tokens (special tokens
+    included). A heading starts a new chunk; a budget split carries the last
+    sentences (up to overlap_tokens) into the next chunk. Tables are never
+    used as overlap.
+    """
+    budget = max_tokens - SPECIAL_TOKENS
+    for unit, n in zip(units, _count_tokens(tokenizer, [u.text for u in units])):
+        unit.tokens = n
+
+    expanded: List[Unit] = []
+    for unit in units:
+        expanded.extend(_split_oversized(unit, tokenizer, budget) if unit.tokens > budget else [unit])
+
+    chunks: List[List[Unit]] = []
+    current: List[Unit] = []
+    used = 0
+
+    for unit in expanded:
+        if unit.kind == "heading" and any(u.kind != "heading" for u in current):
+            chunks.append(current)
+            current, used = [], 0
+        elif used + unit.tokens > budget and current:
+            chunks.append(current)
+            carry: List[Unit] = []
+            carried = 0
+            for prev in reversed(current):
+                if prev.kind != "sentence" or carried + prev.tokens > overlap_tokens:
+                    break
+                carry.insert(0, prev)
+                carried += prev.tokens
+            if carried + unit.tokens > budget:
+                carry, carried = [], 0
+            current, used = carry, carried
+        current.append(unit)
+        used += unit.tokens
+
+    if current and any(u.kind != "heading" for u in current):
+        chunks.append(current)
+    return chunks
+
+
+def chunk_pages(
+    pages: List[Tuple[int, str, List[str]]],
+    source: str,
+    tokenizer,
+    max_tokens: int = MAX_TOKENS,
+    overlap_tokens: int = OVERLAP_TOKENS,
+) -> List[Chunk]:
+    """
+    Chunk a whole PDF. pages: (page_number, text, links) with 1-based page numbers.
+    Metadata per chunk: source, links, section, page_start/page_end,
+    char_start/char_end (offsets into those pages) and token_count.
+    """
+    links_by_page: Dict[int, List[str]] = {p: links for p, _, links in pages}
+    units = extract_units([(p, text) for p, text, _ in pages])
+    chunks = []
+    for group in chunk_units(units, tokenizer, max_tokens, overlap_tokens):
+        text = _join_units(group)
+        first, last = group[0], group[-1]
+        page_links: List[str] = []
+        for p in range(first.page_start, last.page_end + 1):
+            page_links.extend(links_by_page.get(p, []))
+        chunks.append(Chunk(text=text, metadata={
+            "source": source,
+            "links": [url for url in dict.fromkeys(page_links) if url in text],
+            "section": next((u.section for u in reversed(group) if u.section), ""),
+            "page_start": first.page_start,
+            "page_end": last.page_end,
+            "char_start": first.char_start,
+            "char_end": last.char_end,
+            "token_count": sum(u.tokens for u in group),
+        }))
+    return chunks
+
+
+def _join_units(group: List[Unit]) -> str:
+    """Sentences run together; headings and tables keep their own lines."""
+    out = ""
+    for i, unit in enumerate(group):
+        if i == 0:
+            out = unit.text
+        elif unit.kind == "sentence" and group[i - 1].kind == "sentence":
+            out += " " + unit.text
+        else:
+            out += "\n" + unit.text
+    return out
@@ -0,0 +1,263 @@
+# conversation_memory.py
+"""
+Semantic long-term memory over past conversation turns.
+
+Each completed turn (user message + assistant reply) is embedded once with
+the shared MiniLM embedder and stored per session in SQLite. Vectors are
+kept in memory as a normalized matrix for hot sessions. For a new message
+the prompt gets the most recent turn plus the top-k most similar older
+turns, so its size stays constant however long the conversation grows.
+"""
+import os
+import time
+import sqlite3
+import hashlib
+import threading
+from typing import Any, Dict, List, Optional, Tuple
+
+import numpy as np
+
+from reasoning import strip_reasoning
+from retrieval import LRUCache
+
+# -----------------------------
+# 🔹 Config
+# -----------------------------
+MEMORY_DB = os.getenv("MEMORY_DB", "memory.sqlite3")
+MEMORY_TOP_K = int(os.getenv("MEMORY_TOP_K", "3"))
+# Most recent turns always included verbatim (follow-ups like "what about its side effects?").
+MEMORY_RECENT_TURNS = int(os.getenv("MEMORY_RECENT_TURNS", "1"))
+MEMORY_MIN_SCORE = float(os.getenv("MEMORY_MIN_SCORE", "0.3"))
+# Per-turn text budget in the prompt (long RAG answers are cut).
+MEMORY_MAX_CHARS = int(os.getenv("MEMORY_MAX_CHARS", "800"))
+MEMORY_CACHE_SESSIONS = int(os.getenv("MEMORY_CACHE_SESSIONS", "128"))
+# Latency samples kept for the p50 / p95 report.
+MEMORY_LATENCY_WINDOW = 512
+
+_SCHEMA = """
+create table if not exists turns (
+    session_id text not null,
+    turn_index integer not null,
+    digest text not null,
+    human text not null,
+    ai text not null,
+    embedding blob not null,
+    created_at real not null,
+    primary key (session_id, turn_index)
+);
+"""
+
+
+def _clip(text: str, limit: int = MEMORY_MAX_CHARS) -> str:
+    text = text.strip()
+    return text if len(text) <= limit else text[:limit].rsplit(" ", 1)[0] + " …"
+
+
+def extract_turns(messages: List[Any]) -> List[Tuple[str, str]]:
+    """
+    (user text, assistant reply) for every completed turn; a human message
+    without a reply yet (the one being answered) is not a turn.
+    """
+    turns = []
+    human: Optional[str] = None
+    for m in messages:
+        kind = getattr(m, "type", "")
+        if kind == "human":
+            human = m.content
+        elif kind == "ai" and human is not None:
+            turns.append((human, strip_reasoning(m.content or "")))
+            human = None
+    return turns
+
+
+def _digest(human: str, ai: str) -> str:
+    return hashlib.sha256(f"{human}\x00{ai}".encode("utf-8")).hexdigest()[:16]
+
+
+class _Session:
+    def __init__(self):
+        self.digests: List[str] = []
+        self.turns: List[Tuple[str, str]] = []
+        self.matrix = np.zeros((0, 0), dtype=np.float32)
+
+
+class ConversationMemory:
+    """Per-session turn index: sync() embeds new turns, recall() returns the relevant ones."""
+
+    def __init__(self, embedder, path: str = MEMORY_DB, top_k: int = MEMORY_TOP_K,
+                 recent_turns: int = MEMORY_RECENT_TURNS, min_score: float = MEMORY_MIN_SCORE):
+        self.embedder = embedder
+        self.path = path
+        self.top_k = top_k
+        self.recent_turns = recent_turns
+        self.min_score = min_score
+        self._local = threading.local()
+        self._lock = threading.Lock()
+        self._sessions = LRUCache(maxsize=MEMORY_CACHE_SESSIONS, ttl=0)
+        self._recall_ms: List[float] = []
+        self._embed_ms: List[float] = []
+        self.embedded_turns = 0
+        self._conn().executescript(_SCHEMA)
+
+    def _conn(self) -> sqlite3.Connection:
+        conn = getattr(self._local, "conn", None)
+        # A connection inherited across fork (pre-fork serving) must not be reused.
+        if conn is None or getattr(self._local, "pid", None) != os.getpid():
+            conn = sqlite3.connect(self.path, timeout=30, isolation_level=None)
+            conn.execute("pragma journal_mode=wal")
+            conn.execute("pragma synchronous=normal")
+            self._local.conn = conn
+            self._local.pid = os.getpid()
+        return conn
+
+    def _session(self, session_id: str) -> _Session:
+        session = self._sessions.get(session_id)
+        if session is not None:
+            return session
+        session = _Session()
+        rows = self._conn().execute(
+            "select digest, human, ai, embedding from turns where session_id = ? order by turn_index",
+            (session_id,),
+        ).fetchall()
+        if rows:
+            session.digests = [r[0] for r in rows]
+            session.turns = [(r[1], r[2]) for r in rows]
+            session.matrix = np.vstack([np.frombuffer(r[3], dtype=np.float32) for r in rows])
+        self._sessions.put(session_id, session)
+        return session
+
+    def _reset(self, session_id: str, session: _Session):
+        self._conn().execute("delete from turns where session_id = ?", (session_id,))
+        session.digests, session.turns = [], []
+        session.matrix = np.zeros((0, 0), dtype=np.float32)
+
+    def sync(self, session_id: str, messages: List[Any]) -> int:
+        """
+        Embed the completed turns not indexed yet; returns how many were added.
+        Embedding runs outside the lock, so syncs and recalls of other sessions
+        never wait on it; the index is re-checked before the new turns go in.
+        """
+        turns = extract_turns(messages)
+        with self._lock:
+            session = self._session(session_id)
+            known = len(session.digests)
+            # A cleared or replaced conversation no longer extends the index: start over.
+            if known > len(turns) or (known and _digest(*turns[known - 1]) != session.digests[-1]):
+                self._reset(session_id, session)
+                known = 0
+        new = turns[known:]
+        if not new:
+            return 0
+
+        start = time.perf_counter()
+        texts = [f"User: {h}\nAssistant: {_clip(a)}" for h, a in new]
+        vectors = np.asarray(self.embedder.embed_documents(texts), dtype=np.float32)
+        vectors /= np.maximum(np.linalg.norm(vectors, axis=1, keepdims=True), 1e-12)
+        embed_ms = (time.perf_counter() - start) * 1000
+        digests = [_digest(h, a) for h, a in new]
+
+        with self._lock:
+            self._track(self._embed_ms, embed_ms)
+            session = self._session(session_id)
+            # A concurrent sync may have indexed some of these turns meanwhile;
+            # if it left the index on another conversation, that one wins.
+            skip = len(session.digests) - known
+            if (skip < 0 or session.digests[known:] != digests[:skip]
+                    or (known and session.digests[known - 1] != _digest(*turns[known - 1]))):
+                return 0
+            new, digests, vectors = new[skip:], digests[skip:], vectors[skip:]
+            if not new:
+                return 0
+            known += skip
+
+            now = time.time()
+            self._conn().executemany(
+                "insert or replace into turns (session_id, turn_index, digest, human, ai, embedding, created_at)"
+                " values (?, ?, ?, ?, ?, ?, ?)",
+                [(session_id, known + i, d, h, a, v.tobytes(), now)
+                 for i, ((h, a), d, v) in enumerate(zip(new, digests, vectors))],
+            )
+            session.digests.extend(digests)
+            session.turns.extend(new)
+            session.matrix = vectors if not len(session.matrix) else np.vstack([session.matrix, vectors])
+            self.embedded_turns += len(new)
+            return len(new)
+
+    def recall(self, session_id: str, query: str, k: Optional[int] = None) -> Tuple[List[Dict[str, Any]], Dict[str, Any]]:
+        """
+        The most recent turns plus the top-k older turns most similar to the
+        query, in conversation order. Returns (turns, stats).
+        """
+        k = self.top_k if k is None else k
+        start = time.perf_counter()
+        with self._lock:
+            session = self._session(session_id)
+            turns, matrix = list(session.turns), session.matrix
+        total = len(turns)
+        recent = list(range(max(0, total - self.recent_turns), total))
+        picked = {i: None for i in recent}
+
+        older = total - len(recent)
+        if k and older > 0 and query.strip():
+            q = np.asarray(self.embedder.embed_query(query), dtype=np.float32)
+            q /= max(float(np.linalg.norm(q)), 1e-12)
+            scores = matrix[:older] @ q
+            top = np.argsort(-scores)[:k]
+            for i in top:
+                if scores[i] >= self.min_score:
+                    picked[int(i)] = float(scores[i])
+
+        recalled = [
+            {"turn": i, "human": _clip(turns[i][0]), "ai": _clip(turns[i][1]), "score": picked[i]}
+            for i in sorted(picked)
+        ]
+        latency = (time.perf_counter() - start) * 1000
+        with self._lock:
+            self._track(self._recall_ms, latency)
+        stats = {
+            "memory_ms": round(latency, 2),
+            "memory_turns_indexed": total,
+            "memory_turns_recalled": len(recalled),
+            "memory_turns_skipped": total - len(recalled),
+        }
+        return recalled, stats
+
+    @staticmethod
+    def _track(samples: List[float], value: float):
+        samples.append(value)
+        if len(samples) > MEMORY_LATENCY_WINDOW:
+            del samples[0]
+
+    def stats(self) -> Dict[str, Any]:
+        def pct(samples, q):
+            if not samples:
+                return None
+            ordered = sorted(samples)
+            return round(ordered[min(len(ordered) - 1, int(q * len(ordered)))], 2)
+
+        conn = self._conn()
+        sessions, turns, size = conn.execute(
+            "select count(distinct session_id), count(*), coalesce(sum(length(embedding) + length(human) + length(ai)), 0)"
+            " from turns"
+        ).fetchone()
+        with self._lock:
+            recall_ms, embed_ms = list(self._recall_ms), list(self._embed_ms)
+        return {
+            "sessions": sessions,
+            "turns": turns,
+            "index_mb": round(size / 2**20, 3),
+            "sessions_hot": len(self._sessions),
+            "embedded_turns_this_process": self.embedded_turns,
+            "recall_p50_ms": pct(recall_ms, 0.50),
+            "recall_p95_ms": pct(recall_ms, 0.95),
+            "embed_p50_ms": pct(embed_ms, 0.50),
+        }
+
+
+def memory_messages(turns: List[Dict[str, Any]]) -> List[Dict[str, str]]:
+    """Recalled turns as chat messages to place between the system prompt and the new question."""
+    messages = []
+    for t in turns:
+        messages.append({"role": "user", "content": t["human"]})
+        messages.append({"role": "assistant", "content": t["ai"]})
+    return messages
@@ -0,0 +1,267 @@
+# explain_cache.py
+"""
+Explanation cache keyed by the quantized CLIP score profile.
+
+explain_result only sends the structured CLIP output to the LLM, so scans
+whose score vectors fall in the same bucket get practically the same
+explanation. Each bucket collects EXPLAIN_CACHE_PER_BUCKET explanations in
+a local SQLite file; until it is full every request is generated (and
+stored), after that hits rotate through the stored ones. Entries are tagged with a
+version hash of the label set, prompt, model and granularity. When any of
+those change, old entries are no longer served and are purged on startup.
+
+    python explain_cache.py pregenerate --concurrency 4
+    python explain_cache.py stats
+    python explain_cache.py clear
+"""
+import os
+import sys
+import json
+import time
+import random
+import hashlib
+import sqlite3
+import argparse
+import threading
+from concurrent.futures import ThreadPoolExecutor
+from typing import Any, Dict, Iterator, List, Optional, Sequence, Tuple
+
+# -----------------------------
+# 🔹 Config
+# -----------------------------
+EXPLAIN_CACHE_ENABLED = os.getenv("EXPLAIN_CACHE", "1") == "1"
+EXPLAIN_CACHE_DB = os.getenv("EXPLAIN_CACHE_DB", "explain_cache.sqlite3")
+# Bucket width on each label score (0.05 -> scores quantized to 5% steps).
+EXPLAIN_CACHE_STEP = float(os.getenv("EXPLAIN_CACHE_STEP", "0.05"))
+EXPLAIN_CACHE_PER_BUCKET = int(os.getenv("EXPLAIN_CACHE_PER_BUCKET", "3"))
+
+_SCHEMA = """
+create table if not exists explanations (
+    version text not null,
+    bucket text not null,
+    content text not null,
+    created_at real not null
+);
+create index if not exists explanations_bucket_idx on explanations (version, bucket);
+"""
+
+
+def quantize(scores: Sequence[float], step: float) -> Tuple[int, ...]:
+    """
+    Scores -> integer units of `step` that always sum to round(1 / step)
+    (largest remainder), so every result lands on the pregeneration grid.
+    """
+    units = round(1 / step)
+    total = sum(scores) or 1.0
+    raw = [s / total * units for s in scores]
+    q = [int(r) for r in raw]
+    order = sorted(range(len(raw)), key=lambda i: raw[i] - q[i], reverse=True)
+    for i in order[:units - sum(q)]:
+        q[i] += 1
+    return tuple(q)
+
+
+def bucket_key(result: Dict[str, Any], labels: Sequence[str], step: float = EXPLAIN_CACHE_STEP) -> Optional[str]:
+    """Bucket id of an analyze_image result, or None if it does not fit the label set."""
+    scores = result.get("scores") or {}
+    if set(scores) != set(labels) or result.get("prediction") not in labels:
+        return None
+    q = quantize([float(scores[label]) for label in labels], step)
+    # The predicted label is part of the key: near-ties can round either way.
+    return f"{labels.index(result['prediction'])}|" + ",".join(map(str, q))
+
+
+def grid(labels: Sequence[str], step: float = EXPLAIN_CACHE_STEP) -> Iterator[Tuple[str, Dict[str, Any]]]:
+    """Every bucket on the score simplex with a representative (bucket centre) result."""
+    units = round(1 / step)
+
+    def compositions(n: int, parts: int):
+        if parts == 1:
+            yield (n,)
+            return
+        for first in range(n, -1, -1):
+            for rest in compositions(n - first, parts - 1):
+                yield (first,) + rest
+
+    for q in compositions(units, len(labels)):
+        top = max(q)
+        for idx, value in enumerate(q):
+            if value != top:
+                continue
+            scores = {label: round(v * step, 4) for label, v in zip(labels, q)}
+            result = {"prediction": labels[idx], "confidence": scores[labels[idx]], "scores": scores}
+            yield f"{idx}|" + ",".join(map(str, q)), result
+
+
+def cache_version(labels: Sequence[str], prompt: str, model: str, step: float) -> str:
+    payload = json.dumps({"labels": list(labels), "prompt": prompt, "model": model, "step": step}, sort_keys=True)
+    return hashlib.sha256(payload.encode("utf-8")).hexdigest()[:16]
+
+
+class ExplanationCache:
+    """Per-bucket explanation store in a local SQLite file (WAL mode)."""
+
+    def __init__(self, labels: Sequence[str], prompt: str, model: str, path: str = EXPLAIN_CACHE_DB,
+                 step: float = EXPLAIN_CACHE_STEP, per_bucket: int = EXPLAIN_CACHE_PER_BUCKET):
+        self.labels = list(labels)
+        self.step = step
+        self.per_bucket = per_bucket
+        self.path = path
+        self.version = cache_version(self.labels, prompt, model, step)
+        self._local = threading.local()
+        self._lock = threading.Lock()
+        self._rotation: Dict[str, int] = {}
+        self.hits = 0
+        self.misses = 0
+        conn = self._conn()
+        conn.executescript(_SCHEMA)
+        purged = conn.execute("delete from explanations where version != ?", (self.version,)).rowcount
+        if purged:
+            print(f"🧹 Explanation cache: dropped {purged} entries from an old label set / prompt")
+
+    def _conn(self) -> sqlite3.Connection:
+        conn = getattr(self._local, "conn", None)
+        # A connection inherited across fork (pre-fork serving) must not be reused.
+        if conn is None or getattr(self._local, "pid", None) != os.getpid():
+            conn = sqlite3.connect(self.path, timeout=30, isolation_level=None)
+            conn.execute("pragma journal_mode=wal")
+            conn.execute("pragma synchronous=normal")
+            self._local.conn = conn
+            self._local.pid = os.getpid()
+        return conn
+
+    def key(self, result: Dict[str, Any]) -> Optional[str]:
+        return bucket_key(result, self.labels, self.step)
+
+    def entries(self, bucket: str) -> List[str]:
+        rows = self._conn().execute(
+            "select content from explanations where version = ? and bucket = ? order by rowid",
+            (self.version, bucket),
+        ).fetchall()
+        return [r[0] for r in rows]
+
+    def get(self, result: Dict[str, Any]) -> Optional[str]:
+        """
+        A stored explanation for the result's bucket (round-robin), or None
+        while the bucket holds fewer than per_bucket explanations, so the
+        caller keeps generating and putting until it is full.
+        """
+        bucket = self.key(result)
+        texts = self.entries(bucket) if bucket else []
+        with self._lock:
+            if not texts or len(texts) < self.per_bucket:
+                self.misses += 1
+                return None
+            self.hits += 1
+            turn = self._rotation.get(bucket, random.randrange(len(texts)))
+            self._rotation[bucket] = turn + 1
+        return texts[turn % len(texts)]
+
+    def put(self, result: Dict[str, Any], content: str) -> bool:
+        """Store a raw (pre-disclaimer) explanation unless the bucket is full."""
+        bucket = self.key(result)
+        if not bucket or not content.strip():
+            return False
+        conn = self._conn()
+        with self._lock:
+            count = conn.execute(
+                "select count(*) from explanations where version = ? and bucket = ?", (self.version, bucket)
+            ).fetchone()[0]
+            if count >= self.per_bucket:
+                return False
+            conn.execute(
+                "insert into explanations (version, bucket, content, created_at) values (?, ?, ?, ?)",
+                (self.version, bucket, content, time.time()),
+            )
+        return True
+
+    def clear(self):
+        self._conn().execute("delete from explanations")
+        with self._lock:
+            self._rotation.clear()
+
+    def stats(self) -> Dict[str, Any]:
+        conn = self._conn()
+        entries, buckets = conn.execute(
+            "select count(*), count(distinct bucket) from explanations where version = ?", (self.version,)
+        ).fetchone()
+        lookups = self.hits + self.misses
+        return {
+            "version": self.version,
+            "step": self.step,
+            "per_bucket": self.per_bucket,
+            "buckets": buckets,
+            "entries": entries,
+            "grid_buckets": sum(1 for _ in grid(self.labels, self.step)),
+            "hits": self.hits,
+            "misses": self.misses,
+            "hit_rate": round(self.hits / lookups, 3) if lookups else None,
+        }
+
+
+# -----------------------------
+# 🔹 Offline Pregeneration
+# -----------------------------
+def pregenerate(cache: ExplanationCache, generate, concurrency: int = 4, limit: Optional[int] = None) -> int:
+    """
+    Fill every grid bucket up to cache.per_bucket explanations with
+    generate(result) -> text (a bucket is only served once it is full).
+    """
+    tasks = []
+    for bucket, result in grid(cache.labels, cache.step):
+        missing = cache.per_bucket - len(cache.entries(bucket))
+        tasks.extend([result] * max(0, missing))
+    if limit:
+        tasks = tasks[:limit]
+    print(f"🗂️ Pregenerating {len(tasks)} explanations (step={cache.step}, per bucket={cache.per_bucket})")
+
+    done = 0
+    start = time.perf_counter()
+
+    def work(result):
+        try:
+            return result, generate(result)
+        except Exception as e:
+            print(f"⚠️ Generation failed for {result['scores']}: {e}")
+            return result, ""
+
+    with ThreadPoolExecutor(max_workers=concurrency) as pool:
+        for result, text in pool.map(work, tasks):
+            done += cache.put(result, text)
+            if done and done % 50 == 0:
+                print(f"   {done}/{len(tasks)} ({done / (time.perf_counter() - start):.2f}/s)")
+                sys.stdout.flush()
+    print(f"✅ Stored {done} explanations in {time.perf_counter() - start:.0f}s")
+    return done
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="Manage the CLIP explanation cache.")
+    sub = parser.add_subparsers(dest="command", required=True)
+    pre = sub.add_parser("pregenerate", help="Generate explanations for the whole bucket grid")
+    pre.add_argument("--concurrency", type=int, default=4, help="Concurrent LLM calls")
+    pre.add_argument("--limit", type=int, default=None, help="Stop after this many generations")
+    sub.add_parser("stats", help="Show cache coverage")
+    sub.add_parser("clear", help="Delete every cached explanation")
+    args = parser.parse_args(argv)
+
+    from tools import explain_cache, generate_explanation
+    if explain_cache is None:
+        print("⚠️ Explanation cache is disabled (EXPLAIN_CACHE=0).")
+        return
+
+    def generate(result):
+        resp = generate_explanation(result)
+        # A cut-off answer would be served again and again: store nothing.
+        return "" if resp.truncated["answer"] else resp.answer
+
+    if args.command == "pregenerate":
+        pregenerate(explain_cache, generate, concurrency=args.concurrency, limit=args.limit)
+    elif args.command == "clear":
+        explain_cache.clear()
+        print("🧹 Explanation cache cleared.")
+    print(json.dumps(explain_cache.stats(), indent=2))
+
+
+if __name__ == "__main__":
+    main()
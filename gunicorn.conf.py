@@ -0,0 +1,58 @@
+# gunicorn.conf.py — loaded automatically by `gunicorn api_server:app`
+import os
+from topology import configure_process, threads_per_worker, workers_from_env
+from prefork import LOADING_ENV, after_fork, freeze_for_fork, memory_report, preload_enabled
+
+workers = workers_from_env()
+# Model inference is CPU bound; extra request threads only queue behind it.
+threads = int(os.getenv("GUNICORN_THREADS", "1"))
+timeout = int(os.getenv("GUNICORN_TIMEOUT", "120"))
+
+# PRELOAD_MODELS=1: load models once in the master, then fork (see prefork.py)
+preload_app = preload_enabled()
+if preload_app:
+    os.environ[LOADING_ENV] = "1"
+
+
+def _free_slot(server, count: int) -> int:
+    """Lowest core-set slot no live worker holds (a restarted worker reuses its predecessor's)."""
+    taken = {getattr(w, "slot", None) for w in server.WORKERS.values()}
+    return next((i for i in range(count) if i not in taken), len(taken) % count)
+
+
+def pre_fork(server, worker):
+    # Runs in the master, so the slot is chosen against every live worker.
+    worker.slot = _free_slot(server, server.cfg.workers)
+    if preload_app:
+        info = freeze_for_fork()
+        if info:
+            server.log.info(
+                "pre-fork: %.1f MB of model tensors in shared memory, %d objects frozen",
+                info["shared_tensor_mb"], info["frozen_objects"],
+            )
+
+
+def post_fork(server, worker):
+    # Runs in the worker before the app (and torch) is imported. The real worker
+    # count is server.cfg.workers: `-w N` on the command line overrides WEB_CONCURRENCY.
+    count = server.cfg.workers
+    info = configure_process(
+        threads=threads_per_worker(count),
+        worker_index=worker.slot,
+        workers=count,
+        override=True,
+    )
+    server.log.info(
+        "worker %s: %s torch threads on cpus %s", worker.pid, info["threads"], info["cpus"]
+    )
+    if preload_app:
+        after_fork(info["threads"])
+        # Threads do not survive fork, so background workers start per worker.
+        import api_server
+        api_server.start_background_workers()
+        mem = memory_report()
+        if mem:
+            server.log.info(
+                "worker %s: rss %.0f MB, private %.0f MB, shared %.0f MB",
+                worker.pid, mem["rss_mb"], mem["uss_mb"], mem["shared_mb"],
+            )
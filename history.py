@@ -0,0 +1,195 @@
+# history.py
+"""
+Paginated conversation history with a hot cache.
+
+Conversations are append-only snapshots (each save inserts the full
+messages array), so a message index is a stable cursor. Pages are cut
+from the newest snapshot of a session. Each page is encoded once, tagged
+with an ETag and kept compressed in an LRU, so repeat reads and 304
+revalidations never touch Supabase or re-serialize anything.
+"""
+import os
+import gzip
+import json
+import time
+import base64
+import hashlib
+import threading
+from typing import Any, Callable, Dict, List, Optional, Tuple
+
+from retrieval import LRUCache
+
+try:
+    import brotli
+except ImportError:  # optional: gzip only
+    brotli = None
+
+# -----------------------------
+# 🔹 Config
+# -----------------------------
+HISTORY_PAGE_SIZE = int(os.getenv("HISTORY_PAGE_SIZE", "20"))
+HISTORY_MAX_PAGE_SIZE = int(os.getenv("HISTORY_MAX_PAGE_SIZE", "200"))
+# Sessions whose newest snapshot is kept in memory, and encoded pages kept.
+HISTORY_CACHE_SESSIONS = int(os.getenv("HISTORY_CACHE_SESSIONS", "256"))
+HISTORY_CACHE_PAGES = int(os.getenv("HISTORY_CACHE_PAGES", "2048"))
+# Trust a cached snapshot this long before re-checking the head row
+# (other workers may have saved newer turns).
+HISTORY_HEAD_TTL = float(os.getenv("HISTORY_HEAD_TTL", "2"))
+# Bodies smaller than this are sent uncompressed.
+HISTORY_COMPRESS_MIN_BYTES = int(os.getenv("HISTORY_COMPRESS_MIN_BYTES", "512"))
+
+DEFAULT_SESSION = "default"
+
+
+class HistoryUnavailable(RuntimeError):
+    """The conversation store could not be read or written (routes answer 503)."""
+
+
+def encode_cursor(index: int) -> str:
+    return base64.urlsafe_b64encode(f"m:{index}".encode("ascii")).decode("ascii").rstrip("=")
+
+
+def decode_cursor(cursor: str) -> int:
+    """Message index of a cursor; ValueError if it is malformed."""
+    try:
+        raw = base64.urlsafe_b64decode(cursor + "=" * (-len(cursor) % 4)).decode("ascii")
+        prefix, index = raw.split(":", 1)
+        if prefix != "m" or int(index) < 0:
+            raise ValueError
+        return int(index)
+    except (ValueError, UnicodeDecodeError):
+        raise ValueError(f"Invalid cursor: {cursor!r}")
+
+
+def compress(body: bytes, encoding: str) -> bytes:
+    if encoding == "br":
+        return brotli.compress(body, quality=5)
+    if encoding == "gzip":
+        return gzip.compress(body, compresslevel=6)
+    return body
+
+
+def supported_encodings() -> List[str]:
+    return (["br"] if brotli is not None else []) + ["gzip"]
+
+
+class Snapshot:
+    def __init__(self, version: Optional[str], created_at: Optional[str], messages: List[Dict[str, Any]]):
+        self.version = version
+        self.created_at = created_at
+        self.messages = messages
+        self.checked = time.monotonic()
+
+
+class Page:
+    """One encoded page: JSON body, strong ETag, compressed variants built on demand."""
+
+    def __init__(self, payload: Dict[str, Any]):
+        self.body = json.dumps(payload, ensure_ascii=False, separators=(",", ":")).encode("utf-8")
+        self.etag = hashlib.sha256(self.body).hexdigest()[:32]
+        self._variants: Dict[str, bytes] = {}
+        self._lock = threading.Lock()
+
+    def variant(self, encoding: Optional[str]) -> Tuple[bytes, Optional[str], str]:
+        """(body, content-encoding, etag) for the negotiated encoding."""
+        if not encoding or len(self.body) < HISTORY_COMPRESS_MIN_BYTES:
+            return self.body, None, self.etag
+        with self._lock:
+            if encoding not in self._variants:
+                self._variants[encoding] = compress(self.body, encoding)
+        # Each representation gets its own strong validator.
+        return self._variants[encoding], encoding, f"{self.etag}-{encoding}"
+
+
+class ConversationHistory:
+    """
+    fetch_head(session) -> version of the newest snapshot (or None), cheap.
+    fetch_snapshot(session) -> (version, created_at, messages) of the newest snapshot.
+    format_message(index, raw, snapshot) -> the message as sent to clients.
+    """
+
+    def __init__(self, fetch_head: Callable[[str], Optional[str]],
+                 fetch_snapshot: Callable[[str], Tuple[Optional[str], Optional[str], List[Dict[str, Any]]]],
+                 format_message: Callable[[int, Dict[str, Any], Snapshot], Dict[str, Any]],
+                 head_ttl: float = HISTORY_HEAD_TTL):
+        self.fetch_head = fetch_head
+        self.fetch_snapshot = fetch_snapshot
+        self.format_message = format_message
+        self.head_ttl = head_ttl
+        self.snapshots = LRUCache(maxsize=HISTORY_CACHE_SESSIONS, ttl=0)
+        self.pages = LRUCache(maxsize=HISTORY_CACHE_PAGES, ttl=0)
+        self.db_reads = 0
+
+    def snapshot(self, session_id: str, fresh: bool = False) -> Snapshot:
+        """
+        Newest snapshot; re-checked against the head row at most every
+        head_ttl seconds. fresh=True always re-checks: read-modify-write
+        callers must not build on a turn list another worker has extended.
+        """
+        cached = self.snapshots.get(session_id)
+        if cached is not None:
+            if not fresh and time.monotonic() - cached.checked < self.head_ttl:
+                return cached
+            self.db_reads += 1
+            if self.fetch_head(session_id) == cached.version:
+                cached.checked = time.monotonic()
+                return cached
+        self.db_reads += 1
+        version, created_at, messages = self.fetch_snapshot(session_id)
+        snap = Snapshot(version, created_at, list(messages or []))
+        self.snapshots.put(session_id, snap)
+        return snap
+
+    def record(self, session_id: str, version: Optional[str], created_at: Optional[str],
+               messages: List[Dict[str, Any]]):
+        """Write-through after a save, so this worker serves the new turn without a read."""
+        if version is None:
+            self.snapshots.put(session_id, None)
+            return
+        self.snapshots.put(session_id, Snapshot(version, created_at, list(messages)))
+
+    def page(self, session_id: str, before: Optional[str] = None, after: Optional[str] = None,
+             limit: int = HISTORY_PAGE_SIZE) -> Page:
+        """
+        The newest `limit` messages, or the `limit` messages before / after a
+        cursor. prev_cursor pages back in time, next_cursor forward.
+        """
+        limit = max(1, min(limit, HISTORY_MAX_PAGE_SIZE))
+        snap = self.snapshot(session_id)
+        total = len(snap.messages)
+        if after is not None:
+            start = min(decode_cursor(after), total)
+            end = min(start + limit, total)
+        else:
+            end = min(decode_cursor(before), total) if before is not None else total
+            start = max(0, end - limit)
+
+        key = (session_id, snap.version, start, end)
+        cached = self.pages.get(key)
+        if cached is not None:
+            return cached
+        page = Page({
+            "success": True,
+            "session_id": session_id,
+            "total": total,
+            "start": start,
+            "end": end,
+            "messages": [self.format_message(i, snap.messages[i], snap) for i in range(start, end)],
+            "prev_cursor": encode_cursor(start) if start > 0 else None,
+            "next_cursor": encode_cursor(end) if end < total else None,
+            # Poll with ?after=<latest_cursor> to fetch only turns added since.
+            "latest_cursor": encode_cursor(total),
+            "updated_at": snap.created_at,
+        })
+        self.pages.put(key, page)
+        return page
+
+    def stats(self) -> Dict[str, Any]:
+        return {
+            "sessions_cached": len(self.snapshots),
+            "pages_cached": len(self.pages),
+            "page_hits": self.pages.hits,
+            "page_misses": self.pages.misses,
+            "db_reads": self.db_reads,
+            "encodings": supported_encodings(),
+        }
@@ -1,9 +1,10 @@
 import os
 import re
-from typing import List, Tuple
+import sys
+from typing import Iterator, List, Tuple
 from langchain_core.documents import Document
-from langchain_text_splitters import RecursiveCharacterTextSplitter
 from langchain_community.embeddings import HuggingFaceEmbeddings
+from chunking import EMBED_MODEL_ID, Chunk, chunk_pages, embed_model_kwargs, load_tokenizer
 from pypdf import PdfReader
 from supabase import create_client
 
@@ -13,10 +14,12 @@ from supabase import create_client
 SUPABASE_URL = os.getenv("SUPABASE_URL")
 SUPABASE_KEY = os.getenv("SUPABASE_KEY")
 
-if not SUPABASE_URL or not SUPABASE_KEY:
-    raise EnvironmentError("❌ Supabase credentials missing. Please set SUPABASE_URL and SUPABASE_KEY.")
 
-supabase = create_client(SUPABASE_URL, SUPABASE_KEY)
+def get_supabase():
+    # Only the Supabase upload needs credentials; the local FAISS build does not.
+    if not SUPABASE_URL or not SUPABASE_KEY:
+        raise EnvironmentError("❌ Supabase credentials missing. Please set SUPABASE_URL and SUPABASE_KEY.")
+    return create_client(SUPABASE_URL, SUPABASE_KEY)
 
 # -----------------------------
 # 🔹 Paths
@@ -24,6 +27,8 @@ supabase = create_client(SUPABASE_URL, SUPABASE_KEY)
 BASE_DIR = os.path.dirname(os.path.abspath(__file__))
 TEXTS_DIR = os.path.join(BASE_DIR, "texts")
 
+INSERT_BATCH_SIZE = 100
+
 
 def extract_text_and_links(pdf_path: str) -> List[Tuple[str, List[str]]]:
     """Extract text and links from a PDF file."""
@@ -36,10 +41,8 @@ def extract_text_and_links(pdf_path: str) -> List[Tuple[str, List[str]]]:
     return results
 
 
-def build_vectorstore():
-    """Extract text, generate embeddings, and upload to Supabase."""
-    print("🔍 Scanning PDF files...")
-
+def iter_pdf_chunks(tokenizer) -> Iterator[Tuple[str, List[Chunk]]]:
+    """(file name, chunks) for every PDF in texts/."""
     if not os.path.exists(TEXTS_DIR):
         raise FileNotFoundError(f"❌ Folder not found: {TEXTS_DIR}")
 
@@ -47,40 +50,76 @@ def build_vectorstore():
     if not pdf_files:
         raise RuntimeError("⚠️ No PDF files found in the 'texts' directory.")
 
-    splitter = RecursiveCharacterTextSplitter(chunk_size=800, chunk_overlap=100)
-    embedder = HuggingFaceEmbeddings(model_name="sentence-transformers/all-MiniLM-L6-v2")
-
-    total_chunks = 0
-    for fname in pdf_files:
+    for fname in sorted(pdf_files):
         pdf_path = os.path.join(TEXTS_DIR, fname)
         print(f"📄 Processing {fname}...")
         pages = extract_text_and_links(pdf_path)
 
-        for page_text, page_links in pages:
-            chunks = splitter.split_text(page_text)
-            for chunk in chunks:
-                chunk_links = [url for url in page_links if url in chunk]
-                metadata = {"source": fname, "links": chunk_links}
-
-                # Generate embedding
-                embedding = embedder.embed_query(chunk)
-
-                # Insert into Supabase
-                try:
-                    supabase.table("embeddings").insert({
-                        "content": chunk,
-                        "metadata": metadata,
-                        "embedding": embedding
-                    }).execute()
-                    total_chunks += 1
-                except Exception as e:
-                    print(f"⚠️ Failed to insert chunk: {e}")
+        # Token-bounded chunks that follow headings/sentences and span page breaks
+        chunks = chunk_pages(
+            [(page_no, text, links) for page_no, (text, links) in enumerate(pages, start=1)],
+            fname,
+            tokenizer,
+        )
+        if chunks:
+            yield fname, chunks
+
+
+def build_vectorstore():
+    """Extract text, generate embeddings, and upload to Supabase."""
+    print("🔍 Scanning PDF files...")
+    supabase = get_supabase()
+    tokenizer = load_tokenizer()
+    embedder = HuggingFaceEmbeddings(model_name=EMBED_MODEL_ID, model_kwargs=embed_model_kwargs())
+
+    total_chunks = 0
+    for fname, chunks in iter_pdf_chunks(tokenizer):
+        # Generate embeddings in one batch per PDF
+        vectors = embedder.embed_documents([c.text for c in chunks])
+
+        # Insert into Supabase in batches
+        rows = [
+            {"content": c.text, "metadata": c.metadata, "embedding": v}
+            for c, v in zip(chunks, vectors)
+        ]
+        for i in range(0, len(rows), INSERT_BATCH_SIZE):
+            batch = rows[i:i + INSERT_BATCH_SIZE]
+            try:
+                supabase.table("embeddings").insert(batch).execute()
+                total_chunks += len(batch)
+            except Exception as e:
+                print(f"⚠️ Failed to insert {len(batch)} chunks: {e}")
 
     print(f"🎉 Successfully uploaded {total_chunks} chunks to Supabase `embeddings` table.")
     print("✅ RAG index is now stored in the cloud (pgvector).")
 
 
+def build_faiss_store(out_dir: str = "rag_store"):
+    """Same chunks as the Supabase upload, saved as the local FAISS store tools.py loads."""
+    from langchain_community.vectorstores import FAISS
+
+    print("🔍 Scanning PDF files...")
+    tokenizer = load_tokenizer()
+    embedder = HuggingFaceEmbeddings(model_name=EMBED_MODEL_ID, model_kwargs=embed_model_kwargs())
+
+    texts, metadatas, vectors = [], [], []
+    for fname, chunks in iter_pdf_chunks(tokenizer):
+        texts.extend(c.text for c in chunks)
+        metadatas.extend(c.metadata for c in chunks)
+        vectors.extend(embedder.embed_documents([c.text for c in chunks]))
+
+    store = FAISS.from_embeddings(list(zip(texts, vectors)), embedder, metadatas=metadatas)
+    store.save_local(out_dir)
+    print(f"🎉 Saved {len(texts)} chunks to the FAISS store in {out_dir}/.")
+
+
 if __name__ == "__main__":
+    # python ingest_pdfs.py              -> upload to Supabase
+    # python ingest_pdfs.py --faiss DIR  -> build the local FAISS store (image build)
+    if len(sys.argv) > 1 and sys.argv[1] == "--faiss":
+        build_faiss_store(sys.argv[2] if len(sys.argv) > 2 else "rag_store")
+        sys.exit(0)
+
     print("🔄 Starting RAG ingestion...")
     try:
         build_vectorstore()
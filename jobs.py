@@ -0,0 +1,345 @@
+# jobs.py
+import os
+import ssl
+import json
+import time
+import uuid
+import socket
+import sqlite3
+import ipaddress
+import threading
+import http.client
+import urllib.parse
+from typing import Any, Callable, Dict, Optional, Tuple
+
+# -----------------------------
+# 🔹 Config
+# -----------------------------
+JOBS_DB = os.getenv("JOBS_DB", "jobs.sqlite3")
+JOB_WORKERS = int(os.getenv("JOB_WORKERS", "2"))
+JOB_TTL_SECONDS = int(os.getenv("JOB_TTL_SECONDS", str(24 * 3600)))
+# A running job whose worker has not finished within the lease is requeued
+# (e.g. the process died mid-job).
+JOB_LEASE_SECONDS = int(os.getenv("JOB_LEASE_SECONDS", "600"))
+JOB_MAX_ATTEMPTS = int(os.getenv("JOB_MAX_ATTEMPTS", "3"))
+JOB_POLL_INTERVAL = float(os.getenv("JOB_POLL_INTERVAL", "0.5"))
+# Comma-separated hosts webhooks may target (empty = any public host).
+JOB_WEBHOOK_ALLOWED_HOSTS = [h.strip().lower() for h in os.getenv("JOB_WEBHOOK_ALLOWED_HOSTS", "").split(",") if h.strip()]
+JOB_WEBHOOK_ALLOW_HTTP = os.getenv("JOB_WEBHOOK_ALLOW_HTTP", "0") == "1"
+
+QUEUED, RUNNING, DONE, FAILED = "queued", "running", "done", "failed"
+
+_SCHEMA = """
+create table if not exists jobs (
+    id text primary key,
+    kind text not null,
+    idempotency_key text unique,
+    status text not null,
+    payload blob,
+    params text not null default '{}',
+    result text,
+    error text,
+    webhook_url text,
+    attempts integer not null default 0,
+    created_at real not null,
+    updated_at real not null,
+    expires_at real not null
+);
+create index if not exists jobs_status_idx on jobs (status, created_at);
+create index if not exists jobs_expires_idx on jobs (expires_at);
+"""
+
+
+class JobStore:
+    """Durable job queue + result store in a local SQLite file (WAL mode)."""
+
+    def __init__(self, path: str = JOBS_DB, ttl: int = JOB_TTL_SECONDS, max_attempts: int = JOB_MAX_ATTEMPTS):
+        self.path = path
+        self.ttl = ttl
+        self.max_attempts = max_attempts
+        self._local = threading.local()
+        with self._conn() as conn:
+            conn.executescript(_SCHEMA)
+
+    def _conn(self) -> sqlite3.Connection:
+        conn = getattr(self._local, "conn", None)
+        # A connection inherited across fork (pre-fork serving) must not be reused.
+        if conn is None or getattr(self._local, "pid", None) != os.getpid():
+            conn = sqlite3.connect(self.path, timeout=30, isolation_level=None)
+            conn.row_factory = sqlite3.Row
+            conn.execute("pragma journal_mode=wal")
+            conn.execute("pragma synchronous=normal")
+            self._local.conn = conn
+            self._local.pid = os.getpid()
+        return conn
+
+    def submit(self, kind: str, payload: bytes, params: Optional[Dict[str, Any]] = None,
+               idempotency_key: Optional[str] = None, webhook_url: Optional[str] = None) -> Dict[str, Any]:
+        """
+        Enqueue a job and return its public view. A repeated idempotency key
+        returns the existing job instead of creating a new one, unless that
+        job failed: then it is requeued with the new payload.
+        """
+        now = time.time()
+        job_id = uuid.uuid4().hex
+        conn = self._conn()
+        try:
+            conn.execute(
+                "insert into jobs (id, kind, idempotency_key, status, payload, params, webhook_url,"
+                " created_at, updated_at, expires_at) values (?, ?, ?, ?, ?, ?, ?, ?, ?, ?)",
+                (job_id, kind, idempotency_key, QUEUED, payload, json.dumps(params or {}),
+                 webhook_url, now, now, now + self.ttl),
+            )
+        except sqlite3.IntegrityError:
+            retried = conn.execute(
+                "update jobs set status = ?, payload = ?, params = ?, webhook_url = ?, result = null,"
+                " error = null, attempts = 0, updated_at = ?, expires_at = ?"
+                " where idempotency_key = ? and status = ?",
+                (QUEUED, payload, json.dumps(params or {}), webhook_url, now, now + self.ttl,
+                 idempotency_key, FAILED),
+            ).rowcount
+            row = conn.execute("select id from jobs where idempotency_key = ?", (idempotency_key,)).fetchone()
+            if retried:
+                return dict(self.get(row["id"]), requeued=True)
+            return dict(self.get(row["id"]), deduplicated=True)
+        return self.get(job_id)
+
+    def claim(self, lease: int = JOB_LEASE_SECONDS) -> Optional[sqlite3.Row]:
+        """
+        Atomically take the oldest queued (or lease-expired running) job.
+        Expired jobs that already used every attempt are failed, not retried.
+        """
+        conn = self._conn()
+        now = time.time()
+        conn.execute("begin immediate")
+        try:
+            conn.execute(
+                "update jobs set status = ?, error = ?, payload = null, updated_at = ?, expires_at = ?"
+                " where status = ? and updated_at < ? and attempts >= ?",
+                (FAILED, "Worker lost the job (lease expired) on every attempt.", now, now + self.ttl,
+                 RUNNING, now - lease, self.max_attempts),
+            )
+            row = conn.execute(
+                "select * from jobs where status = ? or (status = ? and updated_at < ?)"
+                " order by created_at limit 1",
+                (QUEUED, RUNNING, now - lease),
+            ).fetchone()
+            if row is None:
+                conn.execute("commit")
+                return None
+            conn.execute(
+                "update jobs set status = ?, attempts = attempts + 1, updated_at = ? where id = ?",
+                (RUNNING, now, row["id"]),
+            )
+            conn.execute("commit")
+        except Exception:
+            conn.execute("rollback")
+            raise
+        return conn.execute("select * from jobs where id = ?", (row["id"],)).fetchone()
+
+    def heartbeat(self, job_id: str):
+        """Renew the lease of a running job."""
+        self._conn().execute(
+            "update jobs set updated_at = ? where id = ? and status = ?", (time.time(), job_id, RUNNING)
+        )
+
+    def finish(self, job_id: str, result: Any = None, error: Optional[str] = None, retry: bool = False):
+        """Store the outcome. The payload is dropped once the job is final."""
+        now = time.time()
+        if retry:
+            self._conn().execute(
+                "update jobs set status = ?, error = ?, updated_at = ? where id = ?",
+                (QUEUED, error, now, job_id),
+            )
+            return
+        self._conn().execute(
+            "update jobs set status = ?, result = ?, error = ?, payload = null, updated_at = ?,"
+            " expires_at = ? where id = ?",
+            (FAILED if error else DONE, json.dumps(result) if result is not None else None,
+             error, now, now + self.ttl, job_id),
+        )
+
+    def get(self, job_id: str) -> Optional[Dict[str, Any]]:
+        row = self._conn().execute(
+            "select id, kind, status, result, error, attempts, created_at, updated_at from jobs where id = ?",
+            (job_id,),
+        ).fetchone()
+        return self._view(row) if row else None
+
+    def cleanup(self) -> int:
+        """Delete expired jobs; returns how many were removed."""
+        cur = self._conn().execute(
+            "delete from jobs where expires_at < ? and status in (?, ?)", (time.time(), DONE, FAILED)
+        )
+        return cur.rowcount
+
+    @staticmethod
+    def _view(row: sqlite3.Row) -> Dict[str, Any]:
+        return {
+            "job_id": row["id"],
+            "kind": row["kind"],
+            "status": row["status"],
+            "result": json.loads(row["result"]) if row["result"] else None,
+            "error": row["error"],
+            "attempts": row["attempts"],
+            "created_at": row["created_at"],
+            "updated_at": row["updated_at"],
+        }
+
+
+class JobWorkerPool:
+    """
+    Background threads that claim jobs from the store and run the handler
+    registered for their kind. Handlers get (payload, params) and return a
+    JSON-serializable result. One extra thread expires old jobs.
+    """
+
+    def __init__(self, store: JobStore, handlers: Dict[str, Callable[[bytes, Dict[str, Any]], Any]],
+                 workers: int = JOB_WORKERS, max_attempts: int = JOB_MAX_ATTEMPTS):
+        self.store = store
+        self.handlers = handlers
+        self.workers = workers
+        self.max_attempts = max_attempts
+        self._stop = threading.Event()
+        self._threads = []
+
+    def start(self):
+        if self._threads:
+            return
+        for i in range(self.workers):
+            t = threading.Thread(target=self._loop, name=f"job-worker-{i}", daemon=True)
+            t.start()
+            self._threads.append(t)
+        t = threading.Thread(target=self._janitor, name="job-janitor", daemon=True)
+        t.start()
+        self._threads.append(t)
+
+    def stop(self, timeout: float = 5.0):
+        self._stop.set()
+        for t in self._threads:
+            t.join(timeout)
+        self._threads = []
+
+    def _loop(self):
+        while not self._stop.is_set():
+            try:
+                job = self.store.claim()
+            except sqlite3.OperationalError:
+                job = None
+            if job is None:
+                self._stop.wait(JOB_POLL_INTERVAL)
+                continue
+            self._run(job)
+
+    def _renew(self, job_id: str, done: threading.Event):
+        while not done.wait(JOB_LEASE_SECONDS / 3):
+            try:
+                self.store.heartbeat(job_id)
+            except sqlite3.OperationalError:
+                pass
+
+    def _run(self, job: sqlite3.Row):
+        done = threading.Event()
+        threading.Thread(target=self._renew, args=(job["id"], done), name="job-lease", daemon=True).start()
+        try:
+            handler = self.handlers[job["kind"]]
+            result = handler(job["payload"], json.loads(job["params"]))
+            done.set()
+            self.store.finish(job["id"], result=result)
+        except Exception as e:
+            done.set()
+            retry = job["attempts"] < self.max_attempts
+            print(f"⚠️ Job {job['id']} failed (attempt {job['attempts']}): {e}")
+            self.store.finish(job["id"], error=str(e), retry=retry)
+            if retry:
+                return
+        if job["webhook_url"]:
+            _notify(job["webhook_url"], self.store.get(job["id"]))
+
+    def _janitor(self):
+        while not self._stop.wait(60):
+            try:
+                removed = self.store.cleanup()
+                if removed:
+                    print(f"🧹 Removed {removed} expired jobs")
+            except sqlite3.OperationalError:
+                pass
+
+
+def validate_webhook_url(url: str) -> str:
+    """
+    Reject webhook targets that would make the server call into its own
+    network: non-HTTPS URLs (unless JOB_WEBHOOK_ALLOW_HTTP=1), hosts outside
+    JOB_WEBHOOK_ALLOWED_HOSTS when set, and hosts that resolve to private,
+    loopback, link-local or otherwise non-public addresses.
+    """
+    _resolve_webhook(url)
+    return url
+
+
+def _resolve_webhook(url: str) -> Tuple[urllib.parse.ParseResult, str]:
+    """Validate the webhook URL and return it parsed with the address to connect to."""
+    parsed = urllib.parse.urlparse(url or "")
+    schemes = ("https", "http") if JOB_WEBHOOK_ALLOW_HTTP else ("https",)
+    if parsed.scheme not in schemes or not parsed.hostname:
+        raise ValueError(f"Webhook URL must be {' or '.join(schemes)} with a host.")
+    host = parsed.hostname.lower()
+    if JOB_WEBHOOK_ALLOWED_HOSTS and host not in JOB_WEBHOOK_ALLOWED_HOSTS:
+        raise ValueError(f"Webhook host {host} is not allowed.")
+    try:
+        infos = socket.getaddrinfo(host, parsed.port or (443 if parsed.scheme == "https" else 80))
+    except socket.gaierror:
+        raise ValueError(f"Webhook host {host} does not resolve.")
+    for info in infos:
+        if not ipaddress.ip_address(info[4][0].split("%")[0]).is_global:
+            raise ValueError(f"Webhook host {host} resolves to a non-public address.")
+    return parsed, infos[0][4][0]
+
+
+class _PinnedHTTPConnection(http.client.HTTPConnection):
+    """HTTPConnection to an already validated IP; the Host header keeps the URL's host."""
+
+    def __init__(self, host: str, ip: str, **kwargs):
+        super().__init__(host, **kwargs)
+        self._ip = ip
+
+    def connect(self):
+        self.sock = socket.create_connection((self._ip, self.port), self.timeout)
+
+
+class _PinnedHTTPSConnection(http.client.HTTPSConnection):
+    """HTTPSConnection to an already validated IP; SNI and certificate check use the URL's host."""
+
+    def __init__(self, host: str, ip: str, **kwargs):
+        self._tls = ssl.create_default_context()
+        super().__init__(host, context=self._tls, **kwargs)
+        self._ip = ip
+
+    def connect(self):
+        sock = socket.create_connection((self._ip, self.port), self.timeout)
+        self.sock = self._tls.wrap_socket(sock, server_hostname=self.host)
+
+
+def _notify(url: str, job: Dict[str, Any]):
+    """
+    POST the final job view to the webhook (best effort). The host is
+    re-validated at send time and the request goes to exactly the address
+    that passed validation (no second DNS lookup); redirects are not followed.
+    """
+    try:
+        parsed, ip = _resolve_webhook(url)
+        pinned = _PinnedHTTPSConnection if parsed.scheme == "https" else _PinnedHTTPConnection
+        conn = pinned(parsed.hostname, ip, port=parsed.port, timeout=10)
+        try:
+            path = (parsed.path or "/") + (f"?{parsed.query}" if parsed.query else "")
+            conn.request("POST", path, body=json.dumps(job).encode("utf-8"),
+                         headers={"Content-Type": "application/json"})
+            resp = conn.getresponse()
+            if 300 <= resp.status < 400:
+                raise ValueError(f"refused redirect ({resp.status}) to {resp.getheader('Location')}")
+            if resp.status >= 400:
+                raise ValueError(f"HTTP {resp.status}")
+        finally:
+            conn.close()
+    except Exception as e:
+        print(f"⚠️ Webhook {url} failed: {e}")
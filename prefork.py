@@ -0,0 +1,149 @@
+# prefork.py
+"""
+Fork-after-load serving support.
+
+With PRELOAD_MODELS=1, gunicorn imports api_server (and so tools.py: CLIP,
+MiniLM, FAISS) once in the master and then forks the workers. Model
+weights are then shared copy-on-write instead of being loaded N times.
+Two things keep those pages shared:
+
+* model tensors are moved to shared memory (MAP_SHARED), so the allocator
+  never copies them, and
+* gc.freeze() moves every object loaded so far to a permanent generation,
+  so collections in the workers do not write to their headers.
+
+    python prefork.py <master_pid>     # per-worker RSS / PSS / USS summary
+"""
+import gc
+import os
+import sys
+from typing import Dict, Iterable, List
+
+PRELOAD_ENV = "PRELOAD_MODELS"
+# Set while the master loads models: torch stays single-threaded so no
+# OpenMP pool exists at fork time (libgomp pools do not survive fork).
+LOADING_ENV = "PREFORK_LOADING"
+
+_frozen = False
+
+
+def preload_enabled() -> bool:
+    return os.getenv(PRELOAD_ENV, "0") == "1"
+
+
+def share_module_tensors(modules: Iterable) -> int:
+    """Move parameters/buffers of torch modules into shared memory; returns bytes moved."""
+    total = 0
+    for module in modules:
+        if module is None or not hasattr(module, "parameters"):
+            continue
+        for tensor in list(module.parameters()) + list(module.buffers()):
+            if tensor.device.type == "cpu":
+                tensor.data.share_memory_()
+                total += tensor.numel() * tensor.element_size()
+    return total
+
+
+def _loaded_torch_modules() -> List:
+    """CLIP and the MiniLM sentence-transformer held by tools.py, if loaded."""
+    tools = sys.modules.get("tools")
+    if tools is None:
+        return []
+    registry = tools.model_registry
+    embedder = registry.peek("embedder")
+    modules = [registry.peek("clip_model"), getattr(embedder, "client", None)]  # HuggingFaceEmbeddings -> SentenceTransformer
+    return [m for m in modules if m is not None]
+
+
+def freeze_for_fork() -> Dict[str, float]:
+    """Call in the master after the app is loaded and before the first fork."""
+    global _frozen
+    if _frozen:
+        return {}
+    tools = sys.modules.get("tools")
+    if tools is not None:
+        # Everything must be resident before forking. Evicting a shared page in
+        # one worker frees nothing, so preloaded models are pinned.
+        tools.model_registry.load_all()
+        tools.model_registry.pin_all()
+    shared = share_module_tensors(_loaded_torch_modules())
+    gc.collect()
+    gc.freeze()
+    _frozen = True
+    return {"shared_tensor_mb": shared / 2**20, "frozen_objects": gc.get_freeze_count()}
+
+
+def after_fork(threads: int):
+    """In the worker: leave loading mode and give torch its real thread budget."""
+    os.environ.pop(LOADING_ENV, None)
+    if "torch" in sys.modules:
+        from topology import configure_torch
+        configure_torch(sys.modules["torch"], threads)
+
+
+# -----------------------------
+# 🔹 Memory Reporting
+# -----------------------------
+def memory_report(pid="self") -> Dict[str, float]:
+    """
+    RSS / PSS / USS (private) / shared memory of a process in MB, from
+    /proc/<pid>/smaps_rollup (Linux). PSS splits shared pages across the
+    processes mapping them, so the sum of worker PSS is the real footprint.
+    """
+    fields = {}
+    try:
+        with open(f"/proc/{pid}/smaps_rollup", encoding="utf-8") as f:
+            for line in f:
+                parts = line.split()
+                if len(parts) >= 3 and parts[-1] == "kB":
+                    fields[parts[0].rstrip(":")] = int(parts[1]) / 1024
+    except OSError:
+        return {}
+    return {
+        "rss_mb": fields.get("Rss", 0.0),
+        "pss_mb": fields.get("Pss", 0.0),
+        "uss_mb": fields.get("Private_Clean", 0.0) + fields.get("Private_Dirty", 0.0),
+        "shared_mb": fields.get("Shared_Clean", 0.0) + fields.get("Shared_Dirty", 0.0),
+    }
+
+
+def child_pids(pid: int) -> List[int]:
+    children = []
+    try:
+        for tid in os.listdir(f"/proc/{pid}/task"):
+            with open(f"/proc/{pid}/task/{tid}/children", encoding="utf-8") as f:
+                children.extend(int(c) for c in f.read().split())
+    except OSError:
+        pass
+    return sorted(set(children))
+
+
+def summarize(master_pid: int) -> Dict[str, object]:
+    """Per-worker overhead (USS) vs what is shared with the master."""
+    master = memory_report(master_pid)
+    workers = {pid: memory_report(pid) for pid in child_pids(master_pid)}
+    total_pss = master.get("pss_mb", 0.0) + sum(w.get("pss_mb", 0.0) for w in workers.values())
+    return {
+        "master": master,
+        "workers": workers,
+        "total_pss_mb": total_pss,
+        "avg_worker_uss_mb": (sum(w.get("uss_mb", 0.0) for w in workers.values()) / len(workers)) if workers else 0.0,
+    }
+
+
+def main(argv=None):
+    argv = argv if argv is not None else sys.argv[1:]
+    if not argv:
+        print("Usage: python prefork.py <gunicorn_master_pid>", file=sys.stderr)
+        sys.exit(1)
+    report = summarize(int(argv[0]))
+    m = report["master"]
+    print(f"{'pid':>8} {'rss MB':>9} {'pss MB':>9} {'uss MB':>9} {'shared MB':>10}")
+    print(f"{'master':>8} {m.get('rss_mb', 0):>9.1f} {m.get('pss_mb', 0):>9.1f} {m.get('uss_mb', 0):>9.1f} {m.get('shared_mb', 0):>10.1f}")
+    for pid, w in report["workers"].items():
+        print(f"{pid:>8} {w.get('rss_mb', 0):>9.1f} {w.get('pss_mb', 0):>9.1f} {w.get('uss_mb', 0):>9.1f} {w.get('shared_mb', 0):>10.1f}")
+    print(f"\n📦 Total PSS: {report['total_pss_mb']:.1f} MB — per-worker overhead (USS): {report['avg_worker_uss_mb']:.1f} MB")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,85 @@
+#!/usr/bin/env python3
+"""
+Bake model weights for offline, fast cold starts (used by the Dockerfile).
+
+    python prepare_models.py --out models            # CLIP + MiniLM as safetensors
+    python prepare_models.py --out models --onnx     # + ONNX export of MiniLM
+
+Each model is downloaded from the Hub once and re-saved under --out as
+safetensors, which are memory-mapped at load time instead of unpickled.
+Point the app at the baked copies and switch the Hub off:
+
+    CLIP_MODEL_ID=models/clip EMBED_MODEL_ID=models/minilm HF_HUB_OFFLINE=1
+    EMBED_BACKEND=onnx    # only with --onnx
+
+--onnx needs `pip install "sentence-transformers[onnx]"` (>= 3.2). CLIP
+stays on torch: the image path runs the full PyTorch model.
+"""
+import os
+import sys
+import time
+import argparse
+
+from vision import CLIP_HUB_ID
+from chunking import EMBED_HUB_ID
+
+
+def prepare_clip(out_dir: str, model_id: str = CLIP_HUB_ID) -> str:
+    from transformers import CLIPModel, CLIPProcessor
+
+    CLIPModel.from_pretrained(model_id).save_pretrained(out_dir, safe_serialization=True)
+    CLIPProcessor.from_pretrained(model_id).save_pretrained(out_dir)
+    return out_dir
+
+
+def prepare_minilm(out_dir: str, model_id: str = EMBED_HUB_ID, onnx: bool = False) -> str:
+    from sentence_transformers import SentenceTransformer
+
+    SentenceTransformer(model_id, device="cpu").save_pretrained(out_dir, safe_serialization=True)
+    if onnx:
+        # Loading with backend="onnx" exports the graph; saving writes onnx/model.onnx.
+        SentenceTransformer(out_dir, device="cpu", backend="onnx").save_pretrained(out_dir)
+    return out_dir
+
+
+def verify(clip_dir: str, minilm_dir: str, onnx: bool = False):
+    """Reload both models with the Hub disabled, as the runtime will."""
+    os.environ["HF_HUB_OFFLINE"] = "1"
+    from transformers import CLIPModel, CLIPProcessor
+    from sentence_transformers import SentenceTransformer
+
+    CLIPModel.from_pretrained(clip_dir)
+    CLIPProcessor.from_pretrained(clip_dir)
+    st = SentenceTransformer(minilm_dir, device="cpu", **({"backend": "onnx"} if onnx else {}))
+    st.encode(["offline check"])
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="Download and pre-convert model weights for offline serving.")
+    parser.add_argument("--out", default="models", help="Output directory")
+    parser.add_argument("--onnx", action="store_true", help="Also export MiniLM to ONNX")
+    parser.add_argument("--skip-verify", action="store_true", help="Do not reload the models offline")
+    args = parser.parse_args(argv)
+
+    clip_dir = os.path.join(args.out, "clip")
+    minilm_dir = os.path.join(args.out, "minilm")
+
+    start = time.perf_counter()
+    print(f"⬇️  {CLIP_HUB_ID} -> {clip_dir}")
+    prepare_clip(clip_dir)
+    print(f"⬇️  {EMBED_HUB_ID} -> {minilm_dir}{' (+ ONNX)' if args.onnx else ''}")
+    try:
+        prepare_minilm(minilm_dir, onnx=args.onnx)
+    except ImportError as e:
+        print(f"❌ ONNX export needs `pip install \"sentence-transformers[onnx]\"`: {e}", file=sys.stderr)
+        sys.exit(1)
+
+    if not args.skip_verify:
+        verify(clip_dir, minilm_dir, onnx=args.onnx)
+    print(f"✅ Models ready in {time.perf_counter() - start:.0f}s")
+    print(f"   CLIP_MODEL_ID={clip_dir} EMBED_MODEL_ID={minilm_dir} HF_HUB_OFFLINE=1"
+          + (" EMBED_BACKEND=onnx" if args.onnx else ""))
+
+
+if __name__ == "__main__":
+    main()
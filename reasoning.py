@@ -0,0 +1,256 @@
+# reasoning.py
+import os
+import time
+from dataclasses import dataclass, field, asdict
+from typing import Dict, Any, List, Optional, Tuple
+
+# -----------------------------
+# 🔹 Response Mode Config
+# -----------------------------
+THINK_OPEN = "<think>"
+THINK_CLOSE = "</think>"
+
+# Reasoning model (DeepSeek-R1) for clinical / image explanations,
+# non-reasoning model for plain chat turns.
+REASONING_MODEL = os.getenv("HF_REASONING_MODEL", "deepseek-ai/DeepSeek-R1-0528:novita")
+CHAT_MODEL = os.getenv("HF_CHAT_MODEL", "deepseek-ai/DeepSeek-V3-0324:novita")
+
+REASONING_MAX_TOKENS = int(os.getenv("REASONING_MAX_TOKENS", "600"))
+ANSWER_MAX_TOKENS = int(os.getenv("ANSWER_MAX_TOKENS", "400"))
+
+# Shown instead of an empty string when a response is reasoning only.
+NO_ANSWER_FALLBACK = "⚠️ The model did not produce a final answer. Please try again."
+
+
+def split_reasoning(content: str) -> Tuple[str, str]:
+    """Split a complete response into (reasoning, answer) using <think> tags."""
+    parser = ThinkParser()
+    parser.feed(content or "")
+    parser.close()
+    return parser.reasoning, parser.answer
+
+
+def strip_reasoning(content: str) -> str:
+    """Return only the answer part of a response (a fallback notice if there is none)."""
+    reasoning, answer = split_reasoning(content)
+    if answer.strip():
+        return answer.strip()
+    return NO_ANSWER_FALLBACK if reasoning.strip() else (content or "").strip()
+
+
+class ThinkParser:
+    """
+    Incremental parser for <think>...</think> sections.
+    Chunks may split a tag anywhere, so a partial tag is held back until the
+    next chunk decides it. An unterminated <think> counts as reasoning.
+    R1 chat templates may pre-fill the opening <think>, so the output has
+    only a closing tag: a </think> before any <think> turns everything
+    parsed so far into reasoning (`prefilled` is then set).
+    """
+
+    def __init__(self):
+        self.in_think = False
+        self.seen_tag = False
+        self.prefilled = False
+        self.reasoning = ""
+        self.answer = ""
+        self._pending = ""
+
+    def feed(self, chunk: str) -> Tuple[str, str]:
+        """Consume a chunk; return the (reasoning, answer) text it produced."""
+        text = self._pending + (chunk or "")
+        self._pending = ""
+        new_reasoning, new_answer = [], []
+
+        while text:
+            tags = [THINK_CLOSE] if self.in_think else [THINK_OPEN]
+            if not self.seen_tag:
+                tags.append(THINK_CLOSE)  # an unmatched close is still possible
+            found = [(text.find(t), t) for t in tags if text.find(t) != -1]
+            if not found:
+                keep = max(_partial_tag_suffix(text, t) for t in tags)
+                body, self._pending = (text[:-keep], text[-keep:]) if keep else (text, "")
+                (new_reasoning if self.in_think else new_answer).append(body)
+                break
+            idx, tag = min(found)
+            if tag == THINK_CLOSE and not self.in_think:
+                # Pre-filled <think>: all answer so far was reasoning.
+                moved = self.answer + "".join(new_answer) + text[:idx]
+                self.answer, new_answer = "", []
+                new_reasoning.append(moved)
+                self.prefilled = True
+            else:
+                (new_reasoning if self.in_think else new_answer).append(text[:idx])
+                self.in_think = not self.in_think
+            self.seen_tag = True
+            text = text[idx + len(tag):]
+
+        r, a = "".join(new_reasoning), "".join(new_answer)
+        self.reasoning += r
+        self.answer += a
+        return r, a
+
+    def close(self) -> Tuple[str, str]:
+        """Flush any held-back partial tag as plain text."""
+        pending, self._pending = self._pending, ""
+        if not pending:
+            return "", ""
+        if self.in_think:
+            self.reasoning += pending
+            return pending, ""
+        self.answer += pending
+        return "", pending
+
+
+def _partial_tag_suffix(text: str, tag: str) -> int:
+    """Length of the longest suffix of text that is a prefix of tag."""
+    for n in range(min(len(tag) - 1, len(text)), 0, -1):
+        if text.endswith(tag[:n]):
+            return n
+    return 0
+
+
+# -----------------------------
+# 🔹 Budgeted Completion
+# -----------------------------
+@dataclass
+class ModelResponse:
+    answer: str
+    model: str
+    reasoning: str = ""
+    answer_tokens: int = 0
+    reasoning_tokens: int = 0
+    time_to_answer: Optional[float] = None
+    total_time: float = 0.0
+    truncated: Dict[str, bool] = field(default_factory=lambda: {"reasoning": False, "answer": False})
+
+    def stats(self) -> Dict[str, Any]:
+        """Reportable metadata (everything except the text itself)."""
+        data = asdict(self)
+        data.pop("answer")
+        data.pop("reasoning")
+        return data
+
+
+def complete(
+    client,
+    messages: List[Dict[str, str]],
+    model: str = REASONING_MODEL,
+    temperature: float = 0.2,
+    reasoning_budget: int = REASONING_MAX_TOKENS,
+    answer_budget: int = ANSWER_MAX_TOKENS,
+) -> ModelResponse:
+    """
+    Stream a chat completion and separate reasoning from answer on the fly.
+    Each streamed delta is counted as one token. If the reasoning budget is
+    exhausted before the answer starts, the stream is dropped and the turn is
+    retried on the non-reasoning CHAT_MODEL. The answer is cut at answer_budget.
+    On a reasoning model, untagged text before any tag is undecided: it
+    becomes reasoning if a pre-filled template's bare </think> follows, and
+    it counts against the reasoning budget meanwhile. A reasoning stream that
+    ends (or hits the budget) without any tag is treated as truncated
+    reasoning, so it falls back instead of being returned as the answer.
+    """
+    start = time.perf_counter()
+    parser = ThinkParser()
+    result = ModelResponse(answer="", model=model)
+    undecided = 0
+    undecided_ends: List[int] = []  # len(parser.answer) after each undecided delta
+    undecided_since: Optional[float] = None
+    separate_reasoning = False
+
+    stream = client.chat.completions.create(
+        model=model,
+        messages=messages,
+        temperature=temperature,
+        max_tokens=reasoning_budget + answer_budget,
+        stream=True,
+    )
+    try:
+        for event in stream:
+            if not event.choices:
+                continue
+            delta = event.choices[0].delta
+            text = getattr(delta, "content", None) or ""
+            # Some providers send reasoning in a separate field instead of tags.
+            extra = getattr(delta, "reasoning_content", None) or ""
+            if extra:
+                parser.reasoning += extra
+                result.reasoning_tokens += 1
+                separate_reasoning = True
+            if not text:
+                continue
+
+            new_reasoning, new_answer = parser.feed(text)
+            if undecided and (parser.seen_tag or separate_reasoning):
+                # The first tag (or a reasoning field) settles the untagged prefix.
+                undecided_cut = None
+                if parser.prefilled:
+                    result.reasoning_tokens += undecided
+                else:
+                    result.answer_tokens += undecided
+                    result.time_to_answer = undecided_since
+                    if undecided > answer_budget:
+                        undecided_cut = undecided_ends[answer_budget - 1]
+                undecided = 0
+                undecided_ends.clear()
+                if undecided_cut is not None:
+                    parser.answer = parser.answer[:undecided_cut]
+                    result.answer_tokens = answer_budget
+                    result.truncated["answer"] = True
+                    break
+            if new_reasoning or (parser.in_think and not new_answer):
+                result.reasoning_tokens += 1
+            if new_answer.strip():
+                if reasoning_budget and not (parser.seen_tag or separate_reasoning):
+                    undecided += 1
+                    undecided_ends.append(len(parser.answer))
+                    if undecided_since is None:
+                        undecided_since = time.perf_counter() - start
+                    if undecided >= reasoning_budget:
+                        break
+                    continue
+                if result.time_to_answer is None:
+                    result.time_to_answer = time.perf_counter() - start
+                result.answer_tokens += 1
+
+            if result.answer_tokens == 0 and result.reasoning_tokens and result.reasoning_tokens >= reasoning_budget:
+                result.truncated["reasoning"] = True
+                break
+            if result.answer_tokens >= answer_budget:
+                result.truncated["answer"] = True
+                break
+    finally:
+        close = getattr(stream, "close", None)
+        if close:
+            close()
+
+    parser.close()
+    if undecided:
+        # No tag ever came from a reasoning model: most likely pre-filled
+        # reasoning cut off by the budget or max_tokens, never an answer.
+        parser.reasoning += parser.answer
+        parser.answer = ""
+        result.reasoning_tokens += undecided
+        result.truncated["reasoning"] = True
+    result.reasoning = parser.reasoning.strip()
+    result.answer = parser.answer.strip()
+
+    # Reasoning ran out of budget, or ended without any answer: retry without reasoning.
+    no_answer = bool(result.reasoning) and not result.answer and not result.truncated["answer"]
+    if (result.truncated["reasoning"] or no_answer) and model != CHAT_MODEL:
+        fallback = complete(
+            client, messages, model=CHAT_MODEL, temperature=temperature,
+            reasoning_budget=0, answer_budget=answer_budget,
+        )
+        fallback.reasoning = result.reasoning
+        fallback.reasoning_tokens = result.reasoning_tokens
+        fallback.truncated["reasoning"] = True
+        elapsed = time.perf_counter() - start
+        if fallback.time_to_answer is not None:
+            fallback.time_to_answer += elapsed - fallback.total_time
+        fallback.total_time = elapsed
+        return fallback
+
+    result.total_time = time.perf_counter() - start
+    return result
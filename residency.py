@@ -0,0 +1,227 @@
+# residency.py
+import gc
+import os
+import time
+import ctypes
+import threading
+from contextlib import contextmanager
+from typing import Any, Callable, Dict, List, Optional
+
+# -----------------------------
+# 🔹 Config
+# -----------------------------
+# Evict least-recently-used models once process RSS exceeds this (0 = no budget).
+MODEL_RSS_BUDGET_MB = float(os.getenv("MODEL_RSS_BUDGET_MB", "0"))
+# Evict a model not used for this many seconds (0 = never, the default: eviction is opt-in).
+MODEL_IDLE_TIMEOUT = float(os.getenv("MODEL_IDLE_TIMEOUT", "0"))
+MODEL_REAPER_INTERVAL = float(os.getenv("MODEL_REAPER_INTERVAL", "30"))
+
+
+def current_rss_mb() -> float:
+    """Resident set size of this process in MB (Linux /proc, else 0)."""
+    try:
+        with open("/proc/self/statm", encoding="utf-8") as f:
+            pages = int(f.read().split()[1])
+        return pages * os.sysconf("SC_PAGE_SIZE") / 2**20
+    except (OSError, ValueError, AttributeError):
+        return 0.0
+
+
+def _release_memory():
+    """Collect garbage and hand freed heap pages back to the OS (glibc)."""
+    gc.collect()
+    try:
+        ctypes.CDLL("libc.so.6").malloc_trim(0)
+    except (OSError, AttributeError):
+        pass
+
+
+def torch_module_mb(obj) -> float:
+    """Parameter + buffer bytes of a torch module (or an object wrapping one)."""
+    module = obj if hasattr(obj, "parameters") else getattr(obj, "client", None)
+    if module is None or not hasattr(module, "parameters"):
+        return 0.0
+    tensors = list(module.parameters()) + list(module.buffers())
+    return sum(t.numel() * t.element_size() for t in tensors) / 2**20
+
+
+class _Entry:
+    def __init__(self, name: str, loader: Callable[[], Any], idle_timeout: float, pinned: bool,
+                 size_fn: Optional[Callable[[Any], float]]):
+        self.name = name
+        self.loader = loader
+        self.idle_timeout = idle_timeout
+        self.pinned = pinned
+        self.size_fn = size_fn
+        self.value = None
+        self.lock = threading.RLock()
+        self.in_use = 0
+        self.last_used = 0.0
+        self.load_count = 0
+        self.evict_count = 0
+        self.last_load_s = 0.0
+        self.total_load_s = 0.0
+        self.size_mb = 0.0
+
+    @property
+    def resident(self) -> bool:
+        return self.value is not None
+
+
+class ModelRegistry:
+    """
+    Lazily loaded, evictable models. get() loads on demand and records load
+    latency and footprint (torch parameter bytes, else the RSS delta of the
+    load). After each load the RSS budget is enforced by evicting the least
+    recently used idle models, and a reaper thread evicts models idle for
+    longer than their timeout.
+    """
+
+    def __init__(self, budget_mb: float = MODEL_RSS_BUDGET_MB, idle_timeout: float = MODEL_IDLE_TIMEOUT,
+                 reaper_interval: float = MODEL_REAPER_INTERVAL):
+        self.budget_mb = budget_mb
+        self.idle_timeout = idle_timeout
+        self.reaper_interval = reaper_interval
+        self._entries: Dict[str, _Entry] = {}
+        self._lock = threading.Lock()
+        self._reaper_pid: Optional[int] = None
+
+    def register(self, name: str, loader: Callable[[], Any], idle_timeout: Optional[float] = None,
+                 pinned: bool = False, size_fn: Optional[Callable[[Any], float]] = None):
+        self._entries[name] = _Entry(
+            name, loader, self.idle_timeout if idle_timeout is None else idle_timeout, pinned, size_fn
+        )
+
+    def get(self, name: str) -> Any:
+        entry = self._entries[name]
+        self._ensure_reaper()
+        with entry.lock:
+            entry.last_used = time.monotonic()
+            if entry.value is not None:
+                return entry.value
+            before = current_rss_mb()
+            start = time.perf_counter()
+            value = entry.loader()
+            entry.last_load_s = time.perf_counter() - start
+            entry.total_load_s += entry.last_load_s
+            entry.load_count += 1
+            entry.value = value
+            measured = entry.size_fn(value) if entry.size_fn else 0.0
+            entry.size_mb = measured or max(0.0, current_rss_mb() - before)
+            kind = "Reloaded" if entry.load_count > 1 else "Loaded"
+            print(f"📦 {kind} {name} in {entry.last_load_s:.2f}s (~{entry.size_mb:.0f} MB)")
+        self.enforce_budget(keep=name)
+        return value
+
+    def peek(self, name: str) -> Any:
+        """The resident value, without loading or touching LRU order."""
+        entry = self._entries.get(name)
+        return entry.value if entry else None
+
+    @contextmanager
+    def use(self, name: str):
+        """Hold a model for the duration of a call so it cannot be evicted mid-use."""
+        entry = self._entries[name]
+        with entry.lock:
+            entry.in_use += 1
+        try:
+            yield self.get(name)
+        finally:
+            with entry.lock:
+                entry.in_use -= 1
+                entry.last_used = time.monotonic()
+
+    def load_all(self):
+        for name in self._entries:
+            self.get(name)
+
+    def pin_all(self):
+        for entry in self._entries.values():
+            entry.pinned = True
+
+    def evict(self, name: str, reason: str = "manual") -> bool:
+        entry = self._entries[name]
+        with entry.lock:
+            if entry.value is None or entry.in_use or entry.pinned:
+                return False
+            entry.value = None
+            entry.evict_count += 1
+        _release_memory()
+        print(f"🧹 Evicted {name} ({reason}, ~{entry.size_mb:.0f} MB)")
+        return True
+
+    def enforce_budget(self, keep: Optional[str] = None):
+        if not self.budget_mb:
+            return
+        candidates = sorted(
+            (e for e in self._entries.values() if e.resident and e.name != keep),
+            key=lambda e: e.last_used,
+        )
+        for entry in candidates:
+            if current_rss_mb() <= self.budget_mb:
+                break
+            self.evict(entry.name, reason="rss budget")
+
+    def evict_idle(self):
+        now = time.monotonic()
+        for entry in list(self._entries.values()):
+            if entry.resident and entry.idle_timeout and now - entry.last_used > entry.idle_timeout:
+                self.evict(entry.name, reason="idle")
+
+    def _ensure_reaper(self):
+        # Threads do not survive fork, so each process starts its own reaper.
+        if self._reaper_pid == os.getpid() or not self.reaper_interval:
+            return
+        with self._lock:
+            if self._reaper_pid == os.getpid():
+                return
+            self._reaper_pid = os.getpid()
+            threading.Thread(target=self._reap, name="model-reaper", daemon=True).start()
+
+    def _reap(self):
+        while True:
+            time.sleep(self.reaper_interval)
+            try:
+                self.evict_idle()
+                self.enforce_budget()
+            except Exception as e:
+                print(f"⚠️ Model reaper error: {e}")
+
+    def stats(self) -> Dict[str, Any]:
+        now = time.monotonic()
+        models: List[Dict[str, Any]] = []
+        for e in self._entries.values():
+            models.append({
+                "name": e.name,
+                "resident": e.resident,
+                "pinned": e.pinned,
+                "in_use": e.in_use,
+                "size_mb": round(e.size_mb, 1),
+                "idle_s": round(now - e.last_used, 1) if e.last_used else None,
+                "idle_timeout_s": e.idle_timeout,
+                "load_count": e.load_count,
+                "evict_count": e.evict_count,
+                "last_load_s": round(e.last_load_s, 3),
+                "avg_load_s": round(e.total_load_s / e.load_count, 3) if e.load_count else None,
+            })
+        return {"rss_mb": round(current_rss_mb(), 1), "budget_mb": self.budget_mb, "models": models}
+
+
+class LazyModel:
+    """
+    Stand-in for a registry entry: attribute access and calls go to the
+    resident model, loading it first if it was evicted. Only a call holds
+    the model; code that touches several attributes in a row should hold it
+    with registry.use(name) instead.
+    """
+
+    def __init__(self, registry: ModelRegistry, name: str):
+        object.__setattr__(self, "_registry", registry)
+        object.__setattr__(self, "_name", name)
+
+    def __getattr__(self, attr):
+        return getattr(self._registry.get(self._name), attr)
+
+    def __call__(self, *args, **kwargs):
+        with self._registry.use(self._name) as model:
+            return model(*args, **kwargs)
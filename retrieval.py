@@ -0,0 +1,217 @@
+# retrieval.py
+import os
+import re
+import time
+import threading
+from collections import OrderedDict
+from contextlib import nullcontext
+from typing import Any, Callable, ContextManager, Dict, List, Optional, Tuple
+
+import numpy as np
+from langchain_core.documents import Document
+
+# -----------------------------
+# 🔹 Config
+# -----------------------------
+RAG_STORE_DIR = "rag_store"
+RETRIEVAL_K = int(os.getenv("RETRIEVAL_K", "5"))
+RETRIEVAL_CACHE_SIZE = int(os.getenv("RETRIEVAL_CACHE_SIZE", "256"))
+RETRIEVAL_CACHE_TTL = float(os.getenv("RETRIEVAL_CACHE_TTL", "3600"))
+
+# Context compression: keep at most this many sentences per chunk, and only
+# those at least this similar to the question.
+COMPRESS_MAX_SENTENCES = int(os.getenv("COMPRESS_MAX_SENTENCES", "3"))
+COMPRESS_MIN_SIMILARITY = float(os.getenv("COMPRESS_MIN_SIMILARITY", "0.25"))
+
+_SENTENCE_RE = re.compile(r"(?<=[.!?])\s+(?=[A-Z0-9\"'(\[])")
+
+
+def index_version(store_dir: str = RAG_STORE_DIR) -> str:
+    """Cheap version stamp of the on-disk FAISS store (size + mtime of its files)."""
+    parts = []
+    for name in ("index.faiss", "index.pkl"):
+        path = os.path.join(store_dir, name)
+        try:
+            st = os.stat(path)
+            parts.append(f"{name}:{st.st_size}:{st.st_mtime_ns}")
+        except OSError:
+            parts.append(f"{name}:missing")
+    return "|".join(parts)
+
+
+class LRUCache:
+    """Thread-safe LRU cache with per-entry TTL."""
+
+    def __init__(self, maxsize: int = RETRIEVAL_CACHE_SIZE, ttl: float = RETRIEVAL_CACHE_TTL):
+        self.maxsize = maxsize
+        self.ttl = ttl
+        self._data: "OrderedDict[Any, Tuple[float, Any]]" = OrderedDict()
+        self._lock = threading.Lock()
+        self.hits = 0
+        self.misses = 0
+
+    def get(self, key):
+        with self._lock:
+            item = self._data.get(key)
+            if item is None or (self.ttl and time.monotonic() - item[0] > self.ttl):
+                if item is not None:
+                    del self._data[key]
+                self.misses += 1
+                return None
+            self._data.move_to_end(key)
+            self.hits += 1
+            return item[1]
+
+    def put(self, key, value):
+        with self._lock:
+            self._data[key] = (time.monotonic(), value)
+            self._data.move_to_end(key)
+            while len(self._data) > self.maxsize:
+                self._data.popitem(last=False)
+
+    def clear(self):
+        with self._lock:
+            self._data.clear()
+
+    def __len__(self):
+        return len(self._data)
+
+
+class CachedRetriever:
+    """
+    Similarity search over a FAISS store, compressed to the relevant
+    sentences, with a (query, index version) -> context cache. The query is
+    embedded once per miss and that vector serves both the search and the
+    compression; a hit embeds nothing. The cache is dropped whenever the
+    index version changes.
+
+    hold: returns a context manager yielding the store (registry.use), so an
+    evictable store stays resident for the whole search.
+    """
+
+    def __init__(self, vectordb, embedder, k: int = RETRIEVAL_K,
+                 version_fn: Callable[[], str] = index_version, cache: Optional[LRUCache] = None,
+                 sentence_cache: Optional[LRUCache] = None, compress: bool = True,
+                 hold: Optional[Callable[[], ContextManager]] = None):
+        self.vectordb = vectordb
+        self.hold = hold
+        self.embedder = embedder
+        self.k = k
+        self.version_fn = version_fn
+        self.cache = cache or LRUCache()
+        self.sentence_cache = sentence_cache
+        self.compress = compress
+        self._version = version_fn()
+
+    def _check_version(self) -> str:
+        version = self.version_fn()
+        if version != self._version:
+            print(f"♻️ RAG index changed, clearing retrieval cache ({len(self.cache)} entries)")
+            self.cache.clear()
+            self._version = version
+        return version
+
+    def search(self, query_vec: np.ndarray) -> List[Document]:
+        """Top-k chunks for an already embedded query."""
+        docs = []
+        with (self.hold() if self.hold else nullcontext(self.vectordb)) as vectordb:
+            # FAISS keeps a row -> docstore id map; search by vector so ids come back with the docs.
+            _, rows = vectordb.index.search(np.asarray([query_vec], dtype=np.float32), self.k)
+            for row in rows[0]:
+                if row == -1:
+                    continue
+                doc = vectordb.docstore.search(vectordb.index_to_docstore_id[int(row)])
+                if isinstance(doc, Document):
+                    docs.append(doc)
+        return docs
+
+    def retrieve(self, question: str) -> Tuple[List[Document], Dict[str, Any]]:
+        """Return (context documents, retrieval stats)."""
+        start = time.perf_counter()
+        version = self._check_version()
+        key = (" ".join(question.lower().split()), self.k, version)
+        cached = self.cache.get(key)
+        if cached is not None:
+            docs, raw_chars = cached
+            return docs, {
+                "retrieval_cache_hit": True,
+                "retrieval_ms": (time.perf_counter() - start) * 1000,
+                "compression_ms": 0.0,
+                "context_chars_raw": raw_chars,
+                "context_chars": sum(len(d.page_content) for d in docs),
+            }
+
+        query_vec = np.asarray(self.embedder.embed_query(question), dtype=np.float32)
+        docs = self.search(query_vec)
+        retrieved_at = time.perf_counter()
+        context = (
+            compress_documents(question, docs, self.embedder, sentence_cache=self.sentence_cache, query_vec=query_vec)
+            if self.compress else docs
+        )
+        raw_chars = sum(len(d.page_content) for d in docs)
+        self.cache.put(key, (context, raw_chars))
+        return context, {
+            "retrieval_cache_hit": False,
+            "retrieval_ms": (retrieved_at - start) * 1000,
+            "compression_ms": (time.perf_counter() - retrieved_at) * 1000,
+            "context_chars_raw": raw_chars,
+            "context_chars": sum(len(d.page_content) for d in context),
+        }
+
+
+# -----------------------------
+# 🔹 Extractive Context Compression
+# -----------------------------
+def split_sentences(text: str) -> List[str]:
+    """Sentence split for PDF text (line breaks inside sentences are joined first)."""
+    text = re.sub(r"\s+", " ", text or "").strip()
+    return [s.strip() for s in _SENTENCE_RE.split(text) if s.strip()]
+
+
+def compress_documents(
+    question: str,
+    docs: List[Document],
+    embedder,
+    max_sentences: int = COMPRESS_MAX_SENTENCES,
+    min_similarity: float = COMPRESS_MIN_SIMILARITY,
+    sentence_cache: Optional[LRUCache] = None,
+    query_vec: Optional[np.ndarray] = None,
+) -> List[Document]:
+    """
+    Keep only the sentences of each chunk that are most similar to the question,
+    in their original order. Metadata (source, links) is preserved so citations
+    still resolve. A chunk with no relevant sentence keeps its best one.
+    Pass query_vec when the question is already embedded.
+    """
+    if not docs:
+        return []
+    if query_vec is None:
+        query_vec = embedder.embed_query(question)
+    q = _unit(np.asarray(query_vec, dtype=np.float32))
+    compressed = []
+    for doc in docs:
+        sentences = split_sentences(doc.page_content)
+        if len(sentences) <= max_sentences:
+            compressed.append(doc)
+            continue
+
+        cache_key = hash(doc.page_content)
+        vecs = sentence_cache.get(cache_key) if sentence_cache is not None else None
+        if vecs is None:
+            vecs = _unit(np.asarray(embedder.embed_documents(sentences), dtype=np.float32))
+            if sentence_cache is not None:
+                sentence_cache.put(cache_key, vecs)
+
+        sims = vecs @ q
+        ranked = [i for i in np.argsort(sims)[::-1][:max_sentences] if sims[i] >= min_similarity]
+        keep = sorted(ranked or [int(np.argmax(sims))])
+        compressed.append(Document(
+            page_content=" ".join(sentences[i] for i in keep),
+            metadata=dict(doc.metadata),
+        ))
+    return compressed
+
+
+def _unit(vecs: np.ndarray) -> np.ndarray:
+    norms = np.linalg.norm(vecs, axis=-1, keepdims=True)
+    return vecs / np.maximum(norms, 1e-12)
@@ -0,0 +1,148 @@
+# router.py
+import os
+import time
+from typing import Dict, List, Optional, Tuple
+
+import numpy as np
+
+# -----------------------------
+# 🔹 Routes
+# -----------------------------
+ROUTE_IMAGE = "image"
+ROUTE_GREETING = "greeting"
+ROUTE_OFF_TOPIC = "off_topic"
+ROUTE_CLINICAL = "clinical"
+ROUTE_CHAT = "chat"
+
+# Below this cosine similarity (or margin over the runner-up) the router is
+# unsure and hands the turn to general_chat instead of guessing: a wrong
+# canned refusal costs far more than a chat answer.
+ROUTER_MIN_SCORE = float(os.getenv("ROUTER_MIN_SCORE", "0.35"))
+ROUTER_MIN_MARGIN = float(os.getenv("ROUTER_MIN_MARGIN", "0.08"))
+
+LABELED_EXAMPLES: Dict[str, List[str]] = {
+    ROUTE_GREETING: [
+        "hi",
+        "hello",
+        "hey there",
+        "good morning",
+        "good evening",
+        "how are you?",
+        "thanks",
+        "thank you so much",
+        "bye",
+        "who are you?",
+        "what can you do?",
+    ],
+    ROUTE_OFF_TOPIC: [
+        "what's the weather like today?",
+        "write me a poem about the sea",
+        "who won the football match last night?",
+        "how do I fix my python code?",
+        "recommend a good movie",
+        "what is the capital of France?",
+        "how do I cook jollof rice?",
+        "tell me a joke",
+        "what is the price of bitcoin?",
+        "translate this sentence into Spanish",
+        "which laptop should I buy?",
+        "help me with my math homework",
+    ],
+    ROUTE_CLINICAL: [
+        "what is invasive ductal carcinoma?",
+        "what are the symptoms of breast cancer?",
+        "how is IDC diagnosed?",
+        "what does a suspicious lesion on a mammogram mean?",
+        "what are the treatment options for breast cancer?",
+        "what is the survival rate for stage 2 IDC?",
+        "is a lump in my breast always cancer?",
+        "what is HER2 positive breast cancer?",
+        "how often should I get a mammogram?",
+        "what are the risk factors for breast cancer?",
+        "what is the difference between DCIS and IDC?",
+        "side effects of chemotherapy for breast cancer",
+        "what does BI-RADS 4 mean?",
+        "can men get breast cancer?",
+    ],
+}
+
+GREETING_REPLY = (
+    "Hello! 👋 I'm INVADUCTAR GPT, an assistant for questions about breast cancer "
+    "and invasive ductal carcinoma (IDC). You can ask me a question or upload a "
+    "mammogram image for analysis.\n\n"
+    "I am not a doctor. Please consult a qualified clinician."
+)
+
+OFF_TOPIC_REPLY = (
+    "I can only answer questions about breast cancer and invasive ductal carcinoma.\n\n"
+    "I am not a doctor. Please consult a qualified clinician."
+)
+
+CANNED_REPLIES = {
+    ROUTE_GREETING: GREETING_REPLY,
+    ROUTE_OFF_TOPIC: OFF_TOPIC_REPLY,
+}
+
+
+class QueryRouter:
+    """
+    Nearest-centroid classifier over labeled example queries, using the same
+    MiniLM embedder as the RAG store. Centroids are built on first use.
+    """
+
+    def __init__(self, embedder, examples: Optional[Dict[str, List[str]]] = None,
+                 min_score: float = ROUTER_MIN_SCORE, min_margin: float = ROUTER_MIN_MARGIN):
+        self.embedder = embedder
+        self.examples = examples or LABELED_EXAMPLES
+        self.min_score = min_score
+        self.min_margin = min_margin
+        self._labels: List[str] = []
+        self._centroids: Optional[np.ndarray] = None
+
+    def _build(self):
+        labels, centroids = [], []
+        for label, texts in self.examples.items():
+            vecs = _normalize(np.asarray(self.embedder.embed_documents(texts), dtype=np.float32))
+            centroids.append(_normalize(vecs.mean(axis=0, keepdims=True))[0])
+            labels.append(label)
+        self._labels = labels
+        self._centroids = np.stack(centroids)
+
+    def classify(self, text: str) -> Tuple[str, float, Dict[str, float]]:
+        """
+        Return (route, score, {label: similarity}) for a free-text message.
+        A low-confidence match (score or margin under the thresholds) is
+        routed to chat.
+        """
+        if self._centroids is None:
+            self._build()
+        query = _normalize(np.asarray([self.embedder.embed_query(text)], dtype=np.float32))[0]
+        sims = self._centroids @ query
+        order = np.argsort(sims)[::-1]
+        best, score = self._labels[order[0]], float(sims[order[0]])
+        margin = score - float(sims[order[1]]) if len(order) > 1 else score
+        scores = {self._labels[i]: float(sims[i]) for i in range(len(self._labels))}
+        if score < self.min_score or margin < self.min_margin:
+            return ROUTE_CHAT, score, scores
+        return best, score, scores
+
+    def route(self, text: str) -> Dict[str, object]:
+        """Classify a message and log the decision with its latency."""
+        start = time.perf_counter()
+        if text.strip().upper().startswith("ANALYZE_IMAGE:"):
+            route, score, scores = ROUTE_IMAGE, 1.0, {}
+        elif not text.strip():
+            route, score, scores = ROUTE_GREETING, 1.0, {}
+        else:
+            route, score, scores = self.classify(text)
+        latency_ms = (time.perf_counter() - start) * 1000
+        low_confidence = route == ROUTE_CHAT and bool(scores)
+        note = ", low confidence" if low_confidence else ""
+        print(f"🧭 Route: {route} (score={score:.3f}{note}, {latency_ms:.1f} ms)")
+        return {"route": route, "score": score, "scores": scores, "latency_ms": latency_ms,
+                "low_confidence": low_confidence}
+
+
+def _normalize(vecs: np.ndarray) -> np.ndarray:
+    norms = np.linalg.norm(vecs, axis=1, keepdims=True)
+    return vecs / np.maximum(norms, 1e-12)
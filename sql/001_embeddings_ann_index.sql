@@ -0,0 +1,56 @@
+-- 001_embeddings_ann_index.sql
+-- ANN index + filtered, paginated search for the `embeddings` table.
+-- Embeddings are sentence-transformers/all-MiniLM-L6-v2 (384 dims).
+-- Apply with: psql "$DATABASE_URL" -f sql/001_embeddings_ann_index.sql
+
+create extension if not exists vector;
+
+create table if not exists embeddings (
+  id bigserial primary key,
+  content text not null,
+  metadata jsonb not null default '{}'::jsonb,
+  embedding vector(384) not null
+);
+
+-- HNSW (default): better recall/latency trade-off, no training step.
+create index if not exists embeddings_embedding_hnsw_idx
+  on embeddings using hnsw (embedding vector_cosine_ops)
+  with (m = 16, ef_construction = 64);
+
+-- IVFFlat alternative (faster build, smaller index). Build after the table is
+-- populated; lists ~ rows / 1000. Use instead of the HNSW index above:
+-- create index if not exists embeddings_embedding_ivfflat_idx
+--   on embeddings using ivfflat (embedding vector_cosine_ops)
+--   with (lists = 100);
+
+-- Metadata filters (e.g. {"source": "8577.00.pdf"}) use jsonb containment.
+create index if not exists embeddings_metadata_gin_idx
+  on embeddings using gin (metadata jsonb_path_ops);
+
+analyze embeddings;
+
+-- Filtered, paginated cosine search. ef_search controls HNSW recall
+-- (and ivfflat.probes = ef_search / 4 when the IVFFlat index is used).
+create or replace function match_embeddings_filtered(
+  query_embedding vector(384),
+  match_threshold float default 0.7,
+  match_count int default 5,
+  match_offset int default 0,
+  filter jsonb default '{}'::jsonb,
+  ef_search int default 40
+)
+returns table (id bigint, content text, metadata jsonb, similarity float)
+language plpgsql stable
+as $$
+begin
+  perform set_config('hnsw.ef_search', least(1000, greatest(ef_search, match_count + match_offset))::text, true);
+  perform set_config('ivfflat.probes', greatest(1, ef_search / 4)::text, true);
+  return query
+    select e.id, e.content, e.metadata, 1 - (e.embedding <=> query_embedding) as similarity
+    from embeddings e
+    where e.metadata @> filter
+      and 1 - (e.embedding <=> query_embedding) > match_threshold
+    order by e.embedding <=> query_embedding
+    limit match_count offset match_offset;
+end;
+$$;
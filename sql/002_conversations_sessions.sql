@@ -0,0 +1,13 @@
+-- 002_conversations_sessions.sql
+-- Per-session conversation snapshots for the paginated history API.
+-- Existing rows become the "default" session.
+-- Apply with: psql "$DATABASE_URL" -f sql/002_conversations_sessions.sql
+
+alter table conversations
+  add column if not exists session_id text not null default 'default';
+
+-- Newest snapshot of a session (history head check + full load).
+create index if not exists conversations_session_created_idx
+  on conversations (session_id, created_at desc);
+
+analyze conversations;
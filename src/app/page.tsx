@@ -35,37 +35,81 @@ export default function Home() {
   const [chatSessions, setChatSessions] = useState<ChatSession[]>([]);
   const [currentSessionId, setCurrentSessionId] = useState<string | null>(null);
   const [privacyExpanded, setPrivacyExpanded] = useState(false);
+  // Cursor of the oldest loaded message; null once the start of the history is reached
+  const [prevCursor, setPrevCursor] = useState<string | null>(null);
+  const [loadingEarlier, setLoadingEarlier] = useState(false);
 
   // Load conversation on mount
   useEffect(() => {
     loadConversation();
   }, []);
 
+  const HISTORY_URL = `${API_URL}/api/conversations/default/messages`;
+
+  const toMessages = (raw: any[]): Message[] =>
+    raw
+      .filter((msg: any) => msg.message && msg.message.trim()) // Filter out empty messages
+      .map((msg: any) => ({
+        id: msg.id, // position in the conversation, stable across pages
+        message: msg.message,
+        isUser: msg.isUser,
+        timestamp: msg.timestamp ? new Date(msg.timestamp) : new Date()
+      }));
+
+  const fetchHistoryPage = async (query: string) => {
+    const response = await fetch(`${HISTORY_URL}?${query}`);
+    const data = await response.json();
+    if (!response.ok || !data.success) {
+      throw new Error(data.error || `Server responded with status: ${response.status}`);
+    }
+    return data;
+  };
+
   const loadConversation = async () => {
     try {
-      const response = await fetch(`${API_URL}/api/conversation`);
-      const data = await response.json();
-      
-      if (data.success && data.messages.length > 0) {
-        const formattedMessages = data.messages
-          .filter((msg: any) => msg.message && msg.message.trim()) // Filter out empty messages
-          .map((msg: any, index: number) => ({
-            id: index + 1,
-            message: msg.message,
-            isUser: msg.isUser,
-            timestamp: new Date(msg.timestamp)
-          }));
-        
-        // Only update if we have valid messages
-        if (formattedMessages.length > 0) {
-          setMessages(formattedMessages);
-        }
+      // Newest page only; the browser revalidates it with If-None-Match (304 when unchanged)
+      const data = await fetchHistoryPage('limit=50');
+      const formattedMessages = toMessages(data.messages);
+
+      // Only update if we have valid messages
+      if (formattedMessages.length > 0) {
+        setMessages(formattedMessages);
       }
+      setPrevCursor(data.prev_cursor);
     } catch (error) {
       console.error('Failed to load conversation:', error);
     }
   };
 
+  const loadEarlierMessages = async () => {
+    if (!prevCursor || loadingEarlier) return;
+    setLoadingEarlier(true);
+    try {
+      const data = await fetchHistoryPage(`limit=50&before=${encodeURIComponent(prevCursor)}`);
+      setMessages(prev => [...toMessages(data.messages), ...prev]);
+      setPrevCursor(data.prev_cursor);
+    } catch (error) {
+      console.error('Failed to load earlier messages:', error);
+    } finally {
+      setLoadingEarlier(false);
+    }
+  };
+
+  // A 503 with saved === false still carries the reply; only the history write failed
+  const appendChatReply = (data: any) => {
+    if (!data.success && data.saved !== false) {
+      throw new Error(data.error || 'Failed to get response');
+    }
+    const replies: Message[] = [
+      { id: Date.now() + 1, message: data.response, isUser: false, timestamp: new Date() }
+    ];
+    if (data.saved === false) {
+      console.error('Failed to save conversation:', data.error);
+      replies.push({ id: Date.now() + 2, message: "⚠️ This reply could not be saved to your history.", isUser: false, timestamp: new Date() });
+    }
+    setMessages(prev => [...prev, ...replies]);
+  };
+
   const createNewSession = (firstMessage: string) => {
     const sessionId = Date.now().toString();
     const title = firstMessage.substring(0, 40) + (firstMessage.length > 40 ? '...' : '');
@@ -87,6 +131,7 @@ export default function Home() {
       { id: 1, message: "Hello! I'm INVADUCTAR GPT, your specialized assistant for invasive ductal carcinoma information. I can help you understand breast cancer diagnosis, treatment options, and provide support. How can I assist you today?", isUser: false, timestamp: new Date() }
     ]);
     setCurrentSessionId(null);
+    setPrevCursor(null);
   };
 
   const handleClearAllData = async () => {
@@ -115,6 +160,7 @@ export default function Home() {
         ]);
         setChatSessions([]);
         setCurrentSessionId(null);
+        setPrevCursor(null);
         
         alert('✅ All your data has been permanently deleted from our servers.');
       } else {
@@ -164,18 +210,7 @@ export default function Home() {
       });
 
       const data = await response.json();
-      
-      if (data.success) {
-        const aiResponse: Message = {
-          id: Date.now() + 1,
-          message: data.response,
-          isUser: false,
-          timestamp: new Date()
-        };
-        setMessages(prev => [...prev, aiResponse]);
-      } else {
-        throw new Error(data.error || 'Failed to get response');
-      }
+      appendChatReply(data);
     } catch (error) {
       console.error('Chat error:', error);
       const errorMessage: Message = {
@@ -290,18 +325,7 @@ export default function Home() {
       });
 
       const data = await response.json();
-      
-      if (data.success) {
-        const aiResponse: Message = {
-          id: Date.now() + 1,
-          message: data.response,
-          isUser: false,
-          timestamp: new Date()
-        };
-        setMessages(prev => [...prev, aiResponse]);
-      } else {
-        throw new Error(data.error || 'Failed to get response');
-      }
+      appendChatReply(data);
     } catch (error) {
       console.error('Chat error:', error);
       const errorMessage: Message = {
@@ -794,6 +818,25 @@ export default function Home() {
           ) : (
             // Chat Messages
             <div style={{ maxWidth: '800px', margin: '0 auto', width: '100%' }}>
+              {prevCursor && (
+                <div style={{ textAlign: 'center', marginBottom: '16px' }}>
+                  <button
+                    onClick={loadEarlierMessages}
+                    disabled={loadingEarlier}
+                    style={{
+                      padding: '6px 12px',
+                      background: 'transparent',
+                      border: '1px solid #0f3460',
+                      borderRadius: '6px',
+                      color: '#cbd5e0',
+                      fontSize: '12px',
+                      cursor: loadingEarlier ? 'default' : 'pointer'
+                    }}
+                  >
+                    {loadingEarlier ? 'Loading…' : 'Load earlier messages'}
+                  </button>
+                </div>
+              )}
               {messages.map((msg) => (
                 <ChatMessage
                   key={msg.id}
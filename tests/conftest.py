@@ -0,0 +1,5 @@
+# tests/conftest.py — the app modules live at the repo root
+import os
+import sys
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
@@ -0,0 +1,95 @@
+import csv
+from concurrent.futures import ThreadPoolExecutor
+
+import batch_analyze
+from batch_analyze import COLUMNS, CsvSink, append_checkpoint, completed_paths, explain_results, iter_inputs, to_row
+from vision import IMAGE_LABELS
+
+
+def _analysis(label="normal tissue"):
+    return {"prediction": label, "confidence": 0.9123456789,
+            "scores": {l: (0.9123456789 if l == label else 0.01) for l in IMAGE_LABELS}}
+
+
+def _read(path):
+    with open(path, newline="", encoding="utf-8") as f:
+        return list(csv.DictReader(f))
+
+
+def test_to_row_fills_every_column():
+    row = to_row({"path": "a.png", "analysis": _analysis(), "explanation": "ok"})
+    assert list(row) == COLUMNS
+    assert row["prediction"] == "normal tissue" and row["confidence"] == 0.912346
+    assert row["score_normal tissue"] == 0.912346 and row["error"] == "" and row["explanation"] == "ok"
+
+    failed = to_row({"path": "b.png", "analysis": {"error": "Unable to open image: truncated"}})
+    assert failed["error"].startswith("Unable to open") and failed["prediction"] == "" and failed["confidence"] == ""
+
+
+def test_explain_failure_is_recorded_on_its_row():
+    class Explain:
+        def invoke(self, payload):
+            if payload["result"]["prediction"] == "artifact / poor quality":
+                raise RuntimeError("rate limited")
+            return {"result": "fine"}
+
+    results = [
+        {"path": "a.png", "analysis": _analysis()},
+        {"path": "b.png", "analysis": _analysis("artifact / poor quality")},
+        {"path": "c.png", "analysis": {"error": "Unable to open image"}},
+    ]
+    with ThreadPoolExecutor(max_workers=2) as pool:
+        explain_results(Explain(), pool, results)
+    rows = [to_row(r) for r in results]
+    assert rows[0]["explanation"] == "fine" and rows[0]["error"] == ""
+    assert rows[1]["explanation"] == "" and rows[1]["error"] == "Explanation failed: rate limited"
+    assert rows[2]["error"] == "Unable to open image"
+
+
+def test_csv_sink_trims_a_half_written_row_on_resume(tmp_path):
+    out = tmp_path / "results.csv"
+    sink = CsvSink(str(out), append=False)
+    sink.write([to_row({"path": "a.png", "analysis": _analysis()})])
+    sink.close()
+    with open(out, "a", encoding="utf-8") as f:
+        f.write("b.png,malignant tu")  # crash mid-row
+
+    assert CsvSink.committed_paths(str(out)) == {"a.png"}
+    sink = CsvSink(str(out), append=True)
+    sink.write([to_row({"path": "b.png", "analysis": _analysis()})])
+    sink.close()
+    assert [r["path"] for r in _read(out)] == ["a.png", "b.png"]
+
+
+def test_committed_paths_of_missing_or_empty_output(tmp_path):
+    assert CsvSink.committed_paths(str(tmp_path / "none.csv")) == set()
+    (tmp_path / "empty.csv").write_text("")
+    assert CsvSink.committed_paths(str(tmp_path / "empty.csv")) == set()
+
+
+def test_resume_after_partial_run_neither_loses_nor_repeats_rows(tmp_path):
+    manifest = tmp_path / "inputs.txt"
+    manifest.write_text("".join(f"img{i}.png\n" for i in range(5)))
+    out, checkpoint_path = str(tmp_path / "results.csv"), str(tmp_path / "results.csv.checkpoint")
+
+    # First run: img0/img1 written and checkpointed, img2 written but the
+    # process died before its checkpoint line, img3 half-written.
+    sink = CsvSink(out, append=False)
+    with open(checkpoint_path, "w", encoding="utf-8") as checkpoint:
+        append_checkpoint(checkpoint, sink.write([to_row({"path": f"img{i}.png", "analysis": _analysis()}) for i in range(2)]))
+    sink.write([to_row({"path": "img2.png", "analysis": _analysis()})])
+    sink.close()
+    with open(out, "a", encoding="utf-8") as f:
+        f.write("img3.png,norm")
+
+    done = completed_paths(out, checkpoint_path)
+    assert done == {"img0.png", "img1.png", "img2.png"}
+    todo = [p for p in iter_inputs(str(manifest)) if p not in done]
+    assert todo == ["img3.png", "img4.png"]
+
+    sink = CsvSink(out, append=True)
+    with open(checkpoint_path, "a", encoding="utf-8") as checkpoint:
+        append_checkpoint(checkpoint, sink.write([to_row({"path": p, "analysis": _analysis()}) for p in todo]))
+    sink.close()
+    assert [r["path"] for r in _read(out)] == [f"img{i}.png" for i in range(5)]
+    assert batch_analyze.load_checkpoint(checkpoint_path) == {"img0.png", "img1.png", "img3.png", "img4.png"}
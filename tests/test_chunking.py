@@ -0,0 +1,71 @@
+import re
+
+from chunking import chunk_pages, chunk_units, extract_units
+
+
+class WordTokenizer:
+    """One token per whitespace-separated word, with offsets like a fast HF tokenizer."""
+
+    def __call__(self, texts, add_special_tokens=False, return_offsets_mapping=False):
+        if isinstance(texts, str):
+            spans = [(m.start(), m.end()) for m in re.finditer(r"\S+", texts)]
+            out = {"input_ids": list(range(len(spans)))}
+            if return_offsets_mapping:
+                out["offset_mapping"] = spans
+            return out
+        return {"input_ids": [t.split() for t in texts]}
+
+
+def test_paragraph_continues_over_page_break_with_trailing_newline():
+    pages = [(1, "Breast cancer affects women worldwide and\n"), (2, "continues onto page two.\n\n")]
+    units = extract_units(pages)
+    assert [u.text for u in units] == ["Breast cancer affects women worldwide and continues onto page two."]
+    assert (units[0].page_start, units[0].page_end) == (1, 2)
+    assert units[0].char_end == len("continues onto page two.")
+
+
+def test_full_stop_ends_paragraph_at_page_break():
+    units = extract_units([(1, "First page ends here.\n"), (2, "second page starts lowercase.")])
+    assert [(u.text, u.page_start, u.page_end) for u in units] == [
+        ("First page ends here.", 1, 1),
+        ("second page starts lowercase.", 2, 2),
+    ]
+
+
+def test_blank_line_inside_page_still_breaks_paragraph():
+    units = extract_units([(1, "one line without stop\n\nanother line")])
+    assert [u.text for u in units] == ["one line without stop", "another line"]
+
+
+def test_headings_and_tables():
+    text = "1. Introduction\nTumours grow. They spread.\nSize   Grade   Count\n10     2       5\n"
+    units = extract_units([(1, text)])
+    assert [u.kind for u in units] == ["heading", "sentence", "sentence", "table"]
+    assert units[1].section == "1. Introduction"
+    assert text[units[2].char_start:units[2].char_end] == "They spread."
+
+
+def test_chunks_respect_budget_and_overlap():
+    sentences = " ".join(f"Sentence number {i} is here." for i in range(20))
+    units = extract_units([(1, sentences)])
+    groups = chunk_units(units, WordTokenizer(), max_tokens=22, overlap_tokens=5)
+    assert len(groups) > 1
+    assert all(sum(u.tokens for u in g) <= 20 for g in groups)
+    # The last sentence of a chunk is carried into the next one.
+    assert groups[1][0] is groups[0][-1]
+
+
+def test_oversized_unit_is_split():
+    text = " ".join(["word"] * 50) + "."
+    groups = chunk_units(extract_units([(1, text)]), WordTokenizer(), max_tokens=12, overlap_tokens=0)
+    assert [sum(u.tokens for u in g) for g in groups] == [10] * 5
+
+
+def test_chunk_pages_metadata():
+    pages = [(1, "INTRODUCTION\nSee https://example.org for details and\n", ["https://example.org"]),
+             (2, "more text here.", [])]
+    [chunk] = chunk_pages(pages, "doc.pdf", WordTokenizer())
+    assert chunk.text == "INTRODUCTION\nSee https://example.org for details and more text here."
+    assert chunk.metadata["section"] == "INTRODUCTION"
+    assert chunk.metadata["links"] == ["https://example.org"]
+    assert (chunk.metadata["page_start"], chunk.metadata["page_end"]) == (1, 2)
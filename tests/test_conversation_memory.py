@@ -0,0 +1,140 @@
+import threading
+from types import SimpleNamespace
+
+import pytest
+
+from conversation_memory import ConversationMemory, extract_turns, memory_messages
+
+TOPICS = ["tamoxifen", "biopsy", "mammogram", "diet", "chemo"]
+
+
+class TopicEmbedder:
+    """One axis per topic word; counts embedding calls."""
+
+    def __init__(self):
+        self.documents = 0
+        self.queries = 0
+
+    def _vec(self, text):
+        return [float(topic in text.lower()) for topic in TOPICS] + [0.1]
+
+    def embed_documents(self, texts):
+        self.documents += len(texts)
+        return [self._vec(t) for t in texts]
+
+    def embed_query(self, text):
+        self.queries += 1
+        return self._vec(text)
+
+
+def human(text):
+    return SimpleNamespace(type="human", content=text)
+
+
+def ai(text):
+    return SimpleNamespace(type="ai", content=text)
+
+
+def conversation(*topics):
+    messages = []
+    for t in topics:
+        messages += [human(f"question about {t}"), ai(f"answer about {t}")]
+    return messages
+
+
+@pytest.fixture
+def memory(tmp_path):
+    return ConversationMemory(TopicEmbedder(), path=str(tmp_path / "memory.sqlite3"),
+                              top_k=1, recent_turns=1, min_score=0.5)
+
+
+def test_extract_turns_pairs_replies_and_strips_reasoning():
+    messages = [human("hi"), ai("<think>plan</think>Hello!"), human("pending question")]
+    assert extract_turns(messages) == [("hi", "Hello!")]
+
+
+def test_sync_embeds_only_new_turns(memory):
+    assert memory.sync("s", conversation("tamoxifen", "biopsy")) == 2
+    assert memory.sync("s", conversation("tamoxifen", "biopsy")) == 0
+    assert memory.sync("s", conversation("tamoxifen", "biopsy", "diet")) == 1
+    assert memory.embedder.documents == 3
+
+
+def test_recall_returns_recent_plus_relevant_turns(memory):
+    memory.sync("s", conversation("tamoxifen", "biopsy", "mammogram", "diet"))
+    turns, stats = memory.recall("s", "more on tamoxifen side effects")
+    assert [t["turn"] for t in turns] == [0, 3]
+    assert turns[0]["score"] is not None and turns[1]["score"] is None
+    assert stats["memory_turns_indexed"] == 4 and stats["memory_turns_recalled"] == 2
+
+
+def test_recall_skips_irrelevant_turns(memory):
+    memory.sync("s", conversation("tamoxifen", "biopsy", "diet"))
+    turns, _ = memory.recall("s", "chemo schedule")
+    assert [t["turn"] for t in turns] == [2]
+
+
+def test_replaced_conversation_resets_index(memory):
+    memory.sync("s", conversation("tamoxifen", "biopsy"))
+    assert memory.sync("s", conversation("chemo")) == 1
+    turns, stats = memory.recall("s", "tamoxifen")
+    assert stats["memory_turns_indexed"] == 1 and turns[0]["human"] == "question about chemo"
+
+
+def test_index_survives_restart(tmp_path, memory):
+    memory.sync("s", conversation("tamoxifen", "biopsy"))
+    reopened = ConversationMemory(TopicEmbedder(), path=memory.path, top_k=1, recent_turns=1, min_score=0.5)
+    assert reopened.sync("s", conversation("tamoxifen", "biopsy")) == 0
+    assert [t["turn"] for t in reopened.recall("s", "tamoxifen")[0]] == [0, 1]
+    assert reopened.stats()["turns"] == 2
+
+
+def test_sessions_are_isolated(memory):
+    memory.sync("a", conversation("tamoxifen"))
+    memory.sync("b", conversation("diet", "chemo"))
+    assert memory.recall("a", "chemo")[1]["memory_turns_indexed"] == 1
+    assert memory.stats()["sessions"] == 2
+
+
+def test_memory_messages():
+    turns = [{"human": "q", "ai": "a"}]
+    assert memory_messages(turns) == [{"role": "user", "content": "q"}, {"role": "assistant", "content": "a"}]
+
+
+class GatedEmbedder(TopicEmbedder):
+    """The first embed_documents call blocks until `release` is set."""
+
+    def __init__(self):
+        super().__init__()
+        self.entered = threading.Event()
+        self.release = threading.Event()
+        self._first = True
+
+    def embed_documents(self, texts):
+        if self._first:
+            self._first = False
+            self.entered.set()
+            assert self.release.wait(5)
+        return super().embed_documents(texts)
+
+
+def test_slow_embedding_does_not_block_other_sessions_or_duplicate_turns(tmp_path):
+    embedder = GatedEmbedder()
+    memory = ConversationMemory(embedder, path=str(tmp_path / "memory.sqlite3"), top_k=1, recent_turns=1)
+    added = []
+    slow = threading.Thread(target=lambda: added.append(memory.sync("s", conversation("tamoxifen", "biopsy"))))
+    slow.start()
+    try:
+        assert embedder.entered.wait(5)
+        # While "s" is embedding: another session syncs and recalls, and a
+        # second sync of "s" indexes the same turns first.
+        assert memory.sync("other", conversation("diet")) == 1
+        assert memory.recall("other", "diet")[1]["memory_turns_indexed"] == 1
+        assert memory.sync("s", conversation("tamoxifen", "biopsy", "chemo")) == 3
+    finally:
+        embedder.release.set()
+        slow.join(5)
+
+    assert added == [0]
+    assert memory.stats()["turns"] == 4
+    assert memory.recall("s", "chemo")[1]["memory_turns_indexed"] == 3
@@ -0,0 +1,68 @@
+import pytest
+
+from explain_cache import ExplanationCache, bucket_key, grid, pregenerate, quantize
+
+LABELS = ["normal", "suspicious", "malignant"]
+
+
+def _result(*scores):
+    best = max(range(len(scores)), key=lambda i: scores[i])
+    return {"prediction": LABELS[best], "confidence": scores[best], "scores": dict(zip(LABELS, scores))}
+
+
+@pytest.fixture
+def cache(tmp_path):
+    return ExplanationCache(LABELS, "prompt", "model", path=str(tmp_path / "cache.sqlite3"), step=0.25, per_bucket=2)
+
+
+def test_quantize_lands_on_grid():
+    q = quantize([0.34, 0.33, 0.33], 0.1)
+    assert sum(q) == 10 and q == (4, 3, 3)
+    assert quantize([0.0, 0.0], 0.5) == (1, 1)
+
+
+def test_bucket_key_includes_prediction_and_rejects_other_labels():
+    assert bucket_key(_result(0.7, 0.2, 0.1), LABELS, 0.25) == "0|3,1,0"
+    assert bucket_key({"prediction": "x", "scores": {"x": 1.0}}, LABELS) is None
+
+
+def test_grid_covers_every_rounded_result():
+    keys = {key for key, _ in grid(LABELS, 0.25)}
+    assert bucket_key(_result(0.51, 0.26, 0.23), LABELS, 0.25) in keys
+
+
+def test_bucket_is_served_only_once_full(cache):
+    result = _result(0.7, 0.2, 0.1)
+    assert cache.put(result, "first")
+    assert cache.get(result) is None
+    assert cache.put(result, "second")
+    served = {cache.get(result) for _ in range(4)}
+    assert served == {"first", "second"}
+    assert not cache.put(result, "third")
+    assert cache.stats()["hits"] == 4 and cache.stats()["misses"] == 1
+
+
+def test_empty_text_is_not_stored(cache):
+    assert not cache.put(_result(0.7, 0.2, 0.1), "  ")
+
+
+def test_version_change_purges_entries(tmp_path, cache):
+    result = _result(0.7, 0.2, 0.1)
+    cache.put(result, "a")
+    other = ExplanationCache(LABELS, "new prompt", "model", path=cache.path, step=0.25, per_bucket=2)
+    assert other.entries(other.key(result)) == []
+
+
+def test_pregenerate_fills_buckets_and_skips_failures(cache):
+    calls = []
+
+    def generate(result):
+        calls.append(result)
+        return "" if len(calls) % 5 == 0 else f"text {len(calls)}"
+
+    stored = pregenerate(cache, generate, concurrency=1)
+    buckets = list(grid(LABELS, 0.25))
+    assert len(calls) == 2 * len(buckets) and stored == len(calls) - len(calls) // 5
+    # A second run only fills the buckets the failures left short.
+    assert pregenerate(cache, lambda r: "retry", concurrency=1) == len(calls) // 5
+    assert cache.stats()["entries"] == 2 * len(buckets)
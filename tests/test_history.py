@@ -0,0 +1,145 @@
+import gzip
+import json
+
+import pytest
+
+import history
+from history import ConversationHistory, Page, decode_cursor, encode_cursor
+
+
+class Store:
+    """Newest snapshot per session; version bumps on every save."""
+
+    def __init__(self):
+        self.snapshots = {}
+        self.head_reads = 0
+        self.snapshot_reads = 0
+
+    def save(self, session_id, messages):
+        version = f"v{len(self.snapshots.get(session_id, ('v0', [], []))[1]) + 1}-{len(messages)}"
+        self.snapshots[session_id] = (version, f"t-{version}", messages)
+
+    def head(self, session_id):
+        self.head_reads += 1
+        return self.snapshots.get(session_id, (None,))[0]
+
+    def snapshot(self, session_id):
+        self.snapshot_reads += 1
+        return self.snapshots.get(session_id, (None, None, []))
+
+
+def _format(index, m, snap):
+    return {"id": index + 1, "message": m["content"], "timestamp": m.get("timestamp") or snap.created_at}
+
+
+def _history(store, head_ttl=60):
+    return ConversationHistory(store.head, store.snapshot, _format, head_ttl=head_ttl)
+
+
+def _msgs(n):
+    return [{"type": "human", "content": f"m{i}", "timestamp": f"ts{i}"} for i in range(n)]
+
+
+def _payload(page):
+    return json.loads(page.body)
+
+
+def test_cursor_round_trip_and_rejects_garbage():
+    assert decode_cursor(encode_cursor(42)) == 42
+    for bad in ["", "!!", "eDox", "bTotMQ"]:
+        with pytest.raises(ValueError):
+            decode_cursor(bad)
+
+
+def test_pages_walk_back_and_forward():
+    store = Store()
+    store.save("s", _msgs(5))
+    h = _history(store)
+    newest = _payload(h.page("s", limit=2))
+    assert [m["message"] for m in newest["messages"]] == ["m3", "m4"]
+    assert newest["next_cursor"] is None and newest["total"] == 5
+
+    older = _payload(h.page("s", before=newest["prev_cursor"], limit=2))
+    assert [m["id"] for m in older["messages"]] == [2, 3]
+    oldest = _payload(h.page("s", before=older["prev_cursor"], limit=2))
+    assert [m["message"] for m in oldest["messages"]] == ["m0"] and oldest["prev_cursor"] is None
+
+    forward = _payload(h.page("s", after=encode_cursor(1), limit=10))
+    assert [m["message"] for m in forward["messages"]] == ["m1", "m2", "m3", "m4"]
+
+
+def test_messages_keep_their_own_timestamps():
+    store = Store()
+    store.save("s", _msgs(2) + [{"type": "ai", "content": "legacy"}])
+    messages = _payload(_history(store).page("s"))["messages"]
+    assert [m["timestamp"] for m in messages][:2] == ["ts0", "ts1"]
+    # Messages saved before per-message timestamps fall back to the snapshot time.
+    assert messages[2]["timestamp"].startswith("t-")
+
+
+def test_new_turns_polled_with_latest_cursor():
+    store = Store()
+    h = _history(store, head_ttl=0)
+    store.save("s", _msgs(2))
+    latest = _payload(h.page("s"))["latest_cursor"]
+    store.save("s", _msgs(3))
+    assert [m["message"] for m in _payload(h.page("s", after=latest))["messages"]] == ["m2"]
+
+
+def test_head_ttl_limits_store_reads_and_pages_are_cached():
+    store = Store()
+    store.save("s", _msgs(3))
+    h = _history(store, head_ttl=60)
+    first = h.page("s")
+    assert h.page("s") is first
+    assert store.snapshot_reads == 1 and store.head_reads == 0
+
+    h.head_ttl = 0
+    store.save("s", _msgs(4))
+    assert _payload(h.page("s"))["total"] == 4
+    assert store.head_reads == 1 and store.snapshot_reads == 2
+
+
+def test_write_path_sees_turns_saved_by_another_worker():
+    store = Store()
+    store.save("s", _msgs(2))
+    worker_a, worker_b = _history(store, head_ttl=60), _history(store, head_ttl=60)
+    assert len(worker_b.snapshot("s").messages) == 2
+
+    turn = worker_a.snapshot("s", fresh=True).messages + _msgs(3)[2:]
+    store.save("s", turn)
+    worker_a.record("s", *store.snapshots["s"])
+
+    # Display reads may serve the cached snapshot; the next turn must not.
+    assert len(worker_b.snapshot("s").messages) == 2
+    assert len(worker_b.snapshot("s", fresh=True).messages) == 3
+
+
+def test_record_is_write_through():
+    store = Store()
+    h = _history(store)
+    h.record("s", "v9", "t9", _msgs(1))
+    assert _payload(h.page("s"))["total"] == 1 and store.snapshot_reads == 0
+
+
+def test_store_errors_propagate():
+    def broken(session_id):
+        raise history.HistoryUnavailable("relation missing")
+
+    h = ConversationHistory(broken, broken, _format)
+    with pytest.raises(history.HistoryUnavailable):
+        h.page("s")
+
+
+def test_etag_and_encoded_variants(monkeypatch):
+    monkeypatch.setattr(history, "HISTORY_COMPRESS_MIN_BYTES", 10)
+    page = Page({"messages": ["x" * 200]})
+    same = Page({"messages": ["x" * 200]})
+    assert page.etag == same.etag and len(page.etag) == 32
+    body, encoding, etag = page.variant("gzip")
+    assert encoding == "gzip" and etag == f"{page.etag}-gzip"
+    assert gzip.decompress(body) == page.body
+    assert page.variant(None) == (page.body, None, page.etag)
+
+    monkeypatch.setattr(history, "HISTORY_COMPRESS_MIN_BYTES", 10_000)
+    assert page.variant("gzip")[1] is None
@@ -0,0 +1,142 @@
+import time
+
+import pytest
+
+import jobs
+from jobs import DONE, FAILED, QUEUED, RUNNING, JobStore, JobWorkerPool, validate_webhook_url
+
+
+@pytest.fixture
+def store(tmp_path):
+    return JobStore(str(tmp_path / "jobs.sqlite3"), max_attempts=2)
+
+
+def test_duplicate_submit_returns_existing_job(store):
+    first = store.submit("analyze-image", b"img", idempotency_key="k")
+    again = store.submit("analyze-image", b"img", idempotency_key="k")
+    assert again["job_id"] == first["job_id"] and again["deduplicated"]
+
+
+def test_failed_job_is_requeued_on_resubmit(store):
+    job = store.submit("analyze-image", b"img", idempotency_key="k")
+    claimed = store.claim()
+    store.finish(claimed["id"], error="boom")
+    assert store.get(job["job_id"])["status"] == FAILED
+
+    again = store.submit("analyze-image", b"img2", idempotency_key="k")
+    assert again["job_id"] == job["job_id"]
+    assert again["status"] == QUEUED and again.get("requeued") and not again.get("deduplicated")
+    assert again["attempts"] == 0 and again["error"] is None
+    assert store.claim()["payload"] == b"img2"
+
+
+def test_expired_lease_is_requeued_until_attempts_run_out(store):
+    job = store.submit("analyze-image", b"img")
+    assert store.claim()["attempts"] == 1
+    # Lease expired (worker died): requeued for the second and last attempt.
+    assert store.claim(lease=-1)["attempts"] == 2
+    assert store.claim(lease=-1) is None
+    view = store.get(job["job_id"])
+    assert view["status"] == FAILED and "lease" in view["error"]
+
+
+def test_heartbeat_renews_lease(store):
+    store.submit("analyze-image", b"img")
+    claimed = store.claim()
+    before = claimed["updated_at"]
+    time.sleep(0.01)
+    store.heartbeat(claimed["id"])
+    assert store.get(claimed["id"])["updated_at"] > before
+    assert store.get(claimed["id"])["status"] == RUNNING
+
+
+def test_pool_retries_then_succeeds(store):
+    calls = []
+
+    def handler(payload, params):
+        calls.append(payload)
+        if len(calls) == 1:
+            raise RuntimeError("transient")
+        return {"ok": True}
+
+    job = store.submit("analyze-image", b"img")
+    pool = JobWorkerPool(store, {"analyze-image": handler}, max_attempts=2)
+    pool._run(store.claim())
+    assert store.get(job["job_id"])["status"] == QUEUED
+    pool._run(store.claim())
+    view = store.get(job["job_id"])
+    assert view["status"] == DONE and view["result"] == {"ok": True}
+
+
+@pytest.mark.parametrize("url", [
+    "http://example.com/hook",          # not HTTPS
+    "https://127.0.0.1/hook",
+    "https://169.254.169.254/latest/meta-data",
+    "https://10.0.0.5/hook",
+    "https://[::1]/hook",
+    "ftp://example.com/hook",
+    "https:///nohost",
+])
+def test_webhook_rejects_internal_targets(url):
+    with pytest.raises(ValueError):
+        validate_webhook_url(url)
+
+
+def test_webhook_allowlist(monkeypatch):
+    monkeypatch.setattr(jobs, "JOB_WEBHOOK_ALLOWED_HOSTS", ["hooks.example.org"])
+    with pytest.raises(ValueError):
+        validate_webhook_url("https://8.8.8.8/hook")
+    monkeypatch.setattr(jobs.socket, "getaddrinfo", lambda *a: [(0, 0, 0, "", ("93.184.216.34", 443))])
+    assert validate_webhook_url("https://hooks.example.org/x") == "https://hooks.example.org/x"
+
+
+def test_webhook_does_not_follow_redirect_to_private_address(monkeypatch, capsys):
+    import socket
+    import threading
+    from http.server import BaseHTTPRequestHandler, HTTPServer
+
+    seen = []
+
+    class Redirect(BaseHTTPRequestHandler):
+        def do_POST(self):
+            seen.append((self.path, self.headers["Host"]))
+            self.rfile.read(int(self.headers["Content-Length"]))
+            self.send_response(302)
+            self.send_header("Location", "http://169.254.169.254/latest/meta-data")
+            self.send_header("Content-Length", "0")
+            self.end_headers()
+
+        def log_message(self, *args):
+            pass
+
+    server = HTTPServer(("127.0.0.1", 0), Redirect)
+    threading.Thread(target=server.serve_forever, daemon=True).start()
+
+    # hooks.example.org resolves to a public address; the "network" delivers
+    # any connection to it to the local server and records every dial.
+    real_connect = socket.create_connection
+    dialed = []
+
+    def connect(address, *args, **kwargs):
+        dialed.append(address)
+        return real_connect(("127.0.0.1", server.server_port), *args, **kwargs)
+
+    monkeypatch.setattr(jobs, "JOB_WEBHOOK_ALLOW_HTTP", True)
+    real_getaddrinfo = socket.getaddrinfo
+
+    def getaddrinfo(host, *args):
+        if host == "hooks.example.org":
+            return [(0, 0, 0, "", ("93.184.216.34", 80))]
+        return real_getaddrinfo(host, *args)
+
+    monkeypatch.setattr(jobs.socket, "getaddrinfo", getaddrinfo)
+    monkeypatch.setattr(jobs.socket, "create_connection", connect)
+    try:
+        jobs._notify("http://hooks.example.org/hook?x=1", {"id": "j1"})
+    finally:
+        server.shutdown()
+        server.server_close()
+
+    assert seen == [("/hook?x=1", "hooks.example.org")]
+    assert dialed == [("93.184.216.34", 80)]  # the validated IP, and no second hop
+    assert "refused redirect" in capsys.readouterr().out
@@ -0,0 +1,112 @@
+from types import SimpleNamespace
+
+import pytest
+
+import reasoning
+from reasoning import NO_ANSWER_FALLBACK, ThinkParser, complete, split_reasoning, strip_reasoning
+
+
+def _feed_all(chunks):
+    parser = ThinkParser()
+    for c in chunks:
+        parser.feed(c)
+    parser.close()
+    return parser
+
+
+class FakeClient:
+    """chat.completions.create(stream=True) yielding one delta per chunk, per model."""
+
+    def __init__(self, replies):
+        self.replies = replies
+        self.models = []
+        self.chat = SimpleNamespace(completions=SimpleNamespace(create=self._create))
+
+    def _create(self, model, stream, **kwargs):
+        self.models.append(model)
+        return iter([
+            SimpleNamespace(choices=[SimpleNamespace(delta=SimpleNamespace(content=c))])
+            for c in self.replies[model]
+        ])
+
+
+def test_split_tagged_response():
+    assert split_reasoning("<think>plan</think>\\n\\nAnswer.".replace("\\n", "\n")) == ("plan", "\n\nAnswer.")
+
+
+@pytest.mark.parametrize("chunks", [
+    ["<think>a", "b</th", "ink>ans", "wer"],
+    ["<", "think>ab<", "/think", ">answer"],
+])
+def test_tags_split_across_chunks(chunks):
+    parser = _feed_all(chunks)
+    assert (parser.reasoning, parser.answer) == ("ab", "answer")
+
+
+def test_prefilled_think_without_opening_tag():
+    assert strip_reasoning("reasoning...</think>\n\nFinal") == "Final"
+    parser = _feed_all(["hmm ", "thinking</th", "ink>Answer."])
+    assert parser.prefilled
+    assert (parser.reasoning, parser.answer) == ("hmm thinking", "Answer.")
+
+
+def test_untagged_text_is_answer():
+    assert strip_reasoning("Just an answer.") == "Just an answer."
+
+
+def test_reasoning_only_returns_fallback():
+    assert strip_reasoning("<think>only thoughts</think>") == NO_ANSWER_FALLBACK
+    assert strip_reasoning("only thoughts</think>") == NO_ANSWER_FALLBACK
+
+
+def test_complete_prefilled_counts_reasoning():
+    client = FakeClient({reasoning.REASONING_MODEL: ["hmm ", "thinking", "</think>", "Answer", "."]})
+    resp = complete(client, [], model=reasoning.REASONING_MODEL)
+    assert resp.answer == "Answer."
+    assert resp.reasoning == "hmm thinking"
+    assert resp.reasoning_tokens == 3 and resp.answer_tokens == 2
+
+
+def test_complete_falls_back_when_reasoning_budget_runs_out():
+    client = FakeClient({
+        reasoning.REASONING_MODEL: ["<think>"] + ["x"] * 10,
+        reasoning.CHAT_MODEL: ["Short ", "answer."],
+    })
+    resp = complete(client, [], model=reasoning.REASONING_MODEL, reasoning_budget=3)
+    assert resp.answer == "Short answer." and resp.truncated["reasoning"]
+    assert client.models == [reasoning.REASONING_MODEL, reasoning.CHAT_MODEL]
+
+
+def test_complete_zero_reasoning_budget_streams_plain_answer():
+    client = FakeClient({reasoning.CHAT_MODEL: ["Hi", " there"]})
+    resp = complete(client, [], model=reasoning.CHAT_MODEL, reasoning_budget=0)
+    assert resp.answer == "Hi there" and resp.answer_tokens == 2
+
+
+def test_complete_long_prefilled_stream_without_closing_tag_falls_back():
+    client = FakeClient({
+        reasoning.REASONING_MODEL: ["thinking "] * 50,
+        reasoning.CHAT_MODEL: ["Short ", "answer."],
+    })
+    resp = complete(client, [], model=reasoning.REASONING_MODEL, reasoning_budget=3, answer_budget=4)
+    assert resp.answer == "Short answer." and resp.truncated["reasoning"]
+    assert resp.reasoning_tokens == 3 and "thinking" in resp.reasoning
+    assert client.models == [reasoning.REASONING_MODEL, reasoning.CHAT_MODEL]
+
+
+def test_complete_tagless_end_on_reasoning_model_is_not_an_answer():
+    client = FakeClient({
+        reasoning.REASONING_MODEL: ["hmm ", "still thinking"],
+        reasoning.CHAT_MODEL: ["Fallback."],
+    })
+    resp = complete(client, [], model=reasoning.REASONING_MODEL)
+    assert resp.answer == "Fallback." and resp.truncated["reasoning"]
+    assert resp.reasoning == "hmm still thinking"
+
+
+def test_complete_undecided_prefix_settled_as_answer_respects_answer_budget():
+    client = FakeClient({reasoning.REASONING_MODEL: ["a", "b", "c", "<think>", "x", "</think>", "d"]})
+    resp = complete(client, [], model=reasoning.REASONING_MODEL, reasoning_budget=10, answer_budget=2)
+    assert resp.answer == "ab" and resp.answer_tokens == 2
+    assert resp.truncated["answer"] and not resp.truncated["reasoning"]
+    assert client.models == [reasoning.REASONING_MODEL]
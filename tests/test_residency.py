@@ -0,0 +1,78 @@
+import time
+import importlib
+from types import SimpleNamespace
+
+import numpy as np
+from langchain_core.documents import Document
+
+import residency
+from residency import LazyModel, ModelRegistry
+from retrieval import CachedRetriever
+
+
+def _registry(**kwargs):
+    kwargs.setdefault("budget_mb", 0)
+    kwargs.setdefault("reaper_interval", 0)
+    return ModelRegistry(**kwargs)
+
+
+def test_idle_eviction_is_opt_in(monkeypatch):
+    monkeypatch.delenv("MODEL_IDLE_TIMEOUT", raising=False)
+    assert importlib.reload(residency).MODEL_IDLE_TIMEOUT == 0
+    registry = _registry(idle_timeout=0)
+    registry.register("m", object)
+    registry.get("m")
+    registry._entries["m"].last_used -= 10_000
+    registry.evict_idle()
+    assert registry.peek("m") is not None
+
+
+def test_idle_model_is_evicted_and_reloaded():
+    registry = _registry(idle_timeout=60)
+    registry.register("m", object)
+    first = registry.get("m")
+    registry._entries["m"].last_used = time.monotonic() - 120
+    registry.evict_idle()
+    assert registry.peek("m") is None
+    assert registry.get("m") is not first
+    assert registry.stats()["models"][0]["load_count"] == 2
+
+
+def test_held_and_pinned_models_are_not_evicted():
+    registry = _registry()
+    registry.register("m", object)
+    with registry.use("m"):
+        assert not registry.evict("m")
+    assert registry.evict("m")
+    registry.get("m")
+    registry.pin_all()
+    assert not registry.evict("m")
+
+
+def test_lazy_model_reloads_after_eviction():
+    registry = _registry()
+    registry.register("fn", lambda: (lambda x: x * 2))
+    lazy = LazyModel(registry, "fn")
+    assert lazy(3) == 6
+    registry.evict("fn")
+    assert lazy(4) == 8
+
+
+def test_retriever_holds_vectordb_for_whole_search():
+    registry = _registry()
+    doc = Document(page_content="Tumor grade.")
+    evicted = []
+
+    class Index:
+        def search(self, queries, k):
+            evicted.append(registry.evict("vectordb"))
+            return None, np.asarray([[0] + [-1] * (k - 1)])
+
+    registry.register("vectordb", lambda: SimpleNamespace(
+        index=Index(), index_to_docstore_id={0: "a"}, docstore=SimpleNamespace(search=lambda i: doc)))
+    embedder = SimpleNamespace(embed_query=lambda q: [1.0])
+    retriever = CachedRetriever(LazyModel(registry, "vectordb"), embedder, k=2, version_fn=lambda: "v",
+                                compress=False, hold=lambda: registry.use("vectordb"))
+    docs, _ = retriever.retrieve("tumor")
+    assert docs == [doc] and evicted == [False]
+    assert registry.stats()["models"][0]["load_count"] == 1
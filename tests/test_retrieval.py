@@ -0,0 +1,125 @@
+import numpy as np
+from langchain_core.documents import Document
+
+from retrieval import CachedRetriever, LRUCache, compress_documents, split_sentences
+
+VOCAB = ["tumor", "grade", "margin", "lymph", "node", "diet", "weather", "biopsy"]
+
+
+class FakeEmbedder:
+    """Bag-of-words vectors over a tiny vocabulary; counts query embeddings."""
+
+    def __init__(self):
+        self.queries = 0
+        self.documents = 0
+
+    def _vec(self, text):
+        words = text.lower().replace(".", " ").replace("?", " ").split()
+        return [float(sum(w.startswith(v) for w in words)) for v in VOCAB]
+
+    def embed_query(self, text):
+        self.queries += 1
+        return self._vec(text)
+
+    def embed_documents(self, texts):
+        self.documents += len(texts)
+        return [self._vec(t) for t in texts]
+
+
+class FakeIndex:
+    def __init__(self, vectors):
+        self.vectors = np.asarray(vectors, dtype=np.float32)
+
+    def search(self, queries, k):
+        scores = self.vectors @ queries[0]
+        rows = list(np.argsort(-scores)[:k])
+        rows += [-1] * (k - len(rows))
+        return None, np.asarray([rows])
+
+
+class FakeDocstore:
+    def __init__(self, docs):
+        self.docs = docs
+
+    def search(self, doc_id):
+        return self.docs.get(doc_id, f"ID {doc_id} not found.")
+
+
+class FakeVectorStore:
+    def __init__(self, docs, embedder):
+        self.docstore = FakeDocstore({f"id{i}": d for i, d in enumerate(docs)})
+        self.index_to_docstore_id = {i: f"id{i}" for i in range(len(docs))}
+        self.index = FakeIndex(embedder.embed_documents([d.page_content for d in docs]))
+
+
+DOCS = [
+    Document(page_content="Tumor grade matters. The weather was fine. Margin status is key. Diet is unrelated.",
+             metadata={"source": "a.pdf"}),
+    Document(page_content="Lymph node biopsy. Short.", metadata={"source": "b.pdf"}),
+    Document(page_content="Weather and diet only.", metadata={"source": "c.pdf"}),
+]
+
+
+def _retriever(version=lambda: "v1", **kwargs):
+    embedder = FakeEmbedder()
+    store = FakeVectorStore(DOCS, embedder)
+    embedder.documents = 0
+    return CachedRetriever(store, embedder, k=2, version_fn=version, **kwargs), embedder
+
+
+def test_miss_embeds_query_once_and_hit_embeds_nothing():
+    retriever, embedder = _retriever(sentence_cache=LRUCache())
+    docs, stats = retriever.retrieve("What tumor grade and margin?")
+    assert embedder.queries == 1 and not stats["retrieval_cache_hit"]
+    assert [d.metadata["source"] for d in docs] == ["a.pdf", "b.pdf"]
+    assert docs[0].page_content == "Tumor grade matters. Margin status is key."
+    assert stats["context_chars"] < stats["context_chars_raw"]
+
+    again, stats = retriever.retrieve("  what TUMOR grade and margin? ")
+    assert embedder.queries == 1 and stats["retrieval_cache_hit"]
+    assert again == docs and stats["compression_ms"] == 0.0
+
+
+def test_index_version_change_invalidates_context():
+    version = ["v1"]
+    retriever, embedder = _retriever(version=lambda: version[0])
+    retriever.retrieve("tumor grade")
+    version[0] = "v2"
+    _, stats = retriever.retrieve("tumor grade")
+    assert not stats["retrieval_cache_hit"] and embedder.queries == 2
+
+
+def test_compression_can_be_disabled():
+    retriever, _ = _retriever(compress=False)
+    docs, stats = retriever.retrieve("tumor grade")
+    assert docs[0] is DOCS[0] and stats["context_chars"] == stats["context_chars_raw"]
+
+
+def test_compress_uses_given_vector_and_sentence_cache():
+    embedder, cache = FakeEmbedder(), LRUCache()
+    vec = np.asarray(embedder._vec("lymph node"), dtype=np.float32)
+    doc = Document(page_content="Diet. Weather. Lymph node involved. Tumor grade high.", metadata={"source": "x"})
+    out = compress_documents("ignored", [doc], embedder, max_sentences=1, sentence_cache=cache, query_vec=vec)
+    assert out[0].page_content == "Lymph node involved." and out[0].metadata == {"source": "x"}
+    assert embedder.queries == 0
+    compress_documents("ignored", [doc], embedder, max_sentences=1, sentence_cache=cache, query_vec=vec)
+    assert embedder.documents == 4
+
+
+def test_compress_keeps_best_sentence_when_nothing_is_relevant():
+    embedder = FakeEmbedder()
+    doc = Document(page_content="Diet first. Weather second. Tumor third. Nothing fourth.")
+    out = compress_documents("biopsy", [doc], embedder, max_sentences=2, min_similarity=0.9)
+    assert len(split_sentences(out[0].page_content)) == 1
+
+
+def test_lru_cache_evicts_and_expires():
+    cache = LRUCache(maxsize=2, ttl=0)
+    cache.put("a", 1)
+    cache.put("b", 2)
+    cache.get("a")
+    cache.put("c", 3)
+    assert cache.get("b") is None and cache.get("a") == 1 and len(cache) == 2
+    expiring = LRUCache(maxsize=2, ttl=1e-9)
+    expiring.put("a", 1)
+    assert expiring.get("a") is None
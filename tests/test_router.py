@@ -0,0 +1,101 @@
+import re
+
+import numpy as np
+
+from router import (CANNED_REPLIES, LABELED_EXAMPLES, ROUTE_CHAT, ROUTE_CLINICAL, ROUTE_GREETING, ROUTE_IMAGE,
+                    ROUTE_OFF_TOPIC, ROUTER_MIN_SCORE, QueryRouter)
+
+EXAMPLES = {
+    ROUTE_GREETING: ["hello", "hi"],
+    ROUTE_OFF_TOPIC: ["weather", "football"],
+    ROUTE_CLINICAL: ["breast cancer", "breast lump"],
+}
+AXES = {"hello": 0, "hi": 0, "weather": 1, "football": 1, "breast": 2, "cancer": 2, "lump": 2}
+
+
+class KeywordEmbedder:
+    """One axis per route; unknown words share a neutral axis."""
+
+    def __init__(self):
+        self.calls = 0
+
+    def _vec(self, text):
+        v = np.zeros(4, dtype=np.float32)
+        for word in text.lower().replace("?", "").split():
+            v[AXES.get(word, 3)] += 1
+        return v
+
+    def embed_documents(self, texts):
+        self.calls += 1
+        return [self._vec(t) for t in texts]
+
+    def embed_query(self, text):
+        return self._vec(text)
+
+
+class BagOfWords:
+    """One axis per distinct word, so shared wording drives similarity."""
+
+    def __init__(self):
+        self.vocab = {}
+
+    def _vec(self, text):
+        v = np.zeros(512, dtype=np.float32)
+        for word in re.findall(r"[a-z0-9']+", text.lower()):
+            v[self.vocab.setdefault(word, len(self.vocab))] += 1
+        return v
+
+    def embed_documents(self, texts):
+        return [self._vec(t) for t in texts]
+
+    def embed_query(self, text):
+        return self._vec(text)
+
+
+def test_medical_question_outside_breast_cancer_is_not_refused():
+    query = "how do I treat diabetes?"
+    # With a medical question among the off-topic examples it got the canned refusal.
+    old = {label: list(texts) for label, texts in LABELED_EXAMPLES.items()}
+    old[ROUTE_OFF_TOPIC] += ["how do I treat diabetes?", "what are the symptoms of malaria?"]
+    assert QueryRouter(BagOfWords(), old).classify(query)[0] in CANNED_REPLIES
+
+    router = QueryRouter(BagOfWords())
+    assert router.classify(query)[0] not in CANNED_REPLIES
+    assert router.classify("what are the symptoms of malaria?")[0] not in CANNED_REPLIES
+    assert router.classify("how do I treat breast cancer?")[0] == ROUTE_CLINICAL
+
+
+def test_borderline_query_inside_default_margin_goes_to_chat():
+    # Slightly more clinical than off-topic: well above min_score, small margin.
+    query = " ".join(["breast"] * 11 + ["weather"] * 10)
+    assert QueryRouter(KeywordEmbedder(), EXAMPLES, min_margin=0).classify(query)[0] == ROUTE_CLINICAL
+    route, score, scores = QueryRouter(KeywordEmbedder(), EXAMPLES).classify(query)
+    assert route == ROUTE_CHAT
+    assert score > ROUTER_MIN_SCORE and scores[ROUTE_CLINICAL] > scores[ROUTE_OFF_TOPIC]
+
+
+def test_clear_matches_take_their_route():
+    router = QueryRouter(KeywordEmbedder(), EXAMPLES)
+    assert router.classify("breast cancer stage")[0] == ROUTE_CLINICAL
+    assert router.classify("football")[0] == ROUTE_OFF_TOPIC
+    assert router.classify("hello")[0] == ROUTE_GREETING
+
+
+def test_low_confidence_goes_to_chat():
+    router = QueryRouter(KeywordEmbedder(), EXAMPLES)
+    # Tied between clinical and off-topic: margin 0.
+    assert router.classify("breast weather")[0] == ROUTE_CHAT
+    # Nothing known: every similarity is 0.
+    route = router.route("quantum chromodynamics")
+    assert route["route"] == ROUTE_CHAT and route["low_confidence"]
+
+
+def test_route_shortcuts_and_lazy_centroids():
+    embedder = KeywordEmbedder()
+    router = QueryRouter(embedder, EXAMPLES)
+    assert router.route("ANALYZE_IMAGE: scan.png")["route"] == ROUTE_IMAGE
+    assert router.route("   ")["route"] == ROUTE_GREETING
+    assert embedder.calls == 0
+    router.route("breast lump")
+    router.route("breast cancer")
+    assert embedder.calls == len(EXAMPLES)
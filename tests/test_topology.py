@@ -0,0 +1,56 @@
+import os
+import importlib.util
+from types import SimpleNamespace
+
+from topology import core_set, threads_per_worker
+
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+
+
+def _gunicorn_conf():
+    spec = importlib.util.spec_from_file_location("gunicorn_conf", os.path.join(ROOT, "gunicorn.conf.py"))
+    module = importlib.util.module_from_spec(spec)
+    spec.loader.exec_module(module)
+    return module
+
+
+def _server(workers, live_slots):
+    live = {1000 + i: SimpleNamespace(slot=s) for i, s in enumerate(live_slots)}
+    return SimpleNamespace(cfg=SimpleNamespace(workers=workers), WORKERS=live)
+
+
+def test_core_sets_do_not_overlap():
+    cpus = list(range(8))
+    sets = [core_set(i, 4, cpus) for i in range(4)]
+    assert sets == [[0, 1], [2, 3], [4, 5], [6, 7]]
+
+
+def test_threads_follow_worker_count(monkeypatch):
+    monkeypatch.delenv("TORCH_THREADS", raising=False)
+    assert threads_per_worker(4, cpus=8) == 2
+    assert threads_per_worker(16, cpus=8) == 1
+
+
+def test_restarted_worker_takes_the_free_slot():
+    conf = _gunicorn_conf()
+    # Worker in slot 1 died; slots 0, 2, 3 are still live.
+    assert conf._free_slot(_server(4, [0, 2, 3]), 4) == 1
+    assert conf._free_slot(_server(4, []), 4) == 0
+
+
+def test_post_fork_uses_real_worker_count(monkeypatch):
+    conf = _gunicorn_conf()
+    monkeypatch.delenv("TORCH_THREADS", raising=False)
+    monkeypatch.setattr(conf, "preload_app", False)
+    seen = {}
+
+    def fake_configure(**kwargs):
+        seen.update(kwargs)
+        return {"threads": kwargs["threads"], "cpus": []}
+
+    monkeypatch.setattr(conf, "configure_process", fake_configure)
+    monkeypatch.setattr(conf, "threads_per_worker", lambda n: 16 // n)
+    server = _server(8, [])
+    server.log = SimpleNamespace(info=lambda *a: None)
+    conf.post_fork(server, SimpleNamespace(pid=1, slot=3))
+    assert seen["workers"] == 8 and seen["threads"] == 2 and seen["worker_index"] == 3
@@ -0,0 +1,102 @@
+from types import SimpleNamespace
+
+import pytest
+
+import vector_search
+from vector_search import InMemorySearchBackend, SupabaseSearchBackend, search_batch, search_params
+
+ROWS = [
+    {"content": "idc", "metadata": {"source": "a.pdf", "tags": ["idc", "grade"]}, "embedding": [1.0, 0.0]},
+    {"content": "dcis", "metadata": {"source": "b.pdf"}, "embedding": [0.9, 0.1]},
+    {"content": "other", "metadata": {"source": "a.pdf"}, "embedding": [0.8, 0.2]},
+    {"content": "far", "metadata": {"source": "a.pdf"}, "embedding": [0.0, 1.0]},
+]
+
+
+class Embedder:
+    def embed_query(self, text):
+        return [1.0, 0.0]
+
+    def embed_documents(self, texts):
+        return [[1.0, 0.0] for _ in texts]
+
+
+class MissingFunction(Exception):
+    code = "PGRST202"
+
+
+class FakeSupabase:
+    """rpc() served by an in-memory backend; the filtered function may be missing."""
+
+    def __init__(self, has_filtered: bool):
+        self.has_filtered = has_filtered
+        self.memory = InMemorySearchBackend(ROWS)
+        self.calls = []
+
+    def rpc(self, name, params):
+        self.calls.append((name, params))
+        if name == vector_search.MATCH_FUNCTION and not self.has_filtered:
+            raise MissingFunction("Could not find the function")
+        filtered = name == vector_search.MATCH_FUNCTION
+        data = self.memory.search(params["query_embedding"], params["match_threshold"], params["match_count"],
+                                  params.get("match_offset", 0), params.get("filter", {}) if filtered else {}, 40)
+        return SimpleNamespace(execute=lambda: SimpleNamespace(data=data))
+
+
+def test_memory_backend_filters_and_pages():
+    backend = InMemorySearchBackend(ROWS)
+    hits = backend.search([1.0, 0.0], 0.5, 1, 1, {"source": "a.pdf"}, 40)
+    assert [h["content"] for h in hits] == ["other"]
+    assert [h["content"] for h in backend.search([1.0, 0.0], 0.5, 5, 0, {"tags": ["grade"]}, 40)] == ["idc"]
+
+
+def test_supabase_uses_filtered_function_when_present():
+    client = FakeSupabase(has_filtered=True)
+    hits = SupabaseSearchBackend(client).search([1.0, 0.0], 0.5, 1, 1, {"source": "a.pdf"}, 40)
+    assert [h["content"] for h in hits] == ["other"]
+    assert [name for name, _ in client.calls] == [vector_search.MATCH_FUNCTION]
+
+
+def test_supabase_falls_back_to_legacy_function():
+    client = FakeSupabase(has_filtered=False)
+    backend = SupabaseSearchBackend(client)
+    hits = backend.search([1.0, 0.0], 0.5, 1, 1, {"source": "a.pdf"}, 40)
+    assert [h["content"] for h in hits] == ["other"]
+    backend.search([1.0, 0.0], 0.5, 2, 0, {}, 40)
+    names = [name for name, _ in client.calls]
+    # The missing function is probed once; later searches go straight to the legacy one.
+    assert names == [vector_search.MATCH_FUNCTION, "match_embeddings", "match_embeddings"]
+    assert set(client.calls[1][1]) == {"query_embedding", "match_threshold", "match_count"}
+    assert client.calls[2][1]["match_count"] == 2
+
+
+def test_supabase_other_errors_propagate():
+    class Broken:
+        def rpc(self, name, params):
+            raise RuntimeError("boom")
+
+    with pytest.raises(RuntimeError):
+        SupabaseSearchBackend(Broken()).search([1.0], 0.5, 1, 0, {}, 40)
+
+
+def test_search_batch_pages():
+    [page] = search_batch(InMemorySearchBackend(ROWS), Embedder(), ["q"], metadata_filter={"source": "a.pdf"},
+                          threshold=0.5, limit=1)
+    assert page["next_offset"] == 1 and page["results"][0]["content"] == "idc"
+    with pytest.raises(ValueError):
+        search_batch(InMemorySearchBackend(), Embedder(), ["q"] * (vector_search.SEARCH_MAX_BATCH + 1))
+
+
+def test_search_params_defaults_and_coercion():
+    assert search_params({}) == {"threshold": vector_search.SEARCH_THRESHOLD, "limit": vector_search.SEARCH_LIMIT,
+                                 "offset": 0, "ef_search": vector_search.SEARCH_EF}
+    assert search_params({"limit": "3", "threshold": "0.5", "offset": 2.0})["limit"] == 3
+
+
+@pytest.mark.parametrize("body", [
+    {"limit": None}, {"limit": "ten"}, {"limit": 2.5}, {"offset": [1]}, {"threshold": "nan"},
+    {"threshold": float("inf")}, {"ef_search": True}, {"threshold": {}},
+])
+def test_search_params_rejects_malformed_numbers(body):
+    with pytest.raises(ValueError):
+        search_params(body)
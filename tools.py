@@ -1,25 +1,35 @@
 # tools.py
 import os
 import json
-from typing import Dict, Any, List, Tuple
+import time
+from typing import Dict, Any, List, Optional, Tuple
 from PIL import Image
+from topology import configure_process, configure_torch
+configure_process()  # thread env vars must be set before torch is imported
 import torch
 from transformers import CLIPModel, CLIPProcessor
 from openai import OpenAI
 from dotenv import load_dotenv
 from langchain_core.tools import tool
+from reasoning import complete, REASONING_MODEL, CHAT_MODEL
+from retrieval import CachedRetriever, LRUCache
+from vision import CLIP_MODEL_ID, IMAGE_LABELS
+from chunking import EMBED_MODEL_ID, embed_model_kwargs
+from residency import ModelRegistry, LazyModel, torch_module_mb
+from explain_cache import ExplanationCache, EXPLAIN_CACHE_ENABLED
 
 
 # For PDF + embeddings
 from langchain_text_splitters import RecursiveCharacterTextSplitter
 from langchain_community.embeddings import HuggingFaceEmbeddings
 from langchain_community.vectorstores import FAISS
+from langchain_core.embeddings import Embeddings
 
 load_dotenv()
 
 # --- Hugging Face router client via OpenAI-compatible wrapper ---
 HF_BASE_URL = "https://router.huggingface.co/v1"
-HF_MODEL = "deepseek-ai/DeepSeek-R1-0528:novita"
+HF_MODEL = REASONING_MODEL
 API_KEY = os.environ.get("TOKEN")
 
 if not API_KEY:
@@ -28,24 +38,60 @@ if not API_KEY:
 # ✅ Proper OpenAI-compatible client
 client = OpenAI(api_key=API_KEY, base_url=HF_BASE_URL)
 
-# --- CLIP model (vision) ---
-CLIP_MODEL_ID = "openai/clip-vit-base-patch32"
+# --- Model residency: loaded on first use, evicted when idle or over the RSS budget ---
+model_registry = ModelRegistry()
 
+# --- CLIP model (vision) ---
+configure_torch(torch)
 _clip_device = "cuda" if torch.cuda.is_available() else "cpu"
-_clip_model = CLIPModel.from_pretrained(CLIP_MODEL_ID).to(_clip_device)
-
+model_registry.register(
+    "clip_model",
+    lambda: CLIPModel.from_pretrained(CLIP_MODEL_ID).to(_clip_device).eval(),
+    size_fn=torch_module_mb,
+)
 # ✅ Do NOT set use_fast for CLIPProcessor (only applies to text tokenizers)
-_clip_processor = CLIPProcessor.from_pretrained(CLIP_MODEL_ID)
+model_registry.register("clip_processor", lambda: CLIPProcessor.from_pretrained(CLIP_MODEL_ID))
+_clip_model = LazyModel(model_registry, "clip_model")
+_clip_processor = LazyModel(model_registry, "clip_processor")
+
+# Shared MiniLM embedder (RAG store + query router)
+model_registry.register(
+    "embedder",
+    lambda: HuggingFaceEmbeddings(model_name=EMBED_MODEL_ID, model_kwargs=embed_model_kwargs()),
+    size_fn=torch_module_mb,
+)
+
+
+class RegistryEmbeddings(Embeddings):
+    """Embeddings facade over the registry, so MiniLM can be evicted and reloaded."""
+
+    def embed_documents(self, texts: List[str]) -> List[List[float]]:
+        with model_registry.use("embedder") as embedder:
+            return embedder.embed_documents(texts)
+
+    def embed_query(self, text: str) -> List[float]:
+        with model_registry.use("embedder") as embedder:
+            return embedder.embed_query(text)
+
+
+embeddings = RegistryEmbeddings()
 
 # Load or build vectorstore
 if os.path.exists("rag_store/index.faiss"):
-    embeddings = HuggingFaceEmbeddings(model_name="sentence-transformers/all-MiniLM-L6-v2")
-    _vectordb = FAISS.load_local("rag_store", embeddings, allow_dangerous_deserialization=True)
+    model_registry.register(
+        "vectordb",
+        lambda: FAISS.load_local("rag_store", embeddings, allow_dangerous_deserialization=True),
+    )
+    _vectordb = LazyModel(model_registry, "vectordb")
+    # Held across the whole search, so an eviction cannot swap the store mid-query.
+    _hold_vectordb = lambda: model_registry.use("vectordb")
 else:
     from ingest_pdfs import build_vectorstore
     _vectordb = build_vectorstore()
+    _hold_vectordb = None
 
-_retriever = _vectordb.as_retriever(search_kwargs={"k": 5})
+# (query, index version) -> compressed context cache + sentence-embedding cache for compression
+_retriever = CachedRetriever(_vectordb, embeddings, k=5, sentence_cache=LRUCache(), hold=_hold_vectordb)
 
 @tool
 def analyze_image(image_path: str) -> Dict[str, Any]:
@@ -58,15 +104,21 @@ def analyze_image(image_path: str) -> Dict[str, Any]:
     except Exception as e:
         return {"error": f"Unable to open image: {e}"}
 
-    labels = ["normal tissue", "suspicious lesion", "malignant tumor", "artifact / poor quality"]
+    return analyze_pil_image(image)
+
 
-    inputs = _clip_processor(text=labels, images=image, return_tensors="pt", padding=True)
-    for k, v in inputs.items():
-        if isinstance(v, torch.Tensor):
-            inputs[k] = v.to(_clip_device)
+def analyze_pil_image(image: Image.Image) -> Dict[str, Any]:
+    """CLIP zero-shot classification of an already decoded RGB image."""
+    labels = IMAGE_LABELS
 
-    with torch.no_grad():
-        outputs = _clip_model(**inputs)
+    with model_registry.use("clip_model") as clip_model, model_registry.use("clip_processor") as clip_processor:
+        inputs = clip_processor(text=labels, images=image, return_tensors="pt", padding=True)
+        for k, v in inputs.items():
+            if isinstance(v, torch.Tensor):
+                inputs[k] = v.to(_clip_device)
+
+        with torch.inference_mode():
+            outputs = clip_model(**inputs)
 
     logits = outputs.logits_per_image
     probs = torch.softmax(logits, dim=1).cpu().numpy()[0]
@@ -79,18 +131,41 @@ def analyze_image(image_path: str) -> Dict[str, Any]:
     }
 
 
-def _call_hf_model(messages: List[Dict[str, str]], model: str = HF_MODEL) -> str:
-    """Wrapper to safely call Hugging Face models via OpenAI API style."""
-    resp = client.chat.completions.create(
-        model=model,
-        messages=messages,
-        temperature=0.2,
-        max_tokens=400,
-    )
-    try:
-        return resp.choices[0].message.content
-    except Exception:
-        return str(resp)
+def _call_hf_model(messages: List[Dict[str, str]], model: str = HF_MODEL, temperature: float = 0.2, **budgets):
+    """
+    Wrapper to safely call Hugging Face models via OpenAI API style.
+    Returns a ModelResponse with <think> reasoning split from the answer.
+    """
+    return complete(client, messages, model=model, temperature=temperature, **budgets)
+
+
+EXPLAIN_SYSTEM_PROMPT = (
+    "You are a specialized medical assistant focused ONLY on breast cancer. Always include:\n"
+    "1) Simple explanation of the image result.\n"
+    "2) Disclaimer: you are not a doctor.\n"
+    "3) Gentle, practical next steps.\n"
+    "Keep it short (2–5 paragraphs max)."
+)
+EXPLAIN_USER_TEMPLATE = "Image analysis result: {result}\n\nExplain this in simple language."
+
+# Explanations keyed by quantized CLIP scores; a new label set or prompt invalidates them.
+explain_cache = (
+    ExplanationCache(IMAGE_LABELS, EXPLAIN_SYSTEM_PROMPT + EXPLAIN_USER_TEMPLATE, HF_MODEL)
+    if EXPLAIN_CACHE_ENABLED else None
+)
+
+
+def generate_explanation(result: Dict[str, Any]):
+    """Raw LLM explanation of a CLIP result (no disclaimer, no cache)."""
+    system = {"role": "system", "content": EXPLAIN_SYSTEM_PROMPT}
+    user = {"role": "user", "content": EXPLAIN_USER_TEMPLATE.format(result=json.dumps(result))}
+    return _call_hf_model([system, user])
+
+
+def _with_disclaimer(content: str) -> str:
+    if "not a doctor" not in content.lower():
+        content += "\n\n**Disclaimer:** I am not a medical professional. Please consult a qualified clinician."
+    return content
 
 
 @tool
@@ -98,47 +173,32 @@ def explain_result(result: Dict[str, Any]) -> Dict[str, str]:
     """
     Use DeepSeek LLM (Hugging Face) to convert the structured result into
     a human-friendly, medically cautious explanation.
-    Returns: {"result": explanation}
+    Scans in an already explained score bucket are answered from explain_cache.
+    Returns: {"result": explanation, "stats": {...}}
     """
-    system = {
-        "role": "system",
-        "content": (
-            "You are a specialized medical assistant focused ONLY on breast cancer. Always include:\n"
-            "1) Simple explanation of the image result.\n"
-            "2) Disclaimer: you are not a doctor.\n"
-            "3) Gentle, practical next steps.\n"
-            "Keep it short (2–5 paragraphs max)."
-        )
-    }
+    if explain_cache is not None:
+        start = time.perf_counter()
+        cached = explain_cache.get(result)
+        if cached is not None:
+            stats = {"cached": True, "bucket": explain_cache.key(result),
+                     "latency_ms": round((time.perf_counter() - start) * 1000, 2)}
+            return {"result": _with_disclaimer(cached), "stats": stats}
 
-    user = {
-        "role": "user",
-        "content": f"Image analysis result: {json.dumps(result)}\n\nExplain this in simple language."
-    }
-
-    resp = client.chat.completions.create(
-        model=HF_MODEL,
-        messages=[system, user],
-        temperature=0.2,
-        max_tokens=400,
-    )
-
-    try:
-        content = resp.choices[0].message.content
-    except Exception:
-        content = str(resp)
-
-    if "not a doctor" not in content.lower():
-        content += "\n\n**Disclaimer:** I am not a medical professional. Please consult a qualified clinician."
+    resp = generate_explanation(result)
+    # Truncated answers are served once but never cached.
+    if explain_cache is not None and not resp.truncated["answer"]:
+        explain_cache.put(result, resp.answer)
 
-    return {"result": content}   # ✅ dict output
+    return {"result": _with_disclaimer(resp.answer), "stats": resp.stats()}   # ✅ dict output
 
 
 @tool
-def general_chat(user_text: str) -> Dict[str, str]:
+def general_chat(user_text: str, history: Optional[List[Dict[str, str]]] = None) -> Dict[str, str]:
     """
     Use DeepSeek to handle general text-based questions.
-    Returns: {"result": reply}
+    Simple chat turns go to the non-reasoning CHAT_MODEL.
+    history: recalled earlier turns as chat messages (see conversation_memory).
+    Returns: {"result": reply, "stats": {...}}
     """
     system = {
         "role": "system",
@@ -149,28 +209,35 @@ def general_chat(user_text: str) -> Dict[str, str]:
     }
     user = {"role": "user", "content": user_text}
 
-    resp = client.chat.completions.create(
-        model=HF_MODEL,
-        messages=[system, user],
-        temperature=0.5,
-        max_tokens=400,
-    )
+    resp = _call_hf_model([system, *(history or []), user], model=CHAT_MODEL, temperature=0.5, reasoning_budget=0)
 
-    try:
-        content = resp.choices[0].message.content
-    except Exception:
-        content = str(resp)
+    return {"result": resp.answer, "stats": resp.stats()}   # ✅ standardized dict return
+
+def retrieve_context(question: str) -> Tuple[List[Any], Dict[str, Any]]:
+    """
+    Retrieve the top chunks for a question (cached) and compress each one to
+    the sentences relevant to the question.
+    Returns: (documents, retrieval stats)
+    """
+    return _retriever.retrieve(question)
 
-    return {"result": content}   # ✅ standardized dict return
 
-@tool
-def rag_query(question: str) -> Dict[str, Any]:
+def _page_label(metadata: Dict[str, Any]) -> str:
+    """'8577.00.pdf, p. 3–4' for chunks that carry page metadata."""
+    if "page_start" not in metadata:
+        return ""
+    start, end = metadata["page_start"], metadata.get("page_end", metadata["page_start"])
+    pages = f"p. {start}" if start == end else f"pp. {start}–{end}"
+    return f"{metadata.get('source', '')}, {pages}".lstrip(", ")
+
+
+def answer_from_documents(question: str, docs: List[Any],
+                          history: Optional[List[Dict[str, str]]] = None) -> Dict[str, Any]:
     """
-    Retrieve and generate an answer from ingested PDFs.
+    Generate an answer from retrieved documents.
     Adds clickable inline citations like [1](https://...) and a reference section.
+    history: recalled earlier turns as chat messages (see conversation_memory).
     """
-    docs = _retriever.get_relevant_documents(question)
-
     if not docs:
         return {"result": "⚠️ No relevant documents found."}
 
@@ -184,7 +251,7 @@ def rag_query(question: str) -> Dict[str, Any]:
             citation = f"[{i}]({links[0]})"
         else:
             citation = f"[{i}]"
-        numbered_refs.append((i, links))
+        numbered_refs.append((i, links, _page_label(doc.metadata)))
         context_parts.append(f"{doc.page_content.strip()} {citation}")
 
     context = "\n\n".join(context_parts)
@@ -202,24 +269,28 @@ def rag_query(question: str) -> Dict[str, Any]:
         "content": f"Question: {question}\n\nContext:\n{context}"
     }
 
-    resp = client.chat.completions.create(
-        model=HF_MODEL,
-        messages=[system, user],
-        temperature=0.2,
-        max_tokens=500,
-    )
-
-    try:
-        answer = resp.choices[0].message.content
-    except Exception:
-        answer = str(resp)
+    resp = _call_hf_model([system, *(history or []), user], answer_budget=500)
+    answer = resp.answer
 
     # Build reference section with clickable links
     refs_text = "\n".join(
-        f"[{i}]: {', '.join(f'[{link}]({link})' for link in links) if links else 'No link available'}"
-        for i, links in numbered_refs
+        f"[{i}]: {page + ' ' if page else ''}"
+        f"{', '.join(f'[{link}]({link})' for link in links) if links else 'No link available'}"
+        for i, links, page in numbered_refs
     )
 
     final_answer = f"{answer}\n\n---\n**References:**\n{refs_text}"
 
-    return {"result": final_answer}
\ No newline at end of file
+    return {"result": final_answer, "stats": resp.stats()}
+
+
+@tool
+def rag_query(question: str) -> Dict[str, Any]:
+    """
+    Retrieve and generate an answer from ingested PDFs.
+    Adds clickable inline citations like [1](https://...) and a reference section.
+    """
+    docs, retrieval_stats = retrieve_context(question)
+    reply = answer_from_documents(question, docs)
+    reply["stats"] = dict(reply.get("stats", {}), **retrieval_stats)
+    return reply
\ No newline at end of file
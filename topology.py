@@ -0,0 +1,104 @@
+# topology.py
+"""
+CPU thread / worker topology.
+
+Every gunicorn worker loads PyTorch (CLIP) and sentence-transformers
+(MiniLM). By default each one sizes its intra-op pool to the whole machine,
+so N workers run N x cores threads and fight over the CPUs. This module
+gives every worker an explicit thread budget and, optionally, its own core
+set. configure_process() must run before torch/numpy are imported;
+configure_torch() after.
+
+Environment:
+    WEB_CONCURRENCY   worker processes (default 1)
+    TORCH_THREADS     intra-op threads per worker (default: cores // workers)
+    TORCH_INTEROP_THREADS  inter-op threads per worker (default 1)
+    PIN_WORKERS       1 = pin each worker to its own core set (Linux only)
+"""
+import os
+from typing import Dict, List, Optional
+
+THREAD_ENV_VARS = (
+    "OMP_NUM_THREADS",
+    "MKL_NUM_THREADS",
+    "OPENBLAS_NUM_THREADS",
+    "NUMEXPR_NUM_THREADS",
+    "VECLIB_MAXIMUM_THREADS",
+)
+
+
+def available_cpus() -> List[int]:
+    """CPUs this process may run on (respects cgroup/taskset limits)."""
+    if hasattr(os, "sched_getaffinity"):
+        return sorted(os.sched_getaffinity(0))
+    return list(range(os.cpu_count() or 1))
+
+
+def workers_from_env() -> int:
+    return max(1, int(os.getenv("WEB_CONCURRENCY", "1")))
+
+
+def threads_per_worker(workers: Optional[int] = None, cpus: Optional[int] = None) -> int:
+    if os.getenv("TORCH_THREADS"):
+        return max(1, int(os.environ["TORCH_THREADS"]))
+    workers = workers or workers_from_env()
+    cpus = cpus or len(available_cpus())
+    return max(1, cpus // workers)
+
+
+def core_set(worker_index: int, workers: int, cpus: List[int]) -> List[int]:
+    """Contiguous slice of cpus for worker_index (wraps when workers > cpus)."""
+    if workers >= len(cpus):
+        return [cpus[worker_index % len(cpus)]]
+    per = len(cpus) // workers
+    start = (worker_index % workers) * per
+    return cpus[start:start + per]
+
+
+def thread_env(threads: int) -> Dict[str, str]:
+    env = {name: str(threads) for name in THREAD_ENV_VARS}
+    # HF tokenizers spawn their own pool; inside a busy worker it only adds contention.
+    env["TOKENIZERS_PARALLELISM"] = "false"
+    return env
+
+
+def configure_process(threads: Optional[int] = None, worker_index: Optional[int] = None,
+                      workers: Optional[int] = None, pin: Optional[bool] = None,
+                      override: bool = False) -> Dict[str, object]:
+    """
+    Set BLAS/OpenMP/tokenizer thread env vars and optionally pin the process.
+    Without override, values already in the environment win (so an outer
+    launcher such as gunicorn's post_fork hook stays in charge).
+    """
+    workers = workers or workers_from_env()
+    cpus = available_cpus()
+    threads = threads or threads_per_worker(workers, len(cpus))
+    for name, value in thread_env(threads).items():
+        if override:
+            os.environ[name] = value
+        else:
+            os.environ.setdefault(name, value)
+
+    pinned = None
+    pin = os.getenv("PIN_WORKERS", "0") == "1" if pin is None else pin
+    if pin and worker_index is not None and hasattr(os, "sched_setaffinity"):
+        pinned = core_set(worker_index, workers, cpus)
+        os.sched_setaffinity(0, pinned)
+    return {"threads": threads, "workers": workers, "cpus": pinned or cpus}
+
+
+def configure_torch(torch=None, threads: Optional[int] = None):
+    """Apply the thread budget to an imported torch module."""
+    if torch is None:
+        import torch
+    threads = threads or int(os.getenv("OMP_NUM_THREADS") or threads_per_worker())
+    if os.getenv("PREFORK_LOADING") == "1":
+        # Pre-fork master (see prefork.py): stay single-threaded until forked.
+        threads = 1
+    torch.set_num_threads(threads)
+    try:
+        torch.set_num_interop_threads(int(os.getenv("TORCH_INTEROP_THREADS", "1")))
+    except RuntimeError:
+        # Only allowed before the first parallel op; keep whatever is set.
+        pass
+    return threads
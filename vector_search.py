@@ -0,0 +1,297 @@
+# vector_search.py
+import os
+import json
+import math
+import time
+from concurrent.futures import ThreadPoolExecutor
+from typing import Any, Dict, List, Optional
+
+import numpy as np
+
+# -----------------------------
+# 🔹 Config
+# -----------------------------
+SEARCH_THRESHOLD = float(os.getenv("SEARCH_THRESHOLD", "0.7"))
+SEARCH_LIMIT = int(os.getenv("SEARCH_LIMIT", "5"))
+SEARCH_MAX_LIMIT = int(os.getenv("SEARCH_MAX_LIMIT", "50"))
+SEARCH_MAX_BATCH = int(os.getenv("SEARCH_MAX_BATCH", "32"))
+SEARCH_EF = int(os.getenv("SEARCH_EF", "40"))
+SEARCH_WORKERS = int(os.getenv("SEARCH_WORKERS", "4"))
+
+# See sql/001_embeddings_ann_index.sql
+MATCH_FUNCTION = "match_embeddings_filtered"
+# Pre-migration function (query_embedding, match_threshold, match_count): it has
+# no filter or offset, so pages are cut client-side from a longer result.
+LEGACY_MATCH_FUNCTION = "match_embeddings"
+# Rows fetched per requested row when the legacy function needs a client-side filter.
+SEARCH_LEGACY_OVERFETCH = int(os.getenv("SEARCH_LEGACY_OVERFETCH", "4"))
+# PostgREST "function not in schema cache" / Postgres undefined_function.
+_MISSING_FUNCTION_CODES = {"PGRST202", "42883"}
+
+
+def _missing_function(error: Exception) -> bool:
+    code = getattr(error, "code", None) or getattr(error, "sqlstate", None)
+    return code in _MISSING_FUNCTION_CODES
+
+
+def _use_legacy(backend):
+    if not backend.legacy:
+        backend.legacy = True
+        print(f"⚠️ {MATCH_FUNCTION} not found, falling back to {LEGACY_MATCH_FUNCTION} "
+              "(apply sql/001_embeddings_ann_index.sql for server-side filters and paging)")
+
+
+def _legacy_count(limit: int, offset: int, metadata_filter: Dict[str, Any]) -> int:
+    return (offset + limit) * (SEARCH_LEGACY_OVERFETCH if metadata_filter else 1)
+
+
+def _legacy_page(rows: List[Dict[str, Any]], limit: int, offset: int,
+                 metadata_filter: Dict[str, Any]) -> List[Dict[str, Any]]:
+    hits = [r for r in rows if _contains(r.get("metadata") or {}, metadata_filter)]
+    return hits[offset:offset + limit]
+
+
+class SupabaseSearchBackend:
+    """
+    Calls the match_embeddings_filtered RPC through the Supabase client, or
+    the legacy match_embeddings RPC when the migration has not been applied.
+    """
+
+    name = "supabase"
+
+    def __init__(self, supabase):
+        self.supabase = supabase
+        self.legacy = False
+
+    def search(self, embedding: List[float], threshold: float, limit: int, offset: int,
+               metadata_filter: Dict[str, Any], ef_search: int) -> List[Dict[str, Any]]:
+        if not self.legacy:
+            try:
+                res = self.supabase.rpc(MATCH_FUNCTION, {
+                    "query_embedding": embedding,
+                    "match_threshold": threshold,
+                    "match_count": limit,
+                    "match_offset": offset,
+                    "filter": metadata_filter,
+                    "ef_search": ef_search,
+                }).execute()
+                return res.data or []
+            except Exception as e:
+                if not _missing_function(e):
+                    raise
+                _use_legacy(self)
+        res = self.supabase.rpc(LEGACY_MATCH_FUNCTION, {
+            "query_embedding": embedding,
+            "match_threshold": threshold,
+            "match_count": _legacy_count(limit, offset, metadata_filter),
+        }).execute()
+        return _legacy_page(res.data or [], limit, offset, metadata_filter)
+
+
+class PostgresSearchBackend:
+    """
+    Direct SQL against Postgres + pgvector (e.g. a local container):
+        docker run -e POSTGRES_PASSWORD=pg -p 5432:5432 pgvector/pgvector:pg16
+        DATABASE_URL=postgresql://postgres:pg@localhost:5432/postgres
+    Requires psycopg (pip install "psycopg[binary]"). Falls back to the
+    legacy match_embeddings function like the Supabase backend.
+    """
+
+    name = "postgres"
+
+    def __init__(self, dsn: str):
+        try:
+            import psycopg
+        except ImportError as e:
+            raise RuntimeError("❌ PostgresSearchBackend needs psycopg: pip install 'psycopg[binary]'") from e
+        self._psycopg = psycopg
+        self.dsn = dsn
+        self.legacy = False
+
+    def _query(self, sql: str, params: tuple) -> List[Dict[str, Any]]:
+        with self._psycopg.connect(self.dsn) as conn, conn.cursor() as cur:
+            cur.execute(sql, params)
+            return [
+                {"id": r[0], "content": r[1], "metadata": r[2], "similarity": float(r[3])}
+                for r in cur.fetchall()
+            ]
+
+    def search(self, embedding: List[float], threshold: float, limit: int, offset: int,
+               metadata_filter: Dict[str, Any], ef_search: int) -> List[Dict[str, Any]]:
+        vec = "[" + ",".join(f"{x:.7g}" for x in embedding) + "]"
+        if not self.legacy:
+            try:
+                return self._query(
+                    f"select id, content, metadata, similarity from {MATCH_FUNCTION}"
+                    "(%s::vector, %s, %s, %s, %s::jsonb, %s)",
+                    (vec, threshold, limit, offset, json.dumps(metadata_filter), ef_search),
+                )
+            except self._psycopg.errors.UndefinedFunction:
+                _use_legacy(self)
+        rows = self._query(
+            f"select id, content, metadata, similarity from {LEGACY_MATCH_FUNCTION}(%s::vector, %s, %s)",
+            (vec, threshold, _legacy_count(limit, offset, metadata_filter)),
+        )
+        return _legacy_page(rows, limit, offset, metadata_filter)
+
+
+class InMemorySearchBackend:
+    """
+    Exact cosine search over rows held in process. Same semantics as the SQL
+    function (metadata containment, threshold, ordering, offset), for tests
+    and for running without a database.
+    """
+
+    name = "memory"
+
+    def __init__(self, rows: Optional[List[Dict[str, Any]]] = None):
+        self.rows: List[Dict[str, Any]] = []
+        self._matrix = np.zeros((0, 0), dtype=np.float32)
+        if rows:
+            self.add(rows)
+
+    @classmethod
+    def from_faiss(cls, vectordb) -> "InMemorySearchBackend":
+        """Load rows and vectors from the local FAISS store (flat index)."""
+        index = vectordb.index
+        matrix = index.reconstruct_n(0, index.ntotal)
+        rows = []
+        for row, doc_id in sorted(vectordb.index_to_docstore_id.items()):
+            doc = vectordb.docstore.search(doc_id)
+            rows.append({"id": doc_id, "content": doc.page_content,
+                         "metadata": dict(doc.metadata), "embedding": matrix[row]})
+        return cls(rows)
+
+    def add(self, rows: List[Dict[str, Any]]):
+        start_id = len(self.rows) + 1
+        for i, row in enumerate(rows):
+            self.rows.append({
+                "id": row.get("id", start_id + i),
+                "content": row["content"],
+                "metadata": row.get("metadata", {}),
+            })
+        vecs = _unit(np.asarray([r["embedding"] for r in rows], dtype=np.float32))
+        self._matrix = vecs if self._matrix.size == 0 else np.vstack([self._matrix, vecs])
+
+    def search(self, embedding: List[float], threshold: float, limit: int, offset: int,
+               metadata_filter: Dict[str, Any], ef_search: int) -> List[Dict[str, Any]]:
+        if not self.rows:
+            return []
+        sims = self._matrix @ _unit(np.asarray(embedding, dtype=np.float32))
+        hits = []
+        for i in np.argsort(sims)[::-1]:
+            if sims[i] <= threshold:
+                break
+            if _contains(self.rows[i]["metadata"], metadata_filter):
+                hits.append(dict(self.rows[i], similarity=float(sims[i])))
+        return hits[offset:offset + limit]
+
+
+def get_backend(supabase=None, vectordb=None):
+    """
+    Pick a backend from VECTOR_SEARCH_BACKEND (supabase | postgres | memory).
+    The memory backend is filled from the local FAISS store when one is given.
+    """
+    kind = os.getenv("VECTOR_SEARCH_BACKEND", "supabase" if supabase is not None else "memory")
+    if kind == "postgres":
+        dsn = os.getenv("DATABASE_URL")
+        if not dsn:
+            raise ValueError("❌ VECTOR_SEARCH_BACKEND=postgres requires DATABASE_URL.")
+        return PostgresSearchBackend(dsn)
+    if kind == "memory":
+        return InMemorySearchBackend.from_faiss(vectordb) if vectordb is not None else InMemorySearchBackend()
+    return SupabaseSearchBackend(supabase)
+
+
+def _number(data: Dict[str, Any], name: str, default, cast):
+    if name not in data:
+        return default
+    value = data[name]
+    try:
+        if isinstance(value, bool):
+            raise TypeError
+        number = cast(value)
+    except (TypeError, ValueError, OverflowError):
+        raise ValueError(f"'{name}' must be a number.")
+    if cast is float and not math.isfinite(number):
+        raise ValueError(f"'{name}' must be a finite number.")
+    if cast is int and number != float(value):
+        raise ValueError(f"'{name}' must be an integer.")
+    return number
+
+
+def search_params(data: Dict[str, Any]) -> Dict[str, Any]:
+    """
+    threshold / limit / offset / ef_search from a request body, defaults for
+    absent keys. ValueError for null, non-numeric or non-finite values.
+    """
+    return {
+        "threshold": _number(data, "threshold", SEARCH_THRESHOLD, float),
+        "limit": _number(data, "limit", SEARCH_LIMIT, int),
+        "offset": _number(data, "offset", 0, int),
+        "ef_search": _number(data, "ef_search", SEARCH_EF, int),
+    }
+
+
+def search_batch(
+    backend,
+    embedder,
+    queries: List[str],
+    metadata_filter: Optional[Dict[str, Any]] = None,
+    threshold: float = SEARCH_THRESHOLD,
+    limit: int = SEARCH_LIMIT,
+    offset: int = 0,
+    ef_search: int = SEARCH_EF,
+) -> List[Dict[str, Any]]:
+    """
+    Embed all queries in one batch, then run the searches concurrently.
+    Returns one entry per query with its results, the next page offset
+    (None when exhausted) and per-query timing in milliseconds.
+    """
+    if not queries:
+        return []
+    if len(queries) > SEARCH_MAX_BATCH:
+        raise ValueError(f"Too many queries (max {SEARCH_MAX_BATCH}).")
+    limit = max(1, min(int(limit), SEARCH_MAX_LIMIT))
+    offset = max(0, int(offset))
+    metadata_filter = metadata_filter or {}
+
+    embed_start = time.perf_counter()
+    vectors = embedder.embed_documents(queries) if len(queries) > 1 else [embedder.embed_query(queries[0])]
+    embed_ms = (time.perf_counter() - embed_start) * 1000 / len(queries)
+
+    def run(args):
+        query, vector = args
+        start = time.perf_counter()
+        results = backend.search(vector, threshold, limit, offset, metadata_filter, ef_search)
+        return {
+            "query": query,
+            "results": results,
+            "next_offset": offset + limit if len(results) == limit else None,
+            "timing_ms": {"embed": embed_ms, "search": (time.perf_counter() - start) * 1000},
+        }
+
+    if len(queries) == 1:
+        return [run((queries[0], vectors[0]))]
+    with ThreadPoolExecutor(max_workers=min(SEARCH_WORKERS, len(queries))) as pool:
+        return list(pool.map(run, zip(queries, vectors)))
+
+
+def _contains(metadata: Dict[str, Any], expected_subset: Dict[str, Any]) -> bool:
+    """Python equivalent of jsonb `metadata @> filter` for flat and list values."""
+    for key, expected in expected_subset.items():
+        actual = metadata.get(key)
+        if isinstance(expected, dict):
+            if not isinstance(actual, dict) or not _contains(actual, expected):
+                return False
+        elif isinstance(expected, list):
+            if not isinstance(actual, list) or not all(v in actual for v in expected):
+                return False
+        elif actual != expected:
+            return False
+    return True
+
+
+def _unit(vecs: np.ndarray) -> np.ndarray:
+    norms = np.linalg.norm(vecs, axis=-1, keepdims=True)
+    return vecs / np.maximum(norms, 1e-12)
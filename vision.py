@@ -0,0 +1,73 @@
+# vision.py
+import os
+from typing import Any, Dict, List
+
+import numpy as np
+
+# --- CLIP model (vision) ---
+CLIP_HUB_ID = "openai/clip-vit-base-patch32"
+# A local directory baked by prepare_models.py overrides the Hub id.
+CLIP_MODEL_ID = os.getenv("CLIP_MODEL_ID", CLIP_HUB_ID)
+
+IMAGE_LABELS = ["normal tissue", "suspicious lesion", "malignant tumor", "artifact / poor quality"]
+
+
+def load_clip(device: str = None):
+    """Load the CLIP model and processor (model in eval mode on `device`)."""
+    import torch
+    from transformers import CLIPModel, CLIPProcessor
+
+    device = device or ("cuda" if torch.cuda.is_available() else "cpu")
+    model = CLIPModel.from_pretrained(CLIP_MODEL_ID).to(device).eval()
+    # ✅ Do NOT set use_fast for CLIPProcessor (only applies to text tokenizers)
+    processor = CLIPProcessor.from_pretrained(CLIP_MODEL_ID)
+    return model, processor, device
+
+
+def preprocess_image(processor, path: str) -> np.ndarray:
+    """Decode one image and return CLIP pixel values (3, H, W) as float32."""
+    from PIL import Image
+
+    with Image.open(path) as img:
+        image = img.convert("RGB")
+    return processor(images=image, return_tensors="np")["pixel_values"][0].astype(np.float32)
+
+
+class ClipClassifier:
+    """
+    Zero-shot CLIP classifier for batches of images. The label text features
+    are computed once, so each batch only runs the image tower.
+    """
+
+    def __init__(self, model, processor, device: str, labels: List[str] = IMAGE_LABELS):
+        import torch
+
+        self.torch = torch
+        self.model = model
+        self.processor = processor
+        self.device = device
+        self.labels = list(labels)
+        with torch.inference_mode():
+            text_inputs = processor(text=self.labels, return_tensors="pt", padding=True).to(device)
+            text = model.get_text_features(**text_inputs)
+            self.text_features = text / text.norm(dim=-1, keepdim=True)
+            self.logit_scale = model.logit_scale.exp()
+
+    def classify(self, pixel_values: np.ndarray) -> List[Dict[str, Any]]:
+        """pixel_values: (N, 3, H, W). Returns one analyze_image-style dict per image."""
+        torch = self.torch
+        with torch.inference_mode():
+            pixels = torch.from_numpy(pixel_values).to(self.device)
+            image = self.model.get_image_features(pixel_values=pixels)
+            image = image / image.norm(dim=-1, keepdim=True)
+            probs = torch.softmax(self.logit_scale * image @ self.text_features.T, dim=1).cpu().numpy()
+        return [to_result(self.labels, p) for p in probs]
+
+
+def to_result(labels: List[str], probs: np.ndarray) -> Dict[str, Any]:
+    best_idx = int(probs.argmax())
+    return {
+        "prediction": labels[best_idx],
+        "confidence": float(probs[best_idx]),
+        "scores": {labels[i]: float(probs[i]) for i in range(len(labels))}
+    }